@@ -10,7 +10,17 @@ import sys
 import click
 
 from kf_lib_data_ingest.app import settings
-from kf_lib_data_ingest.config import DEFAULT_LOG_LEVEL, DEFAULT_TARGET_URL
+from kf_lib_data_ingest.config import (
+    DEFAULT_ASYNC_LOAD_CONCURRENCY,
+    DEFAULT_LOAD_WORKERS,
+    DEFAULT_LOG_LEVEL,
+    DEFAULT_STAGE_CACHE_FORMAT,
+    DEFAULT_SUBMIT_BATCH_SIZE,
+    DEFAULT_TARGET_URL,
+    DEFAULT_UID_CACHE_SYNCHRONOUS,
+    STAGE_CACHE_FORMATS,
+    UID_CACHE_SYNCHRONOUS_MODES,
+)
 from kf_lib_data_ingest.common.stage import (
     BASIC_VALIDATION,
     ADVANCED_VALIDATION,
@@ -104,6 +114,141 @@ def common_args_options(func):
         ),
     )(func)
 
+    # Size of the multithreaded loading pool
+    func = click.option(
+        "--load_workers",
+        default=DEFAULT_LOAD_WORKERS,
+        show_default=True,
+        type=click.IntRange(min=1),
+        help=(
+            "Number of threads that send requests to the target service when"
+            " loading with --use_async."
+        ),
+    )(func)
+
+    # Coroutine loading limit
+    func = click.option(
+        "--async_concurrency",
+        default=DEFAULT_ASYNC_LOAD_CONCURRENCY,
+        show_default=True,
+        type=click.IntRange(min=1),
+        help=(
+            "Maximum number of entities in flight at once when loading with"
+            " --use_async into a target service whose plugin supports"
+            " coroutines (async_submit)."
+        ),
+    )(func)
+
+    # Adaptive loading limit
+    func = click.option(
+        "--adaptive_concurrency",
+        default=False,
+        is_flag=True,
+        help=(
+            "Send fewer entities at once when the target service slows down"
+            " or reports overload (429/5xx), and more when it recovers, up to"
+            " --load_workers or --async_concurrency. Also pauses loading when"
+            " the target service responds with Retry-After."
+        ),
+    )(func)
+
+    # Batched submission
+    func = click.option(
+        "--submit_batch_size",
+        default=DEFAULT_SUBMIT_BATCH_SIZE,
+        show_default=True,
+        type=click.IntRange(min=1),
+        help=(
+            "Maximum number of entities sent together to target services"
+            " whose plugin supports batches (submit_batch)."
+        ),
+    )(func)
+
+    # Identifier cache durability
+    func = click.option(
+        "--uid_cache_synchronous",
+        default=DEFAULT_UID_CACHE_SYNCHRONOUS,
+        show_default=True,
+        type=click.Choice(UID_CACHE_SYNCHRONOUS_MODES, case_sensitive=False),
+        help=(
+            "SQLite synchronous setting for the target identifier cache."
+            " OFF is fastest but can lose cached IDs in a power failure."
+        ),
+    )(func)
+
+    # Skipping unchanged entities
+    func = click.option(
+        "--force_update",
+        default=False,
+        is_flag=True,
+        help=(
+            "Send every entity to the target service, even ones whose content"
+            " hasn't changed since it was last sent to that target. Use this"
+            " if entities may have been changed on the target service by"
+            " something else."
+        ),
+    )(func)
+
+    # Sent messages file
+    func = click.option(
+        "--compress_sent_messages",
+        default=False,
+        is_flag=True,
+        help=(
+            "Gzip the JSON Lines file of messages sent to the target service"
+            " (LoadStage/SentMessages_<target>.jsonl.gz)."
+        ),
+    )(func)
+
+    # Multiprocess extraction
+    func = click.option(
+        "--extract_workers",
+        default=1,
+        show_default=True,
+        type=click.IntRange(min=1),
+        help=(
+            "Number of worker processes used to run the extract configs in"
+            " parallel. The default of 1 runs them one at a time."
+        ),
+    )(func)
+
+    # Bypass the download cache
+    func = click.option(
+        "--no_download_cache",
+        default=False,
+        is_flag=True,
+        help=(
+            "Always download source data files instead of reusing unchanged"
+            " copies from the local download cache."
+        ),
+    )(func)
+
+    # Only extract what changed
+    func = click.option(
+        "--incremental_extract",
+        default=False,
+        is_flag=True,
+        help=(
+            "Reuse the previous output of extract configs whose config file,"
+            " source data file, and read parameters haven't changed, and only"
+            " run the extract configs that have."
+        ),
+    )(func)
+
+    # Format of the extract and transform stage output files
+    func = click.option(
+        "--stage_cache_format",
+        default=DEFAULT_STAGE_CACHE_FORMAT,
+        show_default=True,
+        type=click.Choice(STAGE_CACHE_FORMATS, case_sensitive=False),
+        help=(
+            "File format of the extract and transform stage outputs. tsv is"
+            " human-readable, while parquet and feather keep the data types"
+            " and are much faster to read back when resuming from a later"
+            " stage."
+        ),
+    )(func)
+
     # Stages
     func = click.option(
         "--stages",
@@ -210,6 +355,17 @@ def ingest(
     target_url,
     stages_to_run_str,
     use_async,
+    load_workers,
+    async_concurrency,
+    adaptive_concurrency,
+    submit_batch_size,
+    uid_cache_synchronous,
+    compress_sent_messages,
+    force_update,
+    extract_workers,
+    no_download_cache,
+    stage_cache_format,
+    incremental_extract,
     dry_run,
     resume_from,
     warehouse,
@@ -245,6 +401,8 @@ def ingest(
     if kwargs.pop("no_validate"):
         kwargs["validation_mode"] = None
 
+    kwargs["use_download_cache"] = not kwargs.pop("no_download_cache")
+
     kwargs.pop("app_settings_filepath", None)
     kwargs["auth_configs"] = app_settings.AUTH_CONFIGS
     kwargs["db_url_env_key"] = app_settings.SECRETS.WAREHOUSE_DB_URL
@@ -273,6 +431,17 @@ def test(
     target_url,
     stages_to_run_str,
     use_async,
+    load_workers,
+    async_concurrency,
+    adaptive_concurrency,
+    submit_batch_size,
+    uid_cache_synchronous,
+    compress_sent_messages,
+    force_update,
+    extract_workers,
+    no_download_cache,
+    stage_cache_format,
+    incremental_extract,
     resume_from,
     no_validate,
     validation_mode,
@@ -0,0 +1,177 @@
+"""
+DownloadCache is a persistent, content-addressed store of remote file contents
+that lets the FileRetriever skip re-downloading files that have not changed
+since the last time they were fetched.
+
+Each cached URL is recorded in an index along with the validators that the
+remote server reported for it (S3 ETag, HTTP ETag and/or Last-Modified). The
+file contents are stored once per unique sha256 digest, so URLs pointing at
+identical contents share storage.
+
+The index is rewritten atomically, so concurrent ingest processes sharing a
+cache directory can at worst lose each other's index updates, which only costs
+a future re-download.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from threading import Lock
+
+from kf_lib_data_ingest.common.io import read_json, write_json
+from kf_lib_data_ingest.config import (
+    DEFAULT_DOWNLOAD_CACHE_DIR,
+    DEFAULT_DOWNLOAD_CACHE_MAX_SIZE,
+)
+
+INDEX_FILENAME = "index.json"
+BLOB_DIRNAME = "blobs"
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadCache(object):
+    def __init__(
+        self,
+        cache_dir=DEFAULT_DOWNLOAD_CACHE_DIR,
+        max_size=DEFAULT_DOWNLOAD_CACHE_MAX_SIZE,
+    ):
+        """
+        :param cache_dir: directory where cached files and the index are kept
+        :type cache_dir: str
+        :param max_size: maximum total size in bytes of the cached files. The
+            least recently used files are evicted to stay under it.
+        :type max_size: int
+        """
+        self.logger = logging.getLogger(type(self).__name__)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.blob_dir = os.path.join(cache_dir, BLOB_DIRNAME)
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = Lock()
+
+    def _read_index(self):
+        try:
+            return read_json(self.index_path, default={}, use_jsonpickle=False)
+        except ValueError:
+            self.logger.warning(
+                f"Download cache index {self.index_path} is corrupt. "
+                "Starting a new one."
+            )
+            return {}
+
+    def _write_index(self, index):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        write_json(index, tmp_path, use_jsonpickle=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest)
+
+    def lookup(self, url):
+        """
+        Get the cache entry for a URL if its contents are still on disk.
+
+        :param url: full file URL
+        :type url: str
+        :return: dict with "validators", "digest", "size", and
+            "original_name" keys, or None if the URL is not cached
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self._read_index().get(url)
+        if entry and os.path.isfile(self._blob_path(entry["digest"])):
+            return entry
+        return None
+
+    def load(self, url, entry, dest_obj):
+        """
+        Copy the cached contents for a URL into dest_obj and mark the entry as
+        recently used.
+
+        :param url: full file URL
+        :type url: str
+        :param entry: cache entry returned by lookup
+        :type entry: dict
+        :param dest_obj: receives the cached file contents
+        :type dest_obj: file-like object
+        """
+        with open(self._blob_path(entry["digest"]), "rb") as blob:
+            dest_obj.seek(0)
+            dest_obj.truncate()
+            shutil.copyfileobj(blob, dest_obj, CHUNK_SIZE)
+        dest_obj.seek(0)
+        with self._lock:
+            index = self._read_index()
+            if url in index:
+                index[url]["last_used"] = time.time()
+                self._write_index(index)
+
+    def store(self, url, src_obj, validators, original_name):
+        """
+        Add the downloaded contents of a URL to the cache.
+
+        :param url: full file URL
+        :type url: str
+        :param src_obj: contains the downloaded file contents
+        :type src_obj: file-like object
+        :param validators: values that identify this version of the remote
+            file (e.g. {"ETag": "..."})
+        :type validators: dict
+        :param original_name: original name of the remote file
+        :type original_name: str
+        """
+        digest = hashlib.sha256()
+        src_obj.seek(0)
+        for chunk in iter(lambda: src_obj.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        size = src_obj.tell()
+
+        blob_path = self._blob_path(digest)
+        if not os.path.isfile(blob_path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp:
+                src_obj.seek(0)
+                shutil.copyfileobj(src_obj, tmp, CHUNK_SIZE)
+            os.replace(tmp_path, blob_path)
+        src_obj.seek(0)
+
+        with self._lock:
+            index = self._read_index()
+            index[url] = {
+                "validators": validators,
+                "digest": digest,
+                "size": size,
+                "original_name": original_name,
+                "last_used": time.time(),
+            }
+            self._evict(index)
+            self._write_index(index)
+
+        self.logger.info(f"Stored {url} in download cache as {digest}")
+
+    def _evict(self, index):
+        """
+        Remove the least recently used entries until the total size of the
+        cached files fits within max_size.
+        """
+        blob_sizes = {e["digest"]: e["size"] for e in index.values()}
+        total = sum(blob_sizes.values())
+        by_age = sorted(index.items(), key=lambda item: item[1]["last_used"])
+        for url, entry in by_age:
+            if total <= self.max_size:
+                break
+            del index[url]
+            digest = entry["digest"]
+            if not any(e["digest"] == digest for e in index.values()):
+                total -= blob_sizes[digest]
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+            self.logger.info(f"Evicted {url} from download cache")
@@ -15,3 +15,20 @@ class InvalidIngestStageParameters(Exception):
     # TODO
     # Pretty stack straces using Pythons traceback module
     pass
+
+
+class SubmitBatchError(Exception):
+    """
+    Exception raised if the target service rejects entities submitted in a
+    batch
+    """
+
+    def __init__(self, message, failures):
+        """
+        :param message: error message
+        :type message: str
+        :param failures: (entity body, exception) for each rejected entity
+        :type failures: list
+        """
+        super().__init__(message)
+        self.failures = failures
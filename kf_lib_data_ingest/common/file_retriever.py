@@ -3,13 +3,16 @@ FileRetriever is a class for downloading the contents of remote files using
 whatever mechanism is appropriate for the given protocol.
 """
 
+import concurrent.futures
 import logging
 import shutil
 import tempfile
+from threading import Lock
 from urllib.parse import urlencode, urlparse
 
 import boto3
 import botocore
+from boto3.s3.transfer import TransferConfig
 from requests.auth import HTTPBasicAuth
 from urllib3.util import retry
 
@@ -19,6 +22,10 @@ from kf_lib_data_ingest.common.type_safety import (
 )
 from kf_lib_data_ingest.network import oauth2, utils
 
+# Protocols whose contents are worth keeping in a DownloadCache. Local files
+# are cheaper to copy again than to hash and store.
+CACHEABLE_PROTOCOLS = {"s3", "http", "https"}
+
 logging.getLogger("boto3").setLevel(logging.WARNING)
 logging.getLogger("botocore").setLevel(logging.WARNING)
 logging.getLogger("s3transfer").setLevel(logging.WARNING)
@@ -29,6 +36,7 @@ retry.log.setLevel(logging.INFO)
 
 
 PROTOCOL_SEP = "://"
+DEFAULT_PREFETCH_WORKERS = 4
 
 
 def split_protocol(url):
@@ -55,10 +63,77 @@ def split_protocol(url):
     return protocol, path
 
 
+# Per-process S3 clients, keyed by AWS profile name, and the profile that
+# last worked for each bucket. boto3 clients are thread-safe, so they can be
+# shared by every download in the process once they exist.
+_s3_clients = {}
+_s3_bucket_profiles = {}
+_s3_available_profiles = None
+_s3_lock = Lock()
+
+# Download large objects as parallel ranged requests
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024**2,
+    multipart_chunksize=16 * 1024**2,
+    max_concurrency=8,
+)
+
+
+def _s3_client(profile):
+    """
+    Get the shared S3 client for an AWS profile, creating it if needed.
+
+    :param profile: AWS profile name, or None for the default credentials
+    :type profile: str
+    :return: a boto3 S3 client
+    """
+    with _s3_lock:
+        if profile not in _s3_clients:
+            _s3_clients[profile] = boto3.session.Session(
+                profile_name=profile
+            ).client("s3")
+        return _s3_clients[profile]
+
+
+def _s3_profiles_to_try(bucket, auth_config):
+    """
+    List the AWS profiles to try for a bucket, starting with the one that
+    worked for it last time.
+
+    :param bucket: S3 bucket name
+    :type bucket: str
+    :param auth_config: a dict of necessary auth parameters (i.e. aws_profile)
+    If profile not provided, default to all available profiles
+    :type auth_config: dict
+    :return: list of profile names
+    """
+    global _s3_available_profiles
+    if auth_config:
+        aws_profiles = auth_config.get("aws_profile")
+        if (aws_profiles is None) or isinstance(aws_profiles, str):
+            aws_profiles = [aws_profiles]
+        aws_profiles = list(aws_profiles)
+    else:
+        with _s3_lock:
+            if _s3_available_profiles is None:
+                _s3_available_profiles = boto3.Session().available_profiles
+            aws_profiles = _s3_available_profiles + [None]
+
+    if bucket in _s3_bucket_profiles:
+        known = _s3_bucket_profiles[bucket]
+        if known in aws_profiles:
+            aws_profiles.remove(known)
+            aws_profiles.insert(0, known)
+    return aws_profiles
+
+
 def _s3_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
     """
     Get contents of a file from Amazon S3 to a local file-like object.
 
+    S3 clients are reused across calls, and the profile that worked for a
+    bucket is tried first the next time that bucket is accessed.
+
     :param protocol: URL protocol identifier
     :type protocol: str
     :param source_loc: address or path
@@ -73,18 +148,33 @@ def _s3_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
     """
     logger = logger or logging.getLogger(__name__)
 
-    if auth_config:
-        aws_profiles = auth_config.get("aws_profile")
-    else:
-        aws_profiles = boto3.Session().available_profiles + [None]
-
     bucket, key = source_loc.split("/", 1)
 
-    for profile in aws_profiles:
+    # Only look up the ETag when the FileRetriever is using a download cache
+    use_validators = hasattr(dest_obj, "cached_validators")
+
+    for profile in _s3_profiles_to_try(bucket, auth_config):
         try:
             logger.info("S3 download - Trying auth profile '%s'", profile)
-            s3 = boto3.session.Session(profile_name=profile).resource("s3")
-            s3.Object(bucket, key).download_fileobj(dest_obj)
+            s3 = _s3_client(profile)
+            extra_args = None
+            if use_validators:
+                etag = s3.head_object(Bucket=bucket, Key=key)["ETag"]
+                _s3_bucket_profiles[bucket] = profile
+                dest_obj.validators = {"ETag": etag}
+                if etag == dest_obj.cached_validators.get("ETag"):
+                    dest_obj.not_modified = True
+                    return
+                # Make sure that we download the version we just checked
+                extra_args = {"IfMatch": etag}
+            s3.download_fileobj(
+                bucket,
+                key,
+                dest_obj,
+                ExtraArgs=extra_args,
+                Config=S3_TRANSFER_CONFIG,
+            )
+            _s3_bucket_profiles[bucket] = profile
             return
         except (
             # HACK: ClientError is too generic but (I think) all we get for now
@@ -92,7 +182,9 @@ def _s3_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
             botocore.exceptions.ClientError,
             botocore.exceptions.NoCredentialsError,
         ):
-            pass
+            # A failed ranged download may have written part of the file
+            dest_obj.seek(0)
+            dest_obj.truncate()
 
     raise botocore.exceptions.NoCredentialsError()  # never got the file
 
@@ -133,6 +225,14 @@ def _web_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
     logger = logger or logging.getLogger(__name__)
     url = protocol + PROTOCOL_SEP + source_loc
 
+    # Make the request conditional if we have a cached copy of the file
+    cached_validators = getattr(dest_obj, "cached_validators", None) or {}
+    headers = {}
+    if "ETag" in cached_validators:
+        headers["If-None-Match"] = cached_validators["ETag"]
+    if "Last-Modified" in cached_validators:
+        headers["If-Modified-Since"] = cached_validators["Last-Modified"]
+
     # Fetch a protected file using auth scheme and parameters in auth_config
     if auth_config:
         auth_scheme = auth_config["type"]
@@ -142,7 +242,7 @@ def _web_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
             auth = HTTPBasicAuth(
                 auth_config.get("username"), auth_config.get("password")
             )
-            utils.http_get_file(url, dest_obj, auth=auth)
+            utils.http_get_file(url, dest_obj, auth=auth, headers=headers)
 
         # Token auth
         if auth_scheme == "token":
@@ -150,11 +250,15 @@ def _web_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
 
             if auth_config.get("token_location") == "url":
                 utils.http_get_file(
-                    f"{url}?{urlencode({'token': token})}", dest_obj
+                    f"{url}?{urlencode({'token': token})}",
+                    dest_obj,
+                    headers=headers,
                 )
             else:
                 utils.http_get_file(
-                    url, dest_obj, headers={"Authorization": f"Token {token}"}
+                    url,
+                    dest_obj,
+                    headers={**headers, "Authorization": f"Token {token}"},
                 )
 
         # OAuth 2
@@ -168,11 +272,11 @@ def _web_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
                     "client_secret",
                 ]
             }
-            oauth2.get_file(url, dest_obj, **kwargs)
+            oauth2.get_file(url, dest_obj, headers=headers, **kwargs)
 
     # Fetch a file with no auth
     else:
-        utils.http_get_file(url, dest_obj)
+        utils.http_get_file(url, dest_obj, headers=headers)
 
 
 def _file_save(protocol, source_loc, dest_obj, auth_config=None, logger=None):
@@ -232,7 +336,12 @@ class FileRetriever(object):
     static_auth_configs = None
 
     def __init__(
-        self, storage_dir=None, cleanup_at_exit=True, auth_configs=None
+        self,
+        storage_dir=None,
+        cleanup_at_exit=True,
+        auth_configs=None,
+        prefetch_workers=DEFAULT_PREFETCH_WORKERS,
+        download_cache=None,
     ):
         """
         Construct FileRetriever instance
@@ -269,6 +378,12 @@ class FileRetriever(object):
         :param auth_configs: optional dict mapping URL patterns to
         authentication schemes and necessary auth parameters
         :type auth_configs: dict
+        :param prefetch_workers: maximum number of concurrent downloads
+        started by prefetch
+        :type prefetch_workers: int
+        :param download_cache: optional persistent cache used to avoid
+        re-downloading remote files that have not changed
+        :type download_cache: DownloadCache
         """
         self.logger = logging.getLogger(type(self).__name__)
         self.cleanup_at_exit = cleanup_at_exit
@@ -281,11 +396,44 @@ class FileRetriever(object):
             )
             self.storage_dir = self.__tmpdir.name
         self._files = {}
+        self._pending = {}
+        self._pending_lock = Lock()
+        self._prefetch_pool = None
+        self.prefetch_workers = prefetch_workers
+        self.download_cache = download_cache
         self.auth_configs = auth_configs or FileRetriever.static_auth_configs
 
         if self.auth_configs:
             assert_safe_type(self.auth_configs, dict)
 
+    def prefetch(self, urls):
+        """
+        Start downloading the contents of remote files in the background so
+        that later calls to get don't have to wait for them.
+
+        Downloads run in a pool of at most prefetch_workers threads. Each
+        distinct URL is only fetched once. Errors, including unhandled
+        protocols, are not raised here but by the call to get for that URL.
+
+        :param urls: full file URLs
+        :type urls: iterable of str
+        """
+        with self._pending_lock:
+            for url in urls:
+                try:
+                    split_protocol(url)
+                except LookupError:
+                    continue
+                if (url in self._files) or (url in self._pending):
+                    continue
+                if not self._prefetch_pool:
+                    self._prefetch_pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.prefetch_workers
+                    )
+                self._pending[url] = self._prefetch_pool.submit(
+                    self._fetch, url
+                )
+
     def get(self, url, auth_config=None):
         """
         Retrieve the contents of a remote file.
@@ -299,6 +447,52 @@ class FileRetriever(object):
         :raises LookupError: url is not of one of the handled protocols
         :return: a file-like object containing the remote file contents
         """
+        # TODO: Either remove this try wrapper or remove this message.
+        # I think there may be a better way to handle exceptional cleanup. -Avi
+        try:
+            with self._pending_lock:
+                pending = self._pending.pop(url, None)
+            if pending:
+                pending.result()
+            elif url not in self._files:
+                self._fetch(url, auth_config=auth_config)
+            else:
+                split_protocol(url)
+
+            self._files[url].seek(0)
+            return self._files[url]
+        except Exception as e:
+            if self.__tmpdir:
+                # prefetch threads may still be writing into the directory
+                self._stop_prefetching()
+                self.__tmpdir.cleanup()
+            raise e
+
+    def _stop_prefetching(self):
+        """
+        Cancel the prefetches that haven't started and wait for the rest to
+        finish.
+        """
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            pool, self._prefetch_pool = self._prefetch_pool, None
+        for future in pending:
+            future.cancel()
+        if pool:
+            pool.shutdown(wait=True)
+
+    def _fetch(self, url, auth_config=None):
+        """
+        Download the contents of a remote file into a new temp file stored in
+        self._files.
+
+        :param url: full file URL
+        :type url: str
+        :param auth_config: optional dict containing necessary authentication
+         parameters needed to fetch URL
+        :type auth_config: dict
+        """
         self.logger.info("Fetching %s", url)
         protocol, path = split_protocol(url)
 
@@ -308,52 +502,66 @@ class FileRetriever(object):
             FileRetriever._getters[protocol].__name__,
         )
 
-        # TODO: Either remove this try wrapper or remove this message.
-        # I think there may be a better way to handle exceptional cleanup. -Avi
-        try:
-            if url not in self._files:
-                # Temporary file object that optionally deletes itself at the
-                # end of FileRetriever instance scope (if the enclosing folder
-                # isn't already being deleted)
-                self._files[url] = tempfile.NamedTemporaryFile(
-                    dir=self.storage_dir,
-                    delete=self.cleanup_at_exit and not self.__tmpdir,
-                )
+        # Temporary file object that optionally deletes itself at the end of
+        # FileRetriever instance scope (if the enclosing folder isn't already
+        # being deleted)
+        dest_obj = tempfile.NamedTemporaryFile(
+            dir=self.storage_dir,
+            delete=self.cleanup_at_exit and not self.__tmpdir,
+        )
+        self._files[url] = dest_obj
+
+        # Select one auth config based inspection of url
+        if self.auth_configs and not auth_config:
+            auth_config = _select_auth_scheme(url, self.auth_configs)
+
+        # Validate auth_config if it exists
+        if auth_config:
+            self._validate_auth_config(auth_config)
+            self.logger.info(
+                f'Selected `{auth_config["type"]}` authentication to '
+                f"fetch {url}"
+            )
+        elif protocol != "file":
+            self.logger.warning(
+                f"Authentication scheme not found for url {url}"
+            )
 
-                # Select one auth config based inspection of url
-                if self.auth_configs and not auth_config:
-                    auth_config = _select_auth_scheme(url, self.auth_configs)
+        # Tell the getter which version of the file we already have, if any
+        cache_entry = None
+        use_cache = self.download_cache and (protocol in CACHEABLE_PROTOCOLS)
+        if use_cache:
+            cache_entry = self.download_cache.lookup(url)
+            dest_obj.cached_validators = (
+                cache_entry["validators"] if cache_entry else {}
+            )
 
-                # Validate auth_config if it exists
-                if auth_config:
-                    self._validate_auth_config(auth_config)
-                    self.logger.info(
-                        f'Selected `{auth_config["type"]}` authentication to '
-                        f"fetch {url}"
-                    )
-                elif protocol != "file":
-                    self.logger.warning(
-                        f"Authentication scheme not found for url {url}"
-                    )
+        # Fetch the remote data
+        FileRetriever._getters[protocol](
+            protocol,
+            path,
+            dest_obj,
+            logger=self.logger,
+            auth_config=auth_config,
+        )
 
-                # Fetch the remote data
-                FileRetriever._getters[protocol](
-                    protocol,
-                    path,
-                    self._files[url],
-                    logger=self.logger,
-                    auth_config=auth_config,
-                )
-                if not hasattr(self._files[url], "original_name"):
-                    filename = urlparse(url).path.rsplit("/", 1)[-1]
-                    self._files[url].original_name = filename
+        if use_cache and getattr(dest_obj, "not_modified", False):
+            self.logger.info(f"Using cached copy of unchanged {url}")
+            self.download_cache.load(url, cache_entry, dest_obj)
+            dest_obj.original_name = cache_entry["original_name"]
 
-            self._files[url].seek(0)
-            return self._files[url]
-        except Exception as e:
-            if self.__tmpdir:
-                self.__tmpdir.cleanup()
-            raise e
+        if not hasattr(dest_obj, "original_name"):
+            filename = urlparse(url).path.rsplit("/", 1)[-1]
+            dest_obj.original_name = filename
+
+        if (
+            use_cache
+            and getattr(dest_obj, "validators", None)
+            and not getattr(dest_obj, "not_modified", False)
+        ):
+            self.download_cache.store(
+                url, dest_obj, dest_obj.validators, dest_obj.original_name
+            )
 
     def _validate_auth_config(self, auth_config):
         """
@@ -2,6 +2,7 @@
 Contains file readers for file types that benefit from extra help.
 """
 
+import gzip
 import io
 import json
 import os
@@ -112,6 +113,33 @@ def read_json_df(filepath_or_buffer, **kwargs):
     )
 
 
+def read_parquet_df(filepath_or_buffer, **kwargs):
+    """
+    Return contents of a Parquet file as a pandas DataFrame.
+
+    :param filepath_or_buffer: a Parquet file
+    :type filepath_or_buffer: string (path) or file-like object
+    :param **kwargs: See docs for pandas.read_parquet
+    :return: The structured contents of the file
+    :rtype: pandas.Dataframe
+    """
+    kwargs["engine"] = "pyarrow"
+    return pandas.read_parquet(filepath_or_buffer, **kwargs)
+
+
+def read_feather_df(filepath_or_buffer, **kwargs):
+    """
+    Return contents of a Feather (Arrow IPC) file as a pandas DataFrame.
+
+    :param filepath_or_buffer: a Feather file
+    :type filepath_or_buffer: string (path) or file-like object
+    :param **kwargs: See docs for pandas.read_feather
+    :return: The structured contents of the file
+    :rtype: pandas.Dataframe
+    """
+    return pandas.read_feather(filepath_or_buffer, **kwargs)
+
+
 def read_df(filepath_or_buffer, original_name=None, **kwargs):
     """
     Return contents of a data file as a pandas DataFrame. Wraps more specific
@@ -140,6 +168,10 @@ def read_df(filepath_or_buffer, original_name=None, **kwargs):
         read_func = read_delimited_text_df
     elif original_name.endswith(".json"):
         read_func = read_json_df
+    elif original_name.endswith(".parquet"):
+        read_func = read_parquet_df
+    elif original_name.endswith(".feather"):
+        read_func = read_feather_df
     else:
         raise Exception(
             f"Could not determine appropriate reader for '{original_name}'."
@@ -152,6 +184,43 @@ def read_df(filepath_or_buffer, original_name=None, **kwargs):
         raise Exception(f"In {read_func.__name__} : {str(e)}") from e
 
 
+def write_df(df, filepath, index=False):
+    """
+    Write a pandas DataFrame to a data file whose type is given by the file
+    extension. Parquet and Feather files keep the column dtypes and None
+    values that delimited text files flatten into strings.
+
+    :param df: the DataFrame to write
+    :type df: pandas.DataFrame
+    :param filepath: where to write it, ending in .tsv, .csv, .txt, .parquet,
+        or .feather
+    :type filepath: str
+    :param index: whether to also write the DataFrame's index, defaults to
+        False
+    :type index: bool, optional
+    """
+    if filepath.endswith((".tsv", ".txt")):
+        df.to_csv(filepath, sep="\t", index=index)
+    elif filepath.endswith(".csv"):
+        df.to_csv(filepath, index=index)
+    elif filepath.endswith(".parquet"):
+        # index=None stores a RangeIndex as metadata instead of as a column
+        df.to_parquet(
+            filepath, engine="pyarrow", index=(None if index else False)
+        )
+    elif filepath.endswith(".feather"):
+        # pandas.DataFrame.to_feather refuses any index but a RangeIndex
+        from pyarrow import feather
+
+        feather.write_feather(
+            df if index else df.reset_index(drop=True), filepath
+        )
+    else:
+        raise Exception(
+            f"Could not determine appropriate writer for '{filepath}'."
+        )
+
+
 def read_yaml(filepath):
     with open(filepath, "r") as yaml_file:
         return yaml.load(yaml_file, Loader=yaml.FullLoader)
@@ -202,6 +271,42 @@ def write_json(data, filepath, use_jsonpickle=True, **kwargs):
         json.dump(data, json_file, **kwargs)
 
 
+def open_json_lines(filepath, mode="r"):
+    """
+    Open a JSON Lines file as text, gzipped if the file name ends with .gz
+
+    :param filepath: path to the JSON Lines file
+    :type filepath: str
+    :param mode: "r" to read, "w" to write, or "a" to append
+    :type mode: str, optional
+    :return: the open file
+    """
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, mode + "t", encoding="utf-8")
+    return open(filepath, mode, encoding="utf-8")
+
+
+def read_json_lines(filepath):
+    """
+    Read a JSON Lines file one value at a time. A last line that was cut off
+    by an interrupted write is ignored.
+
+    :param filepath: path to the JSON Lines file, gzipped if it ends with .gz
+    :type filepath: str
+    :return: generator of the values on each line
+    """
+    with open_json_lines(filepath) as jl:
+        try:
+            for line in jl:
+                if not line.endswith("\n"):
+                    break
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError:
+            # truncated gzip stream
+            pass
+
+
 def path_to_file_list(file_or_dir, recursive=True):
     """
     Convert input which is either a file or a directory to a list of filepaths.
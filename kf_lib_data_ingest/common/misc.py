@@ -12,7 +12,9 @@ from kf_lib_data_ingest.common.type_safety import (
     assert_all_safe_type,
     assert_safe_type,
 )
-from pandas import isnull
+import numpy
+from pandas import DataFrame, factorize, isnull
+from pandas.api.types import infer_dtype
 
 
 def _get_match(
@@ -272,6 +274,44 @@ def recover_containers_from_df_strings(df):
     return df.applymap(str_to_obj)
 
 
+def _clean_up_series(col):
+    """
+    Apply convert_to_downcasted_str(x, replace_na=True, na=None) to every
+    value of a pandas Series, converting each distinct value only once.
+
+    :param col: a pandas Series
+    :return: numpy object array of cleaned values
+    """
+    if (col.dtype != object) or (
+        infer_dtype(col, skipna=True) in ("string", "empty")
+    ):
+        # Columns holding only one type of value can be factorized safely.
+        # Mixed object columns can't because e.g. True == 1 == 1.0 would all
+        # collapse into one unique value.
+        codes, uniques = factorize(col)
+        cleaned = numpy.empty(len(uniques) + 1, dtype=object)
+        cleaned[:-1] = [
+            convert_to_downcasted_str(v, replace_na=True, na=None)
+            for v in numpy.asarray(uniques, dtype=object)
+        ]
+        cleaned[-1] = None  # factorize codes nulls as -1
+        return cleaned[codes]
+
+    cache = {}
+    cleaned = numpy.empty(len(col), dtype=object)
+    for i, v in enumerate(col.to_numpy(dtype=object)):
+        try:
+            key = (type(v), v)
+            cleaned[i] = cache[key]
+        except KeyError:
+            cleaned[i] = cache[key] = convert_to_downcasted_str(
+                v, replace_na=True, na=None
+            )
+        except TypeError:  # unhashable lists and dicts
+            cleaned[i] = convert_to_downcasted_str(v, replace_na=True, na=None)
+    return cleaned
+
+
 def clean_up_df(df):
     """
     We can't universally control which null type will get used by a data
@@ -285,15 +325,28 @@ def clean_up_df(df):
     inline, cause pandas to convert perfectly good ints into ugly floats.
     So here we get any untidy values back to nice and tidy strings.
 
+    This gives the same result as
+    `df.applymap(lambda x: convert_to_downcasted_str(x, True, None))`
+    followed by drop_duplicates, but converts each distinct value in a column
+    only once.
+
     :param df: a pandas DataFrame
     :return: Dataframe with numbers converted to strings and NaNs/blanks
         converted to None
     :rtype: DataFrame
     """
+    if df.empty:
+        return df.applymap(
+            lambda x: convert_to_downcasted_str(x, replace_na=True, na=None)
+        ).drop_duplicates()
 
-    return df.applymap(
-        lambda x: convert_to_downcasted_str(x, replace_na=True, na=None)
-    ).drop_duplicates()
+    cleaned = DataFrame(
+        {i: _clean_up_series(df.iloc[:, i]) for i in range(df.shape[1])},
+        index=df.index,
+        dtype=object,
+    )
+    cleaned.columns = df.columns
+    return cleaned.drop_duplicates()
 
 
 def obj_attrs_to_dict(cls):
@@ -55,16 +55,113 @@ def split_df_rows_on_splits(df):
         {'a': None, 'b': 5, 'c': 7}
     ]
 
+    Rows without Splits pass through untouched, and if there are no Splits
+    anywhere then no rows get expanded at all.
+
     :param df: a DataFrame
     :return: a new DataFrame
     :rtype: DataFrame
     """
 
-    def split_row(df_row_dict):
+    columns = list(df.columns)
+    index = df.index.to_numpy(dtype=object)
+    values = [df.iloc[:, i].to_numpy(dtype=object) for i in range(len(columns))]
+
+    # Find the rows that contain Splits
+    split_cols = defaultdict(list)  # {row position: [column positions]}
+    for c, col_values in enumerate(values):
+        if not any(issubclass(t, Split) for t in set(map(type, col_values))):
+            continue
+        for r, v in enumerate(col_values):
+            if isinstance(v, Split):
+                split_cols[r].append(c)
+
+    # Expand each of those rows into a block of rows
+    counts = numpy.ones(len(index), dtype=int)
+    blocks = {}
+    for r in sorted(split_cols):
+        row = [col_values[r] for col_values in values]
+        block = _split_row(row, split_cols[r])
+        if block is None:  # Nested Splits. Do it the slow way.
+            block = _split_row_recursively(row)
+        blocks[r] = block
+        counts[r] = block[1]
+
+    # Repeat every row as many times as its expansion needs and then fill in
+    # the split values
+    if blocks:
+        index = numpy.repeat(index, counts)
+        values = [numpy.repeat(col_values, counts) for col_values in values]
+        starts = numpy.cumsum(counts) - counts
+        for r, (new_cols, n) in blocks.items():
+            start = starts[r]
+            for c, new_values in new_cols.items():
+                values[c][start : start + n] = new_values
+
+    df = pandas.DataFrame(dict(enumerate(values)), index=pandas.Index(index))
+    df.columns = columns
+    return df
+
+
+def _split_row(row, split_cols):
+    """
+    Expand the Splits in one row for split_df_rows_on_splits.
+
+    Each Split group (and each ungrouped Split) is expanded in order of its
+    first column, and the earliest one varies slowest. As with nested loops,
+    expansion stops at an empty Split, which leaves it and any later Splits in
+    place.
+
+    :param row: list of the row's cell values
+    :param split_cols: positions of the cells that contain Splits
+    :return: ({column position: list of new values}, number of new rows), or
+        None if a Split contains another Split
+    """
+    # Collate groups. Every ungrouped Split gets its own group.
+    groups = {}
+    for c in split_cols:
+        split = row[c]
+        if any(isinstance(t, Split) for t in split.things):
+            return None
+        key = ("col", c) if split.group is None else ("group", split.group)
+        groups.setdefault(key, {})[c] = split.things
+
+    lengths = []
+    for col_dict in groups.values():
+        length = max(len(things) for things in col_dict.values())
+        if length == 0:
+            break
+        lengths.append(length)
+    groups = list(groups.values())[: len(lengths)]
+
+    n = 1
+    for length in lengths:
+        n *= length
+    new_cols = {}
+    inner = n
+    for col_dict, length in zip(groups, lengths):
+        inner //= length
+        positions = [(i // inner) % length for i in range(n)]
+        for c, things in col_dict.items():
+            padded = things + [None] * (length - len(things))
+            new_cols[c] = [padded[p] for p in positions]
+    return new_cols, n
+
+
+def _split_row_recursively(row):
+    """
+    Expand the Splits in one row for split_df_rows_on_splits, including Splits
+    that get revealed by expanding other Splits.
+
+    :param row: list of the row's cell values
+    :return: ({column position: list of new values}, number of new rows)
+    """
+
+    def split_row(row_dict):
         # Collate groups
         split_groups = defaultdict(dict)
         split_group_lengths = defaultdict(int)
-        for k, v in df_row_dict.items():
+        for k, v in row_dict.items():
             if isinstance(v, Split):
                 split_groups[v.group][k] = v.things
                 split_group_lengths[v.group] = max(
@@ -76,12 +173,12 @@ def split_df_rows_on_splits(df):
         for group, col_dict in split_groups.items():
             if group is not None:  # Non-cartesian-product splits
                 for col, things in col_dict.items():
-                    col_dict[col] += [None] * (
+                    col_dict[col] = things + [None] * (
                         split_group_lengths[group] - len(things)
                     )
                 # Now group_1 = {col1: [1, 2, 3], col2: [a, b, None]}}
                 for i in range(split_group_lengths[group]):
-                    new_row = df_row_dict.copy()
+                    new_row = row_dict.copy()
                     for col, things in col_dict.items():
                         new_row[col] = things[i]
                     row_list += split_row(new_row)
@@ -89,22 +186,15 @@ def split_df_rows_on_splits(df):
             else:  # Cartesian product splits
                 for col, things in col_dict.items():
                     for val in things:
-                        new_row = df_row_dict.copy()
+                        new_row = row_dict.copy()
                         new_row[col] = val
                         row_list += split_row(new_row)
                     break
-        return row_list or [df_row_dict]
-
-    split_out = []
-    index_key = "__index_IQDBDZVSME7L8YSKX__"  # don't name a column this :)
-    df.index.name = index_key
-    for row in df.reset_index().to_dict(orient="records"):
-        split_out += split_row(row)
-    df = pandas.DataFrame.from_dict(split_out, dtype=object).set_index(
-        index_key
-    )
-    df.index.name = None
-    return df
+                break
+        return row_list or [row_dict]
+
+    rows = split_row(dict(enumerate(row)))
+    return {c: [r[c] for r in rows] for c in range(len(row))}, len(rows)
 
 
 def split_df_rows_on_delims(df, delimiters, cols=None, cartesian=True):
@@ -132,13 +222,15 @@ def split_df_rows_on_delims(df, delimiters, cols=None, cartesian=True):
     group = None if cartesian else 1
     cols = cols or df.columns
     df = df.copy()
-    for i, row in df.iterrows():
-        for col in cols:
-            val = multisplit(row[col], delimiters)
+    for col in cols:
+        split_values = []
+        for val in df[col]:
+            val = multisplit(val, delimiters)
             if len(val) > 1:
-                row[col] = Split(val, group=group)
+                split_values.append(Split(val, group=group))
             else:
-                row[col] = val[0]
+                split_values.append(val[0])
+        df[col] = pandas.Series(split_values, index=df.index, dtype=object)
     return split_df_rows_on_splits(df)
 
 
@@ -171,6 +263,157 @@ def get_col(df, key):
         ) from e
 
 
+def apply_unique(series, func):
+    """
+    Like pandas.Series.apply, but call func only once per distinct value
+    instead of once per cell and then broadcast the results back to all of the
+    cells with that value.
+
+    Only columns of strings (and missing values) are memoized. Anything else
+    is passed to Series.apply, because distinct objects of other types can
+    compare equal (e.g. 1, 1.0, and True). func must be pure: it must always
+    return the same result for the same input.
+
+    :param series: a Series
+    :param func: a function that takes one cell value
+    :return: a new Series with the same index
+    :rtype: Series
+    """
+    if pandas.api.types.infer_dtype(series, skipna=True) not in {
+        "string",
+        "empty",
+    }:
+        return series.apply(func)
+
+    codes, uniques = pandas.factorize(series)
+    results = numpy.empty(len(series), dtype=object)
+    if len(uniques):
+        unique_results = numpy.empty(len(uniques), dtype=object)
+        unique_results[:] = [func(u) for u in uniques]
+        found = codes >= 0
+        results[found] = unique_results[codes[found]]
+    else:
+        found = numpy.zeros(len(series), dtype=bool)
+
+    # Missing values all share a code, but None and NaN can map differently
+    missing_results = {}
+    values = series.to_numpy(dtype=object)
+    for i in numpy.flatnonzero(~found):
+        val = values[i]
+        key = None if val is None else type(val)
+        if key not in missing_results:
+            missing_results[key] = func(val)
+        results[i] = missing_results[key]
+
+    return pandas.Series(
+        results, index=series.index, name=series.name, dtype=object
+    ).infer_objects()
+
+
+def _compile_replace_mappings(mappings, regex):
+    """
+    Compile the {original: replacement} pairs of a safe_pandas_replace mapping
+    into a list of (compiled pattern, replacement) pairs.
+
+    Patterns are always anchored. Patterns paired with functions are made to
+    have at least one capture group so that the function receives the whole
+    match if there aren't any captures. Replacement strings are only treated
+    as templates with group references when regex is set.
+    """
+    compiled = []
+    for k, v in mappings.items():
+        if pandas.isnull(k) or (k == "") or (regex and (k == "^$")):
+            k = str(numpy.nan)
+        else:
+            k = str(k)
+
+        # Turn everything into regex. Always anchor patterns to prevent
+        # accidentally catching the "male" inside of "female" and turning
+        # it into "feMale" or other similar shenanigans.
+        if regex:
+            if not k.startswith("^"):
+                k = "^" + k
+            if not k.endswith("$"):
+                # not technically right but likely good enough
+                k = k + "$"
+        else:
+            k = "^" + re.escape(k) + "$"
+            if isinstance(v, str):
+                v = v.replace("\\", r"\\")
+
+        pattern = re.compile(k)
+        if callable(v) and (pattern.groups == 0):
+            # If the pattern has no captures, capture the whole thing
+            pattern = re.compile("^(" + k[1:-1] + ")$")
+
+        compiled.append((pattern, v))
+    return compiled
+
+
+def _replace_value(val, compiled_mappings):
+    """
+    Find the replacement for a single string value. The first mapping that
+    changes the value wins.
+
+    :return: (True, replacement) or (False, None) if nothing changed it
+    """
+    for pattern, v in compiled_mappings:
+        if callable(v):
+            match = pattern.search(val)
+            if (not match) or (match.group(1) is None):
+                continue
+            # Unmatched optional captures are passed as the string "nan"
+            new = v(*[g if g is not None else "nan" for g in match.groups()])
+        elif not pattern.search(val):
+            continue
+        elif isinstance(v, str):
+            new = pattern.sub(v, val)
+        else:
+            new = v
+
+        # A value only counts as replaced if it looks different afterward.
+        # Replacing with numpy.nan leaves the value open for later mappings.
+        if (str(new) != val) and (new is not numpy.nan):
+            return True, new
+    return False, None
+
+
+def _replace_series(data, compiled_mappings):
+    """
+    Apply compiled mappings to a Series. Each distinct string value is only
+    matched against the mappings once and the results are broadcast back to
+    all of the rows with that value.
+    """
+    # Forcing dtype to `object` allows differentiating None from np.nan,
+    # which means that you can replace cells with None and not have those
+    # changes overwritten.
+    values = data.to_numpy(dtype=object, copy=True)
+    if not compiled_mappings:
+        return pandas.Series(values, index=data.index, dtype=object)
+
+    try:
+        codes, uniques = pandas.factorize(values)
+    except TypeError:  # unhashable cell values
+        codes = numpy.arange(len(values))
+        uniques = values
+
+    replaced = numpy.zeros(len(uniques), dtype=bool)
+    replacements = numpy.empty(len(uniques), dtype=object)
+    for i, val in enumerate(uniques):
+        # Only strings can match
+        if isinstance(val, str):
+            replaced[i], replacements[i] = _replace_value(
+                val, compiled_mappings
+            )
+
+    # Everything not replaced, including missing values, keeps its original
+    # value
+    found = numpy.flatnonzero(codes >= 0)
+    mask = found[replaced[codes[found]]]
+    values[mask] = replacements[codes[mask]]
+    return pandas.Series(values, index=data.index, dtype=object)
+
+
 def safe_pandas_replace(data, mappings, regex=False):
     """
     Apply dict-based replacement to DataFrame and Series without cascading
@@ -187,6 +430,9 @@ def safe_pandas_replace(data, mappings, regex=False):
     will receive any regex captures, or the whole match if there aren't any
     captures, and replace the matched cell with the function call result.
 
+    Mapping patterns are compiled once, and each distinct cell value is only
+    matched once no matter how many rows contain it.
+
     :param data: a DateFrame or Series
     :param mappings: Dictionary with form {column: { original: replacement, ...}, ...},
         or just {original: replacement, ...}, or some combination of the two as in
@@ -214,66 +460,20 @@ def safe_pandas_replace(data, mappings, regex=False):
                 series_maps[k] = v
             else:
                 dataframe_maps[k] = v
+        compiled_dataframe_maps = _compile_replace_mappings(
+            dataframe_maps, regex
+        )
         output = pandas.DataFrame(index=data.index)
         for k, s in data.items():
             # apply dataframe-global map after all series-local maps
-            output[k] = safe_pandas_replace(
+            output[k] = _replace_series(
                 safe_pandas_replace(s, series_maps.get(k), regex),
-                dataframe_maps,
-                regex,
+                compiled_dataframe_maps,
             )
     else:  # one column Series
-        # Forcing dtype to `object` allows differentiating None from np.nan,
-        # which means that you can replace cells with None and not have those
-        # changes overwritten.
-        output = pandas.Series(index=data.index, dtype=object)
-
-        for k, v in mappings.items():
-            # Keep track of which output cells are still nan, because those are
-            # the only ones we're allowed to fill from the next replacement.
-            holes = output.apply(lambda x: x is numpy.nan)
-
-            if pandas.isnull(k) or (k == "") or (regex and (k == "^$")):
-                k = str(numpy.nan)
-            else:
-                k = str(k)
-
-            # Turn everything into regex. Always anchor patterns to prevent
-            # accidentally catching the "male" inside of "female" and turning
-            # it into "feMale" or other similar shenanigans.
-            if regex:
-                if not k.startswith("^"):
-                    k = "^" + k
-                if not k.endswith("$"):
-                    # not technically right but likely good enough
-                    k = k + "$"
-            else:
-                k = "^" + re.escape(k) + "$"
-
-            if callable(v):  # Apply functions
-                # Find the arguments to pass to the function
-                try:
-                    # Look for capture groups
-                    matches = data.str.extract(k)
-                except Exception:
-                    # If the pattern has no captures, capture the whole thing
-                    k = "^(" + k[1:-1] + ")$"
-                    matches = data.str.extract(k)
-
-                new = data.copy()
-                # create new values using the returns from the function calls
-                new[pandas.notnull(matches[0])] = matches.astype(str).apply(
-                    lambda row: v(*row), axis=1
-                )
-            else:  # basic replacement
-                new = data.replace({k: v}, regex=True)
-
-            # Fill only the remaining holes with new values
-            output[holes] = new[new.astype(str) != data.astype(str)][holes]
-
-        # Fill any remaining holes with original values
-        holes = output.apply(lambda x: x is numpy.nan)
-        output[holes] = data[holes]
+        output = _replace_series(
+            data, _compile_replace_mappings(mappings, regex)
+        )
 
     return output
 
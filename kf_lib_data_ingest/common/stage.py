@@ -4,7 +4,14 @@ import time
 from abc import ABC, abstractmethod
 from functools import wraps
 
-from kf_lib_data_ingest.common.io import path_to_file_list, read_json
+from kf_lib_data_ingest.common.io import (
+    path_to_file_list,
+    read_df,
+    read_json,
+    write_df,
+)
+from kf_lib_data_ingest.common.misc import clean_up_df
+from kf_lib_data_ingest.config import STAGE_CACHE_FORMATS
 from kf_lib_data_ingest.validation.validation import (
     Validator,
     check_results,
@@ -120,6 +127,68 @@ class IngestStage(ABC):
         """
         pass
 
+    def _write_cache_df(self, df, name, file_format, index=False):
+        """
+        Write a DataFrame to <stage_cache_dir>/<name>.<file_format> and remove
+        any copy of it in the other stage cache formats. A DataFrame that a
+        columnar format can't store, such as one with a column of mixed
+        types, is written as TSV instead.
+
+        :param df: the DataFrame to write
+        :type df: pandas.DataFrame
+        :param name: file name without the extension
+        :type name: str
+        :param file_format: one of config.STAGE_CACHE_FORMATS
+        :type file_format: str
+        :param index: whether to also write the DataFrame's index, defaults to
+            False
+        :type index: bool, optional
+        :return: path of the written file
+        :rtype: str
+        """
+        base = os.path.join(self.stage_cache_dir, name)
+        filepath = f"{base}.{file_format}"
+        try:
+            write_df(df, filepath, index=index)
+        except (TypeError, ValueError) as e:
+            if file_format == "tsv":
+                raise
+            self.logger.warning(
+                f"Could not write {name} as {file_format}, so writing it as"
+                f" tsv instead. Caused by: {e}"
+            )
+            filepath = f"{base}.tsv"
+            write_df(df, filepath, index=index)
+
+        for other in STAGE_CACHE_FORMATS:
+            other_filepath = f"{base}.{other}"
+            if (other_filepath != filepath) and os.path.isfile(other_filepath):
+                os.remove(other_filepath)
+
+        return filepath
+
+    def _read_cache_df(self, filepath, index=False):
+        """
+        Read a DataFrame written by _write_cache_df. Columnar files come back
+        as they were written, while TSV values need cleaning up after being
+        read as strings.
+
+        :param filepath: path of the file
+        :type filepath: str
+        :param index: whether the DataFrame's index was written, defaults to
+            False
+        :type index: bool, optional
+        :return: the DataFrame
+        :rtype: pandas.DataFrame
+        """
+        if filepath.endswith(".tsv"):
+            return clean_up_df(
+                read_df(
+                    filepath, delimiter="\t", index_col=(0 if index else None)
+                )
+            )
+        return read_df(filepath)
+
     def _validation_results_filepath(self):
         """
         Path to validation results file
@@ -7,6 +7,24 @@ except ImportError:
     from importlib_metadata import version
 
 NETWORK_USER_AGENT = "kf-lib-data-ingest"
+# Kept-alive connections per host in the shared HTTP session. Matches the
+# default number of concurrent.futures.ThreadPoolExecutor workers.
+DEFAULT_HTTP_POOL_SIZE = min(32, (os.cpu_count() or 1) + 4)
+# Threads that send entities to the target service when loading with
+# use_async, and how many records each of them may have queued at once.
+DEFAULT_LOAD_WORKERS = DEFAULT_HTTP_POOL_SIZE
+LOAD_RECORDS_IN_FLIGHT_PER_WORKER = 4
+# Records in flight at once when a plugin supports loading with coroutines
+DEFAULT_ASYNC_LOAD_CONCURRENCY = 256
+# Entities sent together to target API plugins that define submit_batch
+DEFAULT_SUBMIT_BATCH_SIZE = 100
+# With adaptive concurrency, the number of entities in flight is cut by
+# ADAPTIVE_DECREASE_FACTOR when the target service reports overload or its
+# responses get ADAPTIVE_LATENCY_TOLERANCE times slower than usual. Retry-After
+# pauses longer than MAX_RETRY_AFTER_SECONDS are shortened.
+ADAPTIVE_LATENCY_TOLERANCE = 2.0
+ADAPTIVE_DECREASE_FACTOR = 0.5
+MAX_RETRY_AFTER_SECONDS = 300
 
 ROOT_DIR = os.path.dirname(__file__)
 TEMPLATES_DIR = os.path.join(ROOT_DIR, "templates")
@@ -24,6 +42,23 @@ DEFAULT_LOG_OVERWRITE_OPT = True
 INGEST_PKG_TEMPLATE_NAME = "my_ingest_package"
 
 DEFAULT_ID_CACHE_FILENAME = "uid_cache.db"
+# Identifier cache entries are written to disk together once this many are
+# waiting or this many seconds have passed since the last write
+UID_CACHE_FLUSH_SIZE = 1000
+UID_CACHE_FLUSH_SECONDS = 5
+UID_CACHE_SYNCHRONOUS_MODES = ["OFF", "NORMAL", "FULL", "EXTRA"]
+DEFAULT_UID_CACHE_SYNCHRONOUS = "NORMAL"
+
+DEFAULT_DOWNLOAD_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".kf_lib_data_ingest", "download_cache"
+)
+DEFAULT_DOWNLOAD_CACHE_MAX_SIZE = 10 * 1024**3  # bytes
+
+# File formats, also the file extensions, that the extract and transform
+# stages can cache their output DataFrames in. TSV is human-readable, while
+# the columnar formats are much faster to read back.
+STAGE_CACHE_FORMATS = ["tsv", "parquet", "feather"]
+DEFAULT_STAGE_CACHE_FORMAT = "tsv"
 
 VERSION = version("kf-lib-data-ingest")
 
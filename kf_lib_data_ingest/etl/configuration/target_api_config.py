@@ -60,6 +60,26 @@ service, target entity builder classes (not instances) of the form:
             '''
             return list_of_target_ids
 
+        @classmethod
+        def prefetch_target_ids(cls, host, project_id):
+            '''
+            [IMPLEMENTATION OPTIONAL]
+            List every entity of this class that the target service has for
+            the project, so that their identifiers can be cached before
+            loading instead of querying for each record. Records whose key
+            components aren't listed are then treated as new without asking
+            query_target_ids, so the key components must be exactly what
+            get_key_components would return.
+
+            :param host: host url
+            :type host: str
+            :param project_id: unique ID of the project being loaded
+            :type project_id: str
+            :return: (key_components, target ID) pairs
+            :rtype: iterator
+            '''
+            return key_components_and_target_id_pairs
+
         @classmethod
         def build_entity(cls, record, get_target_id_from_record):
             '''
@@ -94,6 +114,50 @@ service, target entity builder classes (not instances) of the form:
             '''
             return unique_identifier_from_the_server_of_the_constructed_entity
 
+        @classmethod
+        def submit_batch(cls, host, bodies):
+            '''
+            [IMPLEMENTATION OPTIONAL]
+            Submit several entity bodies to the target service at once. When
+            this exists it is used instead of submit, with up to
+            submit_batch_size bodies per call.
+
+            :param host: host url
+            :type host: str
+            :param bodies: entity bodies constructed by entity_class.build_entity
+            :type bodies: list
+            :return: one result per body, in the same order, that is either
+                the target entity reference ID or the Exception that stopped
+                that entity from being created or updated
+            :rtype: list
+            '''
+            return list_of_identifiers_or_exceptions
+
+        @classmethod
+        async def async_submit(cls, host, body, session):
+            '''
+            [IMPLEMENTATION OPTIONAL]
+            Coroutine version of submit. When every class being loaded has
+            this, loading with use_async runs on an event loop instead of in
+            threads.
+
+            :param session: HTTP session to send requests with
+            :type session: aiohttp.ClientSession
+            '''
+            return unique_identifier_from_the_server_of_the_constructed_entity
+
+        @classmethod
+        async def async_query_target_ids(cls, host, key_components, session):
+            '''
+            [IMPLEMENTATION OPTIONAL]
+            Coroutine version of query_target_ids, used with async_submit.
+            Without it, query_target_ids runs in a separate thread.
+
+            :param session: HTTP session to send requests with
+            :type session: aiohttp.ClientSession
+            '''
+            return list_of_target_ids
+
 [if LOADER_VERSION == 1] [DEPRECATED]
 
     class Foo:
@@ -180,7 +244,13 @@ or updated on the target server:
 """
 
 from collections import defaultdict
-from inspect import isclass, ismethod, isfunction, signature
+from inspect import (
+    isclass,
+    iscoroutinefunction,
+    isfunction,
+    ismethod,
+    signature,
+)
 from pprint import pformat
 
 from kf_lib_data_ingest.etl.configuration.base_config import (
@@ -262,6 +332,53 @@ class TargetAPIConfig(PyModuleConfig):
                                 "query_target_ids takes wrong input arguments"
                             ].append(t)
 
+                    if hasattr(t, "prefetch_target_ids"):
+                        if not ismethod(t.prefetch_target_ids):
+                            invalid_targets[
+                                "prefetch_target_ids not a method"
+                            ].append(t)
+                        elif not (
+                            list(signature(t.prefetch_target_ids).parameters)
+                            == ["host", "project_id"]
+                        ):
+                            invalid_targets[
+                                "prefetch_target_ids takes wrong input arguments"
+                            ].append(t)
+
+                    if hasattr(t, "submit_batch"):
+                        if not ismethod(t.submit_batch):
+                            invalid_targets["submit_batch not a method"].append(
+                                t
+                            )
+                        elif not (
+                            list(signature(t.submit_batch).parameters)
+                            == ["host", "bodies"]
+                        ):
+                            invalid_targets[
+                                "submit_batch takes wrong input arguments"
+                            ].append(t)
+
+                    for name, params in [
+                        ("async_submit", ["host", "body", "session"]),
+                        (
+                            "async_query_target_ids",
+                            ["host", "key_components", "session"],
+                        ),
+                    ]:
+                        if not hasattr(t, name):
+                            continue
+                        method = getattr(t, name)
+                        if not (
+                            ismethod(method) and iscoroutinefunction(method)
+                        ):
+                            invalid_targets[
+                                f"{name} not an async method"
+                            ].append(t)
+                        elif list(signature(method).parameters) != params:
+                            invalid_targets[
+                                f"{name} takes wrong input arguments"
+                            ].append(t)
+
                     if hasattr(t, "transform_records_list"):
                         if not ismethod(t.transform_records_list):
                             invalid_targets[
@@ -1,8 +1,12 @@
+import concurrent.futures
+import hashlib
+import json
 import os
 from pprint import pformat
 
 import pandas
 
+from kf_lib_data_ingest.common.download_cache import DownloadCache
 from kf_lib_data_ingest.common.file_retriever import (
     PROTOCOL_SEP,
     FileRetriever,
@@ -12,6 +16,11 @@ from kf_lib_data_ingest.common.io import read_df, read_json, write_json
 from kf_lib_data_ingest.common.misc import clean_up_df, clean_walk
 from kf_lib_data_ingest.common.stage import IngestStage
 from kf_lib_data_ingest.common.type_safety import assert_safe_type
+from kf_lib_data_ingest.config import (
+    DEFAULT_STAGE_CACHE_FORMAT,
+    STAGE_CACHE_FORMATS,
+    VERSION,
+)
 from kf_lib_data_ingest.etl.configuration.base_config import (
     ConfigValidationError,
 )
@@ -19,16 +28,114 @@ from kf_lib_data_ingest.etl.configuration.extract_config import ExtractConfig
 from kf_lib_data_ingest.etl.extract.utils import Extractor
 
 
+# The ExtractStage owned by each extract worker process
+_worker_stage = None
+
+# Bytes of a source data file hashed at a time
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _init_extract_worker(
+    extract_config_dir, auth_configs, download_cache_dir, incremental
+):
+    """
+    Process pool initializer. Build one ExtractStage per worker process so
+    that the extract configs are only imported once per worker.
+    """
+    global _worker_stage
+    _worker_stage = ExtractStage(
+        None,
+        extract_config_dir,
+        auth_configs,
+        download_cache_dir=download_cache_dir,
+        incremental=incremental,
+    )
+
+
+def _extract_in_worker(config_filepath):
+    """
+    Process pool task. Run the extraction for the extract config at
+    config_filepath using the worker's ExtractStage.
+
+    :return: (extracted DataFrame, list of skipped operation messages,
+        fingerprint)
+    """
+    stage = _worker_stage
+    extract_config = next(
+        ec
+        for ec in stage.extract_configs
+        if ec.config_filepath == config_filepath
+    )
+    # Worker processes don't run atexit handlers, so give every task its own
+    # FileRetriever and let its temp files get cleaned up when it's dropped.
+    stage.FR = FileRetriever(download_cache=stage.download_cache)
+    try:
+        return stage._extract_and_fingerprint(extract_config)
+    finally:
+        stage.FR = None
+
+
 class ExtractStage(IngestStage):
-    def __init__(self, stage_cache_dir, extract_config_dir, auth_configs=None):
+    def __init__(
+        self,
+        stage_cache_dir,
+        extract_config_dir,
+        auth_configs=None,
+        extract_workers=1,
+        download_cache_dir=None,
+        stage_cache_format=DEFAULT_STAGE_CACHE_FORMAT,
+        incremental=False,
+    ):
+        """
+        :param stage_cache_dir: where to write the stage output
+        :type stage_cache_dir: str
+        :param extract_config_dir: directory containing the extract configs
+        :type extract_config_dir: str
+        :param auth_configs: optional dict mapping URL patterns to
+            authentication schemes and necessary auth parameters
+        :type auth_configs: dict, optional
+        :param extract_workers: number of worker processes used to extract the
+            extract configs in parallel, defaults to 1 (no worker processes)
+        :type extract_workers: int, optional
+        :param download_cache_dir: directory of a persistent cache of
+            downloaded source files, defaults to None (don't cache)
+        :type download_cache_dir: str, optional
+        :param stage_cache_format: file format of the extracted DataFrames in
+            the stage cache, one of config.STAGE_CACHE_FORMATS, defaults to
+            DEFAULT_STAGE_CACHE_FORMAT
+        :type stage_cache_format: str, optional
+        :param incremental: whether to reuse the cached output of extract
+            configs whose fingerprint hasn't changed since the last run
+            instead of extracting them again, defaults to False
+        :type incremental: bool, optional
+        """
         super().__init__(stage_cache_dir)
 
         assert_safe_type(extract_config_dir, str)
+        assert_safe_type(extract_workers, int)
+        assert_safe_type(incremental, bool)
+        if extract_workers < 1:
+            raise ValueError("extract_workers must be at least 1")
+        if stage_cache_format not in STAGE_CACHE_FORMATS:
+            raise ValueError(
+                f"stage_cache_format must be one of {STAGE_CACHE_FORMATS}"
+            )
+        self.stage_cache_format = stage_cache_format
+        self.incremental = incremental
+        # {extract config relpath: (fingerprint, skipped operation messages)}
+        # for the last run's output
+        self.fingerprints = {}
 
         # must set FileRetriever.static_auth_configs before extract configs are
         # read
         FileRetriever.static_auth_configs = auth_configs
-        self.FR = FileRetriever()
+        self.download_cache_dir = download_cache_dir
+        self.download_cache = (
+            DownloadCache(download_cache_dir) if download_cache_dir else None
+        )
+        self.FR = FileRetriever(download_cache=self.download_cache)
+        self.auth_configs = auth_configs
+        self.extract_workers = extract_workers
 
         self.extract_config_dir = extract_config_dir
         self.extract_configs = [
@@ -59,14 +166,22 @@ class ExtractStage(IngestStage):
         """
         Implements IngestStage._write_output
 
-        Write dataframes to tsv files in the stage's output dir.
+        Write dataframes to files of the stage_cache_format in the stage's
+        output dir.
         Write a JSON file that stores metadata needed to reconstruct the output
-        dict. This is the extract_config_url and source_url for each file.
+        dict and to tell whether it's still current. For each extract config
+        this is the output file, the fingerprint of everything that the output
+        was made from, and the messages about operations that were skipped.
 
         The metadata.json file looks like this:
 
         {
-            <path to output file>: <URL to the files's extract config>,
+            <URL to the file's extract config>: {
+                "filepath": <path to output file>,
+                "fingerprint": <see ExtractStage._fingerprint, null unless
+                    extracted incrementally>,
+                "messages": [<skipped operation message>, ...]
+            },
             ...
         }
 
@@ -77,12 +192,38 @@ class ExtractStage(IngestStage):
         metadata = {}
         for extract_config_url, df in output.items():
             filename = os.path.basename(extract_config_url).split(".")[0]
-            filepath = os.path.join(self.stage_cache_dir, filename + ".tsv")
-            metadata[extract_config_url] = filepath
-            df.to_csv(filepath, sep="\t", index=True)
+            fingerprint, messages = self.fingerprints.get(
+                extract_config_url, (None, [])
+            )
+            metadata[extract_config_url] = {
+                "filepath": self._write_cache_df(
+                    df, filename, self.stage_cache_format, index=True
+                ),
+                "fingerprint": fingerprint,
+                "messages": messages,
+            }
 
         write_json(metadata, meta_fp)
 
+    def _read_metadata(self):
+        """
+        Read the metadata.json file written by _write_output. Files written
+        before fingerprints were recorded map each extract config URL straight
+        to its output file.
+
+        :return: see _write_output
+        :rtype: dict
+        """
+        meta_fp = os.path.join(self.stage_cache_dir, "metadata.json")
+        return {
+            extract_config_url: (
+                {"filepath": entry, "fingerprint": None, "messages": []}
+                if isinstance(entry, str)
+                else entry
+            )
+            for extract_config_url, entry in read_json(meta_fp).items()
+        }
+
     def _read_output(self):
         """
         Implements IngestStage._write_output
@@ -93,13 +234,11 @@ class ExtractStage(IngestStage):
         :return: the original output of ExtractStage._run.
         """
         output = {}
+        metadata = self._read_metadata()
 
-        meta_fp = os.path.join(self.stage_cache_dir, "metadata.json")
-        metadata = read_json(meta_fp)
-
-        for extract_config_url, filepath in metadata.items():
-            output[extract_config_url] = clean_up_df(
-                read_df(filepath, delimiter="\t", index_col=0)
+        for extract_config_url, entry in metadata.items():
+            output[extract_config_url] = self._read_cache_df(
+                entry["filepath"], index=True
             )
 
         self.logger.info(
@@ -158,6 +297,211 @@ class ExtractStage(IngestStage):
 
         return df
 
+    def _source_data_path(self, extract_config):
+        """
+        Resolve the source_data_url of an extract config into a full
+        <protocol>://<path> URL. Relative local file paths are relative to the
+        extract config location.
+
+        :param extract_config: the extract config
+        :type extract_config: ExtractConfig
+        :return: URL of the source data file
+        :rtype: str
+        """
+        protocol, path = split_protocol(extract_config.source_data_url)
+        if protocol == "file":
+            if path.startswith("."):
+                # relative paths from the extract config location
+                path = os.path.normpath(
+                    os.path.join(
+                        os.path.dirname(extract_config.config_filepath),
+                        path,
+                    )
+                )
+            else:
+                path = os.path.expanduser(path)
+
+        return protocol + PROTOCOL_SEP + path
+
+    def _extract_config(self, extract_config):
+        """
+        Read the source data for one extract config and apply its operations.
+
+        :param extract_config: the extract config to run
+        :type extract_config: ExtractConfig
+        :return: (extracted DataFrame, list of skipped operation messages)
+        :rtype: tuple
+        """
+        self.logger.info("Extract config: %s", extract_config.config_filepath)
+        data_path = self._source_data_path(extract_config)
+
+        # read contents from file
+        try:
+            df_in = self._source_file_to_df(
+                data_path,
+                do_after_read=extract_config.do_after_read,
+                read_func=extract_config.source_data_read_func,
+                **(extract_config.source_data_read_params or {}),
+            )
+        except ConfigValidationError as e:
+            raise type(e)(
+                f"In extract config {extract_config.config_filepath}"
+                f" : {str(e)}"
+            )
+
+        if len(df_in.index) == 0:
+            fnames = []
+            if extract_config.source_data_read_func:
+                fnames.append("source_data_read_func")
+            if extract_config.do_after_read:
+                fnames.append("do_after_read")
+            msg = "Source DataFrame is empty."
+            if fnames:
+                suffix = "s" if (len(fnames) > 1) else ""
+                fnames = " and ".join(fnames)
+                msg = f"{msg} Check your {fnames} function{suffix}."
+            raise ConfigValidationError(msg)
+
+        # _source_file_to_df cleans the data before calling do_after_read
+        df_out = self.extractor.extract(
+            df_in,
+            extract_config,
+            apply_after_read_func=False,
+            df_is_clean=not extract_config.do_after_read,
+        )
+        return df_out, list(self.extractor.messages)
+
+    def _fingerprint(self, extract_config):
+        """
+        Hash everything that the output of an extract config is made from: the
+        config file, the contents of its source data file, the parameters
+        that the file is read with, and the library version. Modules imported
+        by the config file aren't included.
+
+        :param extract_config: the extract config
+        :type extract_config: ExtractConfig
+        :return: hex digest
+        :rtype: str
+        """
+        digest = hashlib.sha256(VERSION.encode())
+        with open(extract_config.config_filepath, "rb") as config_file:
+            digest.update(config_file.read())
+        digest.update(
+            json.dumps(
+                extract_config.source_data_read_params or {},
+                sort_keys=True,
+                default=lambda v: getattr(v, "__qualname__", str(v)),
+            ).encode()
+        )
+        f = self.FR.get(self._source_data_path(extract_config))
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        f.seek(0)
+        return digest.hexdigest()
+
+    def _extract_and_fingerprint(self, extract_config):
+        """
+        Run _extract_config and, when extracting incrementally, fingerprint
+        the extract config. Other runs don't read the fingerprints, so they
+        skip hashing the source data.
+
+        :return: (extracted DataFrame, list of skipped operation messages,
+            fingerprint or None)
+        :rtype: tuple
+        """
+        df_out, messages = self._extract_config(extract_config)
+        fingerprint = None
+        if self.incremental:
+            fingerprint = self._fingerprint(extract_config)
+        return df_out, messages, fingerprint
+
+    def _reusable_output(self):
+        """
+        Find the extract configs whose fingerprint matches the one recorded
+        for their cached output, and read that output.
+
+        :return: {extract config relpath: (cached DataFrame, list of skipped
+            operation messages, fingerprint)}
+        :rtype: dict
+        """
+        if not (self.incremental and self.stage_cache_dir):
+            return {}
+        try:
+            metadata = self._read_metadata()
+        except FileNotFoundError:
+            return {}
+
+        # Download all of the source files in the background while the first
+        # ones are being hashed
+        self.FR.prefetch(
+            self._source_data_path(ec) for ec in self.extract_configs
+        )
+        reusable = {}
+        for ec in self.extract_configs:
+            entry = metadata.get(ec.config_file_relpath)
+            if not (entry and entry["fingerprint"]):
+                continue
+            fingerprint = self._fingerprint(ec)
+            if (fingerprint == entry["fingerprint"]) and os.path.isfile(
+                entry["filepath"]
+            ):
+                self.logger.info(
+                    "Reusing cached output of unchanged extract config %s",
+                    ec.config_filepath,
+                )
+                reusable[ec.config_file_relpath] = (
+                    self._read_cache_df(entry["filepath"], index=True),
+                    entry["messages"],
+                    fingerprint,
+                )
+        return reusable
+
+    def _run_in_workers(self, extract_configs):
+        """
+        Run _extract_and_fingerprint for the given extract configs in a pool
+        of worker processes.
+
+        Results are collected in extract config order so that the output and
+        the skipped operation messages come out the same as a sequential run.
+
+        :param extract_configs: the extract configs to run
+        :type extract_configs: list
+        :return: list of (extract config, (DataFrame, messages, fingerprint))
+            pairs
+        """
+        self.logger.info(
+            "Extracting %d configs with %d worker processes",
+            len(extract_configs),
+            self.extract_workers,
+        )
+        results = []
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.extract_workers,
+            initializer=_init_extract_worker,
+            initargs=(
+                self.extract_config_dir,
+                self.auth_configs,
+                self.download_cache_dir,
+                self.incremental,
+            ),
+        ) as ex:
+            futures = [
+                ex.submit(_extract_in_worker, ec.config_filepath)
+                for ec in extract_configs
+            ]
+            for extract_config, f in zip(extract_configs, futures):
+                try:
+                    results.append((extract_config, f.result()))
+                except Exception:
+                    self.logger.error(
+                        "Extraction failed for extract config %s",
+                        extract_config.config_filepath,
+                    )
+                    for other in futures:
+                        other.cancel()
+                    raise
+        return results
+
     def _run(self, _ignore=None):
         """
         :return: A dictionary where a key is the URL to the extract_config
@@ -165,59 +509,44 @@ class ExtractStage(IngestStage):
             (<URL to source data file>, <extracted DataFrame>)
         :rtype: dict
         """
-        output = {}
-        self.messages = []
-        for extract_config in self.extract_configs:
+        results = self._reusable_output()
+        extract_configs = [
+            ec
+            for ec in self.extract_configs
+            if ec.config_file_relpath not in results
+        ]
+        if self.incremental:
             self.logger.info(
-                "Extract config: %s", extract_config.config_filepath
+                "Reusing %d unchanged extract configs, extracting %d",
+                len(results),
+                len(extract_configs),
             )
-            protocol, path = split_protocol(extract_config.source_data_url)
-            if protocol == "file":
-                if path.startswith("."):
-                    # relative paths from the extract config location
-                    path = os.path.normpath(
-                        os.path.join(
-                            os.path.dirname(extract_config.config_filepath),
-                            path,
-                        )
-                    )
-                else:
-                    path = os.path.expanduser(path)
-
-            data_path = protocol + PROTOCOL_SEP + path
-
-            # read contents from file
-            try:
-                df_in = self._source_file_to_df(
-                    data_path,
-                    do_after_read=extract_config.do_after_read,
-                    read_func=extract_config.source_data_read_func,
-                    **(extract_config.source_data_read_params or {}),
-                )
-            except ConfigValidationError as e:
-                raise type(e)(
-                    f"In extract config {extract_config.config_filepath}"
-                    f" : {str(e)}"
-                )
 
-            if len(df_in.index) == 0:
-                fnames = []
-                if extract_config.source_data_read_func:
-                    fnames.append("source_data_read_func")
-                if extract_config.do_after_read:
-                    fnames.append("do_after_read")
-                msg = "Source DataFrame is empty."
-                if fnames:
-                    suffix = "s" if (len(fnames) > 1) else ""
-                    fnames = " and ".join(fnames)
-                    msg = f"{msg} Check your {fnames} function{suffix}."
-                raise ConfigValidationError(msg)
-
-            df_out = self.extractor.extract(
-                df_in, extract_config, apply_after_read_func=False
+        if self.extract_workers > 1 and len(extract_configs) > 1:
+            extracted = self._run_in_workers(extract_configs)
+        else:
+            # Download all of the source files in the background while the
+            # first ones are being extracted
+            self.FR.prefetch(
+                self._source_data_path(ec) for ec in extract_configs
+            )
+            extracted = (
+                (ec, self._extract_and_fingerprint(ec))
+                for ec in extract_configs
             )
-            self.messages.extend(self.extractor.messages)
-            output[extract_config.config_file_relpath] = df_out
+        for ec, result in extracted:
+            results[ec.config_file_relpath] = result
+
+        # in extract config order, same as a run that extracts everything
+        output = {}
+        self.messages = []
+        self.fingerprints = {}
+        for ec in self.extract_configs:
+            relpath = ec.config_file_relpath
+            df_out, messages, fingerprint = results[relpath]
+            self.messages.extend(messages)
+            self.fingerprints[relpath] = (fingerprint, messages)
+            output[relpath] = df_out
 
         # return dictionary of all dataframes keyed by extract config paths
         return output
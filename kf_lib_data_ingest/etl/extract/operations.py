@@ -13,10 +13,12 @@ its values with other values.
 See: docs/design/extract_config_format.py for function details
 """
 
-from pandas import DataFrame
+import numpy
+from pandas import DataFrame, Index, concat
 
 from kf_lib_data_ingest.common.pandas_utils import (  # noqa: F401
     Split,
+    apply_unique,
     get_col,
     safe_pandas_replace,
 )
@@ -52,7 +54,7 @@ def df_map(m):
     return df_map_func
 
 
-def value_map(m, in_col, out_col, optional=False):
+def value_map(m, in_col, out_col, optional=False, memoize=True):
     """
     Wraps the value mapping operation in a function that takes a DataFrame as
     input and returns a single column DataFrame (plus index).
@@ -81,6 +83,9 @@ def value_map(m, in_col, out_col, optional=False):
     :param in_col: The name of the column in the input DataFrame (the file)
     :param out_col: The standard concept column in the extract output to
     populate
+    :param memoize: If m is a function, only call it once per distinct value
+        in <in_col>. Set this to False if m can return different results for
+        the same input.
     :return: A function that applies the specified m operation
     """
     assert_safe_type(m, callable, dict, str)
@@ -90,7 +95,10 @@ def value_map(m, in_col, out_col, optional=False):
         if optional and (in_col not in df):
             return SkipOptional([in_col])
         if callable(m):
-            new_df[out_col] = get_col(df, in_col).apply(m)
+            if memoize:
+                new_df[out_col] = apply_unique(get_col(df, in_col), m)
+            else:
+                new_df[out_col] = get_col(df, in_col).apply(m)
         elif isinstance(m, str):
             new_df[out_col] = safe_pandas_replace(
                 get_col(df, in_col), {m: lambda x: x}, True
@@ -209,13 +217,20 @@ def melt_map(
     def melt_map_func(df):
         if optional and not all(v in df.columns for v in map_for_vars):
             return SkipOptional(list(map_for_vars))
-        new_df = DataFrame()
-        for k, v in map_for_vars.items():
-            col_melt_df = DataFrame({v: get_col(df, k)}).melt(
-                var_name=var_name, value_name=value_name
-            )
-            col_melt_df.index = df.index.copy()
-            new_df = new_df.append(col_melt_df, sort=False)
+        # Stack all of the columns at once. The result is the same as melting
+        # each column separately and appending them in order.
+        cols = [get_col(df, k) for k in map_for_vars]
+        new_df = DataFrame(
+            {
+                var_name: Index(list(map_for_vars.values())).repeat(len(df)),
+                value_name: (
+                    concat(cols, ignore_index=True).to_numpy()
+                    if cols
+                    else numpy.array([], dtype=object)
+                ),
+            },
+            index=df.index.take(numpy.tile(numpy.arange(len(df)), len(cols))),
+        )
 
         new_df[value_name] = value_map(map_for_values, value_name, value_name)(
             new_df
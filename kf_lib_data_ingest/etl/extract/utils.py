@@ -3,6 +3,7 @@ import logging
 from functools import reduce
 from math import gcd
 
+import numpy
 import pandas
 
 from kf_lib_data_ingest.common.concept_schema import concept_set
@@ -142,7 +143,8 @@ class Extractor(object):
         :rtype: DataFrame
         """
         skip_messages = []
-        out_cols = defaultdict(lambda: pandas.Series(dtype=object))
+        # {column name: [(values, index values), ...]} from each operation
+        out_cols = defaultdict(list)
         original_length = df_in.index.size
 
         # collect columns of extracted data
@@ -187,8 +189,11 @@ class Extractor(object):
                 skip_messages.extend(skip_ms)
 
             for col_name, col_series in res.iteritems():
-                out_cols[col_name] = out_cols[col_name].append(
-                    col_series, ignore_index=False
+                out_cols[col_name].append(
+                    (
+                        col_series.to_numpy(dtype=object),
+                        col_series.index.to_numpy(),
+                    )
                 )
 
         self.logger.info("Done with the operations list.")
@@ -196,13 +201,23 @@ class Extractor(object):
         if not out_cols:
             raise Exception("No columns were extracted.")
 
+        # join the pieces of each column together
+        for col_name, pieces in out_cols.items():
+            values, indexes = zip(*pieces)
+            if len({i.dtype for i in indexes}) > 1:
+                indexes = [i.astype(object) for i in indexes]
+            out_cols[col_name] = (
+                numpy.concatenate(values),
+                numpy.concatenate(indexes),
+            )
+
         # the output dataframe length will be the least common multiple of the
         # extracted column lengths
-        length_lcm = lcm(list(map(len, out_cols.values())))
+        length_lcm = lcm([len(values) for values, _ in out_cols.values()])
 
         self.logger.debug("Extracted column lengths are:")
-        for col_name, col_series in out_cols.items():
-            self.logger.debug("- %s: %d", col_name, col_series.size)
+        for col_name, (values, _) in out_cols.items():
+            self.logger.debug("- %s: %d", col_name, len(values))
 
         self.logger.info("Equalizing column lengths to the LCM: %d", length_lcm)
 
@@ -233,28 +248,40 @@ class Extractor(object):
         #  0       1   C             5
         #  1       2   C             6
 
-        df_out = pandas.DataFrame(dtype=object)
+        out_values = {}
         index = None
-        for col_name, col_series in out_cols.items():
-            if not col_series.empty:
-                length_multiplier = length_lcm / col_series.size
+        for col_name, (values, col_index) in out_cols.items():
+            if len(values):
+                length_multiplier = length_lcm / len(values)
                 assert length_multiplier == round(length_multiplier)
-                # repeat the series length_multiplier times
-                df_out[col_name] = pandas.Series(
-                    list(col_series) * round(length_multiplier), dtype=object
-                )
-                col_index = list(col_series.index) * round(length_multiplier)
-                if index:
-                    if index != col_index:
-                        raise Exception(
-                            "Inconsistent column indices.", index, col_index
-                        )
-                else:
-                    index = col_index
-        df_out.index = index
+                repeats = round(length_multiplier)
+                # repeat the column length_multiplier times
+                out_values[col_name] = numpy.tile(values, repeats)
+                if index is None:
+                    index = numpy.tile(col_index, repeats)
+                # compare each repetition of the column index with the output
+                # index without building the whole repeated column index
+                elif not numpy.array_equal(
+                    index.reshape(repeats, -1),
+                    numpy.broadcast_to(col_index, (repeats, len(col_index))),
+                ):
+                    raise Exception(
+                        "Inconsistent column indices.",
+                        list(index),
+                        list(col_index) * repeats,
+                    )
+        df_out = pandas.DataFrame(
+            out_values, index=pandas.Index(index), dtype=object
+        )
         return df_out, skip_messages
 
-    def extract(self, df, extract_cfg_or_path, apply_after_read_func=True):
+    def extract(
+        self,
+        df,
+        extract_cfg_or_path,
+        apply_after_read_func=True,
+        df_is_clean=False,
+    ):
         """
         Apply the operations in an extract config to the DataFrame to
         produce a clean DataFrame with columns mapped to the standard
@@ -266,6 +293,12 @@ class Extractor(object):
         :param extract_cfg_or_path: either the ExtractConfig object or path to the
         extract config so the ExtractConfig object can be instantiated
         :type extract_cfg_or_path: str or ExtractConfig
+        :param apply_after_read_func: whether to call the extract config's
+        do_after_read function on df before extracting
+        :type apply_after_read_func: bool
+        :param df_is_clean: df has already been through clean_up_df, so don't
+        clean it again
+        :type df_is_clean: bool
 
         :returns: the extracted pandas.DataFrame
         """
@@ -286,9 +319,6 @@ class Extractor(object):
 
         extract_config = self.extract_config
 
-        # Clean df
-        df_in = clean_up_df(df)
-
         # Optionally post-process df
         if apply_after_read_func and extract_config.do_after_read:
             self.logger.info("Calling custom do_after_read function.")
@@ -299,6 +329,11 @@ class Extractor(object):
                 raise ConfigValidationError(
                     "Source DataFrame is empty. Check your do_after_read function"
                 )
+        elif df_is_clean:
+            df_in = df
+        else:
+            # Clean df
+            df_in = clean_up_df(df)
 
         # Describe Dataframe
         self.logger.debug(f"Read DataFrame with dimensions {df_in.shape}")
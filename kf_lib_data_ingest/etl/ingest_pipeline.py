@@ -11,7 +11,16 @@ from kf_lib_data_ingest.common.warehousing import (
     init_project_db,
     persist_df_to_project_db,
 )
-from kf_lib_data_ingest.config import DEFAULT_TARGET_URL, VERSION
+from kf_lib_data_ingest.config import (
+    DEFAULT_ASYNC_LOAD_CONCURRENCY,
+    DEFAULT_DOWNLOAD_CACHE_DIR,
+    DEFAULT_LOAD_WORKERS,
+    DEFAULT_STAGE_CACHE_FORMAT,
+    DEFAULT_SUBMIT_BATCH_SIZE,
+    DEFAULT_TARGET_URL,
+    DEFAULT_UID_CACHE_SYNCHRONOUS,
+    VERSION,
+)
 from kf_lib_data_ingest.etl.configuration.ingest_package_config import (
     IngestPackageConfig,
 )
@@ -64,6 +73,17 @@ class DataIngestPipeline(object):
         validation_mode=None,
         clear_cache=False,
         query_url="",
+        extract_workers=1,
+        use_download_cache=False,
+        stage_cache_format=DEFAULT_STAGE_CACHE_FORMAT,
+        incremental_extract=False,
+        load_workers=DEFAULT_LOAD_WORKERS,
+        async_concurrency=DEFAULT_ASYNC_LOAD_CONCURRENCY,
+        submit_batch_size=DEFAULT_SUBMIT_BATCH_SIZE,
+        uid_cache_synchronous=DEFAULT_UID_CACHE_SYNCHRONOUS,
+        compress_sent_messages=False,
+        force_update=False,
+        adaptive_concurrency=False,
     ):
         """
         Set up data ingest pipeline. Create the config object and logger
@@ -92,6 +112,47 @@ class DataIngestPipeline(object):
         :type clear_cache: bool, optional
         :param query_url: Alternative API query URL instead of asking the load target
         :type query_url: str, optional
+        :param extract_workers: Number of worker processes used to run the
+            extract configs in parallel, defaults to 1 (sequential)
+        :type extract_workers: int, optional
+        :param use_download_cache: Whether to keep source files in a
+            persistent cache and skip downloading them again when they haven't
+            changed, defaults to False
+        :type use_download_cache: bool, optional
+        :param stage_cache_format: File format of the DataFrames that the
+            extract and transform stages write to their output directories,
+            defaults to DEFAULT_STAGE_CACHE_FORMAT
+        :type stage_cache_format: str, optional
+        :param incremental_extract: Whether to reuse the cached output of
+            extract configs whose config file, source data, and read
+            parameters haven't changed since the last run, defaults to False
+        :type incremental_extract: bool, optional
+        :param load_workers: Number of threads used to send entities to the
+            target service when use_async is set, defaults to
+            DEFAULT_LOAD_WORKERS
+        :type load_workers: int, optional
+        :param async_concurrency: Maximum number of entities in flight at once
+            when use_async loads with coroutines, defaults to
+            DEFAULT_ASYNC_LOAD_CONCURRENCY
+        :type async_concurrency: int, optional
+        :param submit_batch_size: Maximum number of entities sent together to
+            target service plugins that support submit_batch, defaults to
+            DEFAULT_SUBMIT_BATCH_SIZE
+        :type submit_batch_size: int, optional
+        :param uid_cache_synchronous: SQLite synchronous setting for the
+            target identifier cache, defaults to DEFAULT_UID_CACHE_SYNCHRONOUS
+        :type uid_cache_synchronous: str, optional
+        :param compress_sent_messages: Whether to gzip the file of messages
+            sent to the target service, defaults to False
+        :type compress_sent_messages: bool, optional
+        :param force_update: Whether to send entities to the target service
+            even if they haven't changed since they were last sent, defaults
+            to False
+        :type force_update: bool, optional
+        :param adaptive_concurrency: Whether to adjust how many entities are
+            sent to the target service at once to what it can handle,
+            defaults to False
+        :type adaptive_concurrency: bool, optional
         """
 
         assert_safe_type(ingest_package_config_path, str)
@@ -108,6 +169,17 @@ class DataIngestPipeline(object):
         assert_safe_type(validation_mode, None, str)
         assert_safe_type(clear_cache, bool)
         assert_safe_type(query_url, str)
+        assert_safe_type(extract_workers, int)
+        assert_safe_type(use_download_cache, bool)
+        assert_safe_type(stage_cache_format, str)
+        assert_safe_type(incremental_extract, bool)
+        assert_safe_type(load_workers, int)
+        assert_safe_type(async_concurrency, int)
+        assert_safe_type(submit_batch_size, int)
+        assert_safe_type(uid_cache_synchronous, str)
+        assert_safe_type(compress_sent_messages, bool)
+        assert_safe_type(force_update, bool)
+        assert_safe_type(adaptive_concurrency, bool)
         stages_to_run_str = stages_to_run_str.lower()
         self._validate_stages_to_run_str(stages_to_run_str)
 
@@ -132,6 +204,17 @@ class DataIngestPipeline(object):
         self.validation_mode = validation_mode
         self.clear_cache = clear_cache
         self.query_url = query_url
+        self.extract_workers = extract_workers
+        self.use_download_cache = use_download_cache
+        self.stage_cache_format = stage_cache_format
+        self.incremental_extract = incremental_extract
+        self.load_workers = load_workers
+        self.async_concurrency = async_concurrency
+        self.submit_batch_size = submit_batch_size
+        self.uid_cache_synchronous = uid_cache_synchronous
+        self.compress_sent_messages = compress_sent_messages
+        self.force_update = force_update
+        self.adaptive_concurrency = adaptive_concurrency
 
         # Get log params from ingest_package_config
         log_dir = log_dir or self.data_ingest_config.log_dir
@@ -196,6 +279,12 @@ class DataIngestPipeline(object):
             self.ingest_output_dir,
             self.data_ingest_config.extract_config_dir,
             self.auth_configs,
+            extract_workers=self.extract_workers,
+            download_cache_dir=(
+                DEFAULT_DOWNLOAD_CACHE_DIR if self.use_download_cache else None
+            ),
+            stage_cache_format=self.stage_cache_format,
+            incremental=self.incremental_extract,
         )
 
         # Transform stage #####################################################
@@ -217,7 +306,11 @@ class DataIngestPipeline(object):
                 "to continue."
             )
         else:
-            yield GuidedTransformStage(transform_fp, self.ingest_output_dir)
+            yield GuidedTransformStage(
+                transform_fp,
+                self.ingest_output_dir,
+                stage_cache_format=self.stage_cache_format,
+            )
 
         # Load stage ##########################################################
 
@@ -232,6 +325,13 @@ class DataIngestPipeline(object):
             resume_from=self.resume_from,
             clear_cache=self.clear_cache,
             query_url=self.query_url,
+            load_workers=self.load_workers,
+            async_concurrency=self.async_concurrency,
+            submit_batch_size=self.submit_batch_size,
+            uid_cache_synchronous=self.uid_cache_synchronous,
+            compress_sent_messages=self.compress_sent_messages,
+            force_update=self.force_update,
+            adaptive_concurrency=self.adaptive_concurrency,
         )
 
     def run(self):
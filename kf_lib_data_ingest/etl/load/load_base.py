@@ -4,35 +4,179 @@ merged source data into complete message payloads according to a given API
 specification, and then sends those messages to the target server.
 """
 
+import ast
+import asyncio
 import concurrent.futures
+import hashlib
+import inspect
 import json
 import os
 import sqlite3
+import textwrap
+import time
 from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from pprint import pformat
-from threading import Lock, current_thread, main_thread
+from threading import Event, Lock, Thread, current_thread, main_thread
 from urllib.parse import urlparse
 
 from kf_lib_data_ingest.common.concept_schema import CONCEPT
-from kf_lib_data_ingest.common.errors import InvalidIngestStageParameters
+from kf_lib_data_ingest.common.errors import (
+    InvalidIngestStageParameters,
+    SubmitBatchError,
+)
+from kf_lib_data_ingest.common.io import open_json_lines
 from kf_lib_data_ingest.common.misc import multisplit
 from kf_lib_data_ingest.common.stage import IngestStage
 from kf_lib_data_ingest.common.type_safety import (
     assert_all_safe_type,
     assert_safe_type,
 )
-from kf_lib_data_ingest.config import DEFAULT_ID_CACHE_FILENAME
+from kf_lib_data_ingest.config import (
+    DEFAULT_ASYNC_LOAD_CONCURRENCY,
+    DEFAULT_HTTP_POOL_SIZE,
+    DEFAULT_ID_CACHE_FILENAME,
+    DEFAULT_LOAD_WORKERS,
+    DEFAULT_SUBMIT_BATCH_SIZE,
+    DEFAULT_UID_CACHE_SYNCHRONOUS,
+    LOAD_RECORDS_IN_FLIGHT_PER_WORKER,
+    UID_CACHE_FLUSH_SECONDS,
+    UID_CACHE_FLUSH_SIZE,
+    UID_CACHE_SYNCHRONOUS_MODES,
+)
 from kf_lib_data_ingest.etl.configuration.base_config import (
     ConfigValidationError,
 )
 from kf_lib_data_ingest.etl.configuration.target_api_config import (
     TargetAPIConfig,
 )
+from kf_lib_data_ingest.network.utils import (
+    configure_http_session,
+    http_session_stats,
+    open_async_http_session,
+)
+from kf_lib_data_ingest.network.throttle import (
+    AdaptiveConcurrencyLimiter,
+    set_rate_limiter,
+)
 from pandas import DataFrame
 
 count_lock = Lock()
 cache_lock = Lock()
 
+# {(what, entity class, record id): result} for the record being loaded by the
+# current thread or coroutine
+record_resolutions = ContextVar("record_resolutions", default=None)
+
+
+def _body_hash(body, target_id=None):
+    """
+    Fingerprint the content of an entity body, so that entities that haven't
+    changed since they were last sent don't have to be sent again.
+
+    Bodies may carry the entity's own target ID, which is empty when the
+    entity is first created and filled in every time after that, so fields
+    holding it are hashed as if they were empty.
+
+    :param body: entity body built by the target API plugin
+    :type body: dict
+    :param target_id: the entity's own target ID, if it has one
+    :type target_id: str, optional
+    :return: hex digest
+    :rtype: str
+    """
+    if target_id:
+        body = {
+            k: (None if isinstance(v, str) and (v == target_id) else v)
+            for k, v in body.items()
+        }
+    return hashlib.sha1(
+        json.dumps(body, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _referenced_names(func, seen):
+    """
+    Collect the names used in the source code of a function and of the
+    functions from the same module that it uses.
+
+    :return: set of names, or None if some source code could not be found
+    """
+    seen.add(func)
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+
+    for name in list(names):
+        helper = func.__globals__.get(name)
+        if (
+            inspect.isfunction(helper)
+            and (helper.__globals__ is func.__globals__)
+            and (helper not in seen)
+        ):
+            helper_names = _referenced_names(helper, seen)
+            if helper_names is None:
+                return None
+            names |= helper_names
+    return names
+
+
+def _class_referenced_names(cls):
+    """
+    Collect the names used in the source code of a class's methods, including
+    inherited ones.
+
+    :return: set of names, or None if some source code could not be found
+    """
+    names = set()
+    seen = set()
+    for klass in inspect.getmro(cls)[:-1]:  # skip object
+        for attr in vars(klass).values():
+            func = getattr(attr, "__func__", attr)
+            if inspect.isfunction(func) and (func not in seen):
+                func_names = _referenced_names(func, seen)
+                if func_names is None:
+                    return None
+                names |= func_names
+    return names
+
+
+def find_target_dependencies(target_classes):
+    """
+    Work out which target classes must be loaded before each target class.
+
+    A class depends on the other target classes named in its methods, e.g.
+    the ones that its get_key_components and build_entity methods look up
+    with get_target_id_from_record, including through helper functions in the
+    same module. Only classes earlier in the load order count, and a class
+    whose source code can't be inspected depends on all earlier classes.
+
+    :param target_classes: target classes in the order to be loaded
+    :type target_classes: list
+    :return: dict mapping each class to the set of classes it depends on
+    :rtype: dict
+    """
+    dependencies = {}
+    for i, entity_class in enumerate(target_classes):
+        earlier = target_classes[:i]
+        names = _class_referenced_names(entity_class)
+        if names is None:
+            dependencies[entity_class] = set(earlier)
+        else:
+            dependencies[entity_class] = {
+                c for c in earlier if c.__name__ in names
+            }
+    return dependencies
+
 
 class LoadStageBase(IngestStage):
     def __init__(
@@ -46,6 +190,13 @@ class LoadStageBase(IngestStage):
         dry_run=False,
         resume_from=None,
         clear_cache=False,
+        load_workers=DEFAULT_LOAD_WORKERS,
+        async_concurrency=DEFAULT_ASYNC_LOAD_CONCURRENCY,
+        submit_batch_size=DEFAULT_SUBMIT_BATCH_SIZE,
+        uid_cache_synchronous=DEFAULT_UID_CACHE_SYNCHRONOUS,
+        compress_sent_messages=False,
+        force_update=False,
+        adaptive_concurrency=False,
     ):
         """
         :param target_api_config_path: path to the target service API config
@@ -58,7 +209,10 @@ class LoadStageBase(IngestStage):
         :type project_id: str
         :param cache_dir: where to find the ID cache, defaults to None
         :type cache_dir: str, optional
-        :param use_async: use asynchronous networking, defaults to False
+        :param use_async: use asynchronous networking, defaults to False.
+            This also loads entity types that don't depend on each other at
+            the same time. Plugins whose entity classes define async_submit
+            are loaded with coroutines instead of threads.
         :type use_async: bool, optional
         :param dry_run: don't actually transmit, defaults to False
         :type dry_run: bool, optional
@@ -70,8 +224,53 @@ class LoadStageBase(IngestStage):
             defaults to False. Equivalent to deleting the file manually. Ignored
             when using resume_from, because that needs the cache to be effective.
         :type clear_cache: bool, optional
+        :param load_workers: number of threads that send entities to the
+            target service when using use_async, defaults to
+            DEFAULT_LOAD_WORKERS. Every entity class shares these threads, and
+            only a few records per thread are queued at any time.
+        :type load_workers: int, optional
+        :param async_concurrency: maximum number of records in flight at once
+            when using use_async with a plugin whose entity classes define
+            async_submit, defaults to DEFAULT_ASYNC_LOAD_CONCURRENCY
+        :type async_concurrency: int, optional
+        :param submit_batch_size: maximum number of entities sent together
+            to entity classes that define submit_batch, defaults to
+            DEFAULT_SUBMIT_BATCH_SIZE
+        :type submit_batch_size: int, optional
+        :param uid_cache_synchronous: SQLite synchronous setting for the
+            identifier cache, one of UID_CACHE_SYNCHRONOUS_MODES, defaults to
+            DEFAULT_UID_CACHE_SYNCHRONOUS. See _flush_uid_cache for what can
+            be lost in a crash.
+        :type uid_cache_synchronous: str, optional
+        :param compress_sent_messages: gzip the sent messages file, defaults
+            to False
+        :type compress_sent_messages: bool, optional
+        :param force_update: send entities to the target service even if
+            their bodies haven't changed since they were last sent, defaults
+            to False
+        :type force_update: bool, optional
+        :param adaptive_concurrency: adjust how many entities are sent at
+            once to what the target service can handle, and wait when it
+            asks to with Retry-After, defaults to False. load_workers or
+            async_concurrency is then the most that are sent at once. See
+            network.throttle.AdaptiveConcurrencyLimiter.
+        :type adaptive_concurrency: bool, optional
         """
         super().__init__(cache_dir or os.getcwd())
+        assert_safe_type(load_workers, int)
+        if load_workers < 1:
+            raise ValueError("load_workers must be at least 1")
+        assert_safe_type(async_concurrency, int)
+        if async_concurrency < 1:
+            raise ValueError("async_concurrency must be at least 1")
+        assert_safe_type(submit_batch_size, int)
+        if submit_batch_size < 1:
+            raise ValueError("submit_batch_size must be at least 1")
+        if uid_cache_synchronous not in UID_CACHE_SYNCHRONOUS_MODES:
+            raise ValueError(
+                "uid_cache_synchronous must be one of"
+                f" {UID_CACHE_SYNCHRONOUS_MODES}"
+            )
         self.target_api_config = TargetAPIConfig(target_api_config_path)
         self._validate_entities(
             entities_to_load,
@@ -83,8 +282,26 @@ class LoadStageBase(IngestStage):
         self.resume_from = resume_from
         self.project_id = project_id
         self.use_async = use_async
+        self.load_workers = load_workers
+        self.async_concurrency = async_concurrency
+        self.submit_batch_size = submit_batch_size
+        self.force_update = force_update
+        self.adaptive_concurrency = adaptive_concurrency
+        self.rate_limiter = None
         self._dry_id = 0
 
+        # Every message sent is written to this JSON Lines file as it's sent
+        self.sent_messages_filepath = os.path.join(
+            self.stage_cache_dir,
+            f"SentMessages_{self._clean_name(target_url)}.jsonl"
+            + (".gz" if compress_sent_messages else ""),
+        )
+        self._sent_messages_file = None
+
+        if use_async and load_workers > DEFAULT_HTTP_POOL_SIZE:
+            # Keep a connection per thread instead of reconnecting
+            configure_http_session(pool_size=load_workers)
+
         self.uid_cache_filepath = os.path.join(
             self.stage_cache_dir,
             #  Every target gets its own cache because they don't share UIDs
@@ -105,13 +322,26 @@ class LoadStageBase(IngestStage):
                 f"{self.uid_cache_filepath} has been cleared."
             )
 
-        # Two-stage (RAM + disk) cache
-        self.uid_cache = defaultdict(dict)
+        # Two-stage (RAM + disk) cache. cache_lock guards the database and
+        # the write buffer, and each RAM table has its own lock for changes.
+        self.uid_cache = {}
+        # {entity type: {unique key: hash of the body last sent}}
+        self.body_hash_cache = {}
+        self._uid_table_locks = {}
         self.uid_cache_db = sqlite3.connect(
             self.uid_cache_filepath,
             isolation_level=None,
             check_same_thread=False,
         )
+        self.uid_cache_db.execute("PRAGMA journal_mode=WAL;")
+        self.uid_cache_db.execute(
+            f"PRAGMA synchronous={uid_cache_synchronous};"
+        )
+        # {entity type: {unique key: (target ID, body hash)}} not yet written
+        # to the db
+        self._unsaved_uids = defaultdict(dict)
+        self._unsaved_uid_count = 0
+        self._last_uid_flush = time.monotonic()
 
     def _clean_name(self, target_url):
         target = urlparse(target_url).netloc or urlparse(target_url).path
@@ -156,25 +386,73 @@ class LoadStageBase(IngestStage):
             "Your transform module output has invalid keys:",
         )
 
-    def _prime_uid_cache(self, entity_type):
+    def _uid_table(self, entity_type):
         """
-        Make sure that the backing cache database table exists and that the RAM
-        store is populated.
+        Get the RAM store of target IDs for one type of entity, populating it
+        from the cache database the first time. Once a table exists, reading
+        it needs no locks.
 
         :param entity_type: the name of this type of entity
         :type entity_type: str
+        :return: {source unique key: target service ID}
+        :rtype: dict
         """
-        if entity_type not in self.uid_cache:
-            # Create table in DB first if necessary
-            self.uid_cache_db.execute(
-                f'CREATE TABLE IF NOT EXISTS "{entity_type}"'
-                " (unique_id TEXT PRIMARY KEY, target_id TEXT);"
-            )
-            # Populate RAM cache from DB
-            for unique_id, target_id in self.uid_cache_db.execute(
-                f'SELECT unique_id, target_id FROM "{entity_type}";'
-            ):
-                self.uid_cache[entity_type][unique_id] = target_id
+        table = self.uid_cache.get(entity_type)
+        if table is None:
+            with self._uid_table_lock(entity_type):
+                table = self.uid_cache.get(entity_type)
+                if table is None:
+                    with cache_lock:
+                        # Create table in DB first if necessary
+                        self.uid_cache_db.execute(
+                            f'CREATE TABLE IF NOT EXISTS "{entity_type}"'
+                            " (unique_id TEXT PRIMARY KEY, target_id TEXT,"
+                            " body_hash TEXT);"
+                        )
+                        # Caches from before body hashes need the column
+                        columns = [
+                            c[1]
+                            for c in self.uid_cache_db.execute(
+                                f'PRAGMA table_info("{entity_type}");'
+                            )
+                        ]
+                        if "body_hash" not in columns:
+                            self.uid_cache_db.execute(
+                                f'ALTER TABLE "{entity_type}"'
+                                " ADD COLUMN body_hash TEXT;"
+                            )
+                        # Populate RAM cache from DB
+                        rows = self.uid_cache_db.execute(
+                            "SELECT unique_id, target_id, body_hash"
+                            f' FROM "{entity_type}";'
+                        )
+                        table = {}
+                        hashes = {}
+                        for key, target_id, body_hash in rows:
+                            table[key] = target_id
+                            if body_hash:
+                                hashes[key] = body_hash
+                    self.body_hash_cache[entity_type] = hashes
+                    self.uid_cache[entity_type] = table
+        return table
+
+    def _uid_table_lock(self, entity_type):
+        """
+        Get the lock that serializes changes to one type of entity's RAM
+        store of target IDs.
+        """
+        return self._uid_table_locks.setdefault(entity_type, Lock())
+
+    def _prime_uid_cache(self, entity_types):
+        """
+        Make sure that the backing cache database tables exist and that the
+        RAM stores are populated.
+
+        :param entity_types: names of types of entities
+        :type entity_types: list
+        """
+        for entity_type in entity_types:
+            self._uid_table(entity_type)
 
     def _get_target_id_from_key(self, entity_type, entity_key):
         """
@@ -185,12 +463,22 @@ class LoadStageBase(IngestStage):
         :param entity_key: source unique key for this entity
         :type entity_key: str
         """
-        with cache_lock:
-            self._prime_uid_cache(entity_type)
-            return self.uid_cache[entity_type].get(entity_key)
+        return self._uid_table(entity_type).get(entity_key)
+
+    def _get_body_hash_from_key(self, entity_type, entity_key):
+        """
+        Retrieve the hash of the body last sent for a given source unique key.
+
+        :param entity_type: the name of this type of entity
+        :type entity_type: str
+        :param entity_key: source unique key for this entity
+        :type entity_key: str
+        """
+        self._uid_table(entity_type)
+        return self.body_hash_cache[entity_type].get(entity_key)
 
     def _store_target_id_for_key(
-        self, entity_type, entity_key, target_id, no_db
+        self, entity_type, entity_key, target_id, no_db, body_hash=None
     ):
         """
         Cache the relationship between a source unique key and its corresponding
@@ -204,18 +492,165 @@ class LoadStageBase(IngestStage):
         :type target_id: str
         :param no_db: only store in the RAM cache, not in the db
         :type no_db: bool
+        :param body_hash: hash of the body that was sent for this entity,
+            defaults to None
+        :type body_hash: str, optional
         """
-        with cache_lock:
-            self._prime_uid_cache(entity_type)
-            if self.uid_cache[entity_type].get(entity_key) != target_id:
-                self.uid_cache[entity_type][entity_key] = target_id
-                if not no_db:
-                    self.uid_cache_db.execute(
+        self._store_target_ids_for_keys(
+            entity_type,
+            {entity_key: target_id},
+            no_db,
+            body_hashes=({entity_key: body_hash} if body_hash else None),
+        )
+
+    def _store_target_ids_for_keys(
+        self, entity_type, target_ids, no_db, body_hashes=None
+    ):
+        """
+        Cache the target service IDs for many source unique keys at once.
+        Writes to the database are buffered, see _flush_uid_cache.
+
+        Keys without a new body hash keep their old one unless their target
+        ID changed.
+
+        :param entity_type: the name of this type of entity
+        :type entity_type: str
+        :param target_ids: {source unique key: target service ID}
+        :type target_ids: dict
+        :param no_db: only store in the RAM cache, not in the db
+        :type no_db: bool
+        :param body_hashes: {source unique key: hash of the body sent},
+            defaults to None
+        :type body_hashes: dict, optional
+        """
+        table = self._uid_table(entity_type)
+        hashes = self.body_hash_cache[entity_type]
+        body_hashes = body_hashes or {}
+        with self._uid_table_lock(entity_type):
+            changed = {}
+            for k, v in target_ids.items():
+                if k in body_hashes:
+                    h = body_hashes[k]
+                elif table.get(k) == v:
+                    continue
+                else:
+                    h = None
+                if (table.get(k) != v) or (hashes.get(k) != h):
+                    changed[k] = (v, h)
+            for k, (v, h) in changed.items():
+                table[k] = v
+                if h:
+                    hashes[k] = h
+                else:
+                    hashes.pop(k, None)
+            if changed and not no_db:
+                with cache_lock:
+                    self._unsaved_uids[entity_type].update(changed)
+                    self._unsaved_uid_count += len(changed)
+                    if (self._unsaved_uid_count >= UID_CACHE_FLUSH_SIZE) or (
+                        time.monotonic() - self._last_uid_flush
+                        >= UID_CACHE_FLUSH_SECONDS
+                    ):
+                        self._write_unsaved_uids()
+
+    def _write_unsaved_uids(self):
+        """
+        Write the buffered identifier cache entries to the database in one
+        transaction. Must be called with cache_lock held.
+        """
+        if self._unsaved_uids:
+            self.uid_cache_db.execute("BEGIN")
+            try:
+                for entity_type, target_ids in self._unsaved_uids.items():
+                    self.uid_cache_db.executemany(
                         f'INSERT OR REPLACE INTO "{entity_type}"'
-                        " (unique_id, target_id)"
-                        " VALUES (?,?);",
-                        (entity_key, target_id),
+                        " (unique_id, target_id, body_hash)"
+                        " VALUES (?,?,?);",
+                        ((k, v, h) for k, (v, h) in target_ids.items()),
                     )
+            except BaseException:
+                self.uid_cache_db.execute("ROLLBACK")
+                raise
+            self.uid_cache_db.execute("COMMIT")
+            self._unsaved_uids.clear()
+            self._unsaved_uid_count = 0
+        self._last_uid_flush = time.monotonic()
+
+    def _flush_uid_cache(self):
+        """
+        Write any buffered identifier cache entries to the database.
+
+        Entries are buffered until UID_CACHE_FLUSH_SIZE of them are waiting
+        or UID_CACHE_FLUSH_SECONDS have passed, even while loading is stalled
+        (see _flush_uid_cache_periodically). They are also flushed whenever an
+        entity class finishes loading and when _run ends, including when it
+        ends with an exception.
+
+        If the process is killed instead, the target IDs of up to
+        UID_CACHE_FLUSH_SIZE entities of the classes that were still loading
+        can be missing from the cache. Loading again finds those entities
+        with query_target_ids. So does resume_from with plugins that define
+        query_target_ids, which are asked for the keys that miss the cache
+        while walking to the resume target. With other plugins, resume_from
+        is only safe from the first entity of the classes that were still
+        loading. With synchronous=OFF, a power failure can also lose or
+        corrupt committed entries.
+        """
+        with cache_lock:
+            self._write_unsaved_uids()
+
+    def _flush_uid_cache_periodically(self, stop):
+        """
+        Flush buffered identifier cache entries once they are
+        UID_CACHE_FLUSH_SECONDS old, until stop is set. Storing an entry only
+        checks its age when the entry is stored, which doesn't happen while
+        loading is stalled.
+
+        :param stop: set to end the loop
+        :type stop: threading.Event
+        """
+        while not stop.wait(UID_CACHE_FLUSH_SECONDS):
+            with cache_lock:
+                if (
+                    time.monotonic() - self._last_uid_flush
+                    >= UID_CACHE_FLUSH_SECONDS
+                ):
+                    self._write_unsaved_uids()
+
+    @contextmanager
+    def _resolving_record(self):
+        """
+        Remember the keys and target IDs resolved while loading one record, so
+        that the entity, its key, and the keys of all of its parents are each
+        only built once. Must not span more than one record's load, because
+        the target IDs of entities loaded afterwards would be stale.
+        """
+        token = record_resolutions.set({})
+        try:
+            yield
+        finally:
+            record_resolutions.reset(token)
+
+    def _resolve_once(self, what, entity_class, record, resolve):
+        """
+        Call resolve() for the entity class and record, or reuse its result if
+        it was already resolved while loading the current record.
+
+        :param what: name for what resolve() finds
+        :type what: str
+        :param resolve: function of no arguments that does the work
+        :type resolve: function
+        """
+        resolved = record_resolutions.get()
+        if resolved is None:
+            return resolve()
+        # The record is kept with the result because plugins pass temporary
+        # dicts, and a freed dict's id can be reused by the next one
+        memo_key = (what, entity_class, id(record))
+        memo = resolved.get(memo_key)
+        if (memo is None) or (memo[0] is not record):
+            memo = resolved[memo_key] = (record, resolve())
+        return memo[1]
 
     def _get_target_id_from_record(self, entity_class, record):
         """
@@ -242,15 +677,56 @@ class LoadStageBase(IngestStage):
         """Shim for target API entity building across loader versions"""
         raise NotImplementedError()
 
+    def _prefetch_target_ids(self, entity_classes):
+        """
+        Fill the identifier cache with the target service IDs of existing
+        entities before loading, for plugins that can list them in bulk.
+
+        :param entity_classes: classes about to be loaded
+        :type entity_classes: list
+        """
+        pass
+
+    def _supports_batch(self, entity_class):
+        """
+        Whether the target API plugin can submit several entities of the
+        given class at once.
+        """
+        return False
+
+    def _do_target_submit_batch(self, entity_class, bodies):
+        """Shim for target API batch submission"""
+        raise NotImplementedError()
+
+    def _supports_asyncio(self, entity_classes):
+        """
+        Whether the target API plugin can load all of the given entity
+        classes with coroutines instead of threads.
+        """
+        return False
+
+    async def _async_get_target_id_from_record(
+        self, entity_class, record, session
+    ):
+        """Coroutine version of _get_target_id_from_record"""
+        raise NotImplementedError()
+
+    async def _do_target_async_submit(self, entity_class, body, session):
+        """Shim for asynchronous target API submission"""
+        raise NotImplementedError()
+
     def _read_output(self):
         pass  # TODO
 
     def _write_output(self, output):
         pass  # TODO
 
-    def _load_entity(self, entity_class, record):
+    def _new_entity_key(self, entity_class, record):
         """
-        Prepare a single entity for submission to the target service.
+        Build the unique key for a record, unless it can't be built or an
+        entity with the same key was already loaded.
+
+        :return: the unique key string, or None to skip the record
         """
         try:
             key_components = self._do_target_get_key(entity_class, record)
@@ -273,7 +749,7 @@ class LoadStageBase(IngestStage):
                 f"Failed to construct unique key from record:"
                 f"\n{pformat(record)}"
             )
-            return
+            return None
 
         unique_key = str(key_components)
         if unique_key in self.seen_entities[entity_class.class_name]:
@@ -282,11 +758,21 @@ class LoadStageBase(IngestStage):
                 f"Skip {entity_class.class_name}. Duplicate record found in "
                 f"data:\n{record}"
             )
-            return
+            return None
 
         self.seen_entities[entity_class.class_name].add(unique_key)
+        return unique_key
+
+    def _build_request(self, entity_class, record, unique_key, target_id):
+        """
+        Build the entity body for a record and work out what to do with it.
+        Entities whose body is the same as the one last sent for them are
+        UNCHANGED and don't need to be sent again, unless force_update is set.
 
-        target_id = self._get_target_id_from_record(entity_class, record)
+        :return: the method name, the entity body, its hash, and the log
+            message
+        :rtype: tuple
+        """
         method = "UPDATE" if target_id else "CREATE"
 
         try:
@@ -303,10 +789,10 @@ class LoadStageBase(IngestStage):
         if self.resume_from:
             if not target_id:
                 raise InvalidIngestStageParameters(
-                    "Use of the resume_from flag requires having already"
-                    " cached target IDs for all prior entities. The resume"
-                    " target has not yet been reached, and no cached ID"
-                    f" was found for this entity body:\n{pformat(body)}"
+                    "Use of the resume_from flag requires target IDs for"
+                    " all prior entities. The resume target has not yet"
+                    " been reached, and no target ID was found for this"
+                    f" entity body:\n{pformat(body)}"
                 )
             elif target_id.startswith(self.resume_from):
                 self.logger.info(
@@ -316,45 +802,494 @@ class LoadStageBase(IngestStage):
                 self.dry_run = False
                 self.resume_from = None
 
-        msg = f"{method} {entity_class.class_name} ({unique_key})"
+        class_name = entity_class.class_name
+        body_hash = _body_hash(body, target_id)
+        last_sent = (
+            self._get_target_id_from_key(class_name, unique_key),
+            self._get_body_hash_from_key(class_name, unique_key),
+        )
+        if (
+            target_id
+            and (not self.force_update)
+            and (last_sent == (target_id, body_hash))
+        ):
+            method = "UNCHANGED"
+
+        msg = f"{method} {class_name} ({unique_key})"
         if target_id:
             msg = f"{msg} [{target_id}]"
 
-        if self.dry_run:
-            self.logger.debug(f"Request body preview:\n{pformat(body)}")
-            msg = f"DRY RUN - {msg}"
-            if not target_id:
+        return method, body, body_hash, msg
+
+    @contextmanager
+    def _submit_slot(self):
+        """
+        Wait for the rate limiter, if any, to allow sending to the target
+        service.
+        """
+        if self.rate_limiter:
+            with self.rate_limiter.slot():
+                yield
+        else:
+            yield
+
+    @asynccontextmanager
+    async def _async_submit_slot(self):
+        """Coroutine version of _submit_slot"""
+        if self.rate_limiter:
+            async with self.rate_limiter.async_slot():
+                yield
+        else:
+            yield
+
+    def _dry_run_target_id(self, entity_class, body, target_id):
+        """
+        Stand in for submitting an entity when dry running.
+
+        :return: the known target ID, or a made up one for a new entity
+        :rtype: str
+        """
+        self.logger.debug(f"Request body preview:\n{pformat(body)}")
+        if not target_id:
+            with count_lock:
                 self._dry_id += 1
                 target_id = f"DRY_{entity_class.class_name}_{self._dry_id}"
-        else:
-            # send to the target service
-            target_id = self._do_target_submit(entity_class, body)
-            msg = f"{msg} --> {target_id}"
+        return target_id
 
+    def _record_loaded(
+        self, entity_class, unique_key, method, body, body_hash, target_id, msg
+    ):
+        """
+        Cache the target ID and body hash of a loaded entity and log what was
+        sent.
+        """
         # cache source_ID:target_ID lookup
         self._store_target_id_for_key(
-            entity_class.class_name, unique_key, target_id, self.dry_run
+            entity_class.class_name,
+            unique_key,
+            target_id,
+            self.dry_run,
+            body_hash=body_hash,
         )
 
         # log action
+        message = json.dumps(
+            {"type": entity_class.class_name, "method": method, "body": body}
+        )
         with count_lock:
-            self.sent_messages.append(
-                {
-                    "type": entity_class.class_name,
-                    "method": method,
-                    "body": body,
-                }
+            self._sent_messages_file.write(message + "\n")
+            self._sent_messages_file.flush()
+            self._log_counted(entity_class, method, msg)
+
+    def _record_unchanged(self, entity_class, msg):
+        """
+        Count and log an entity that didn't need to be sent again.
+        """
+        with count_lock:
+            self._log_counted(entity_class, "UNCHANGED", msg)
+
+    def _log_counted(self, entity_class, method, msg):
+        """
+        Count and log an entity. Must be called with count_lock held.
+        """
+        self.counts[entity_class.class_name][method] += 1
+        self.logger.info(
+            f"{msg} (#{sum(self.counts[entity_class.class_name].values())})"
+        )
+
+    def _load_entity(self, entity_class, record):
+        """
+        Prepare a single entity for submission to the target service.
+        """
+        with self._resolving_record():
+            unique_key = self._new_entity_key(entity_class, record)
+            if unique_key is None:
+                return
+
+            target_id = self._get_target_id_from_record(entity_class, record)
+            method, body, body_hash, msg = self._build_request(
+                entity_class, record, unique_key, target_id
             )
-            self.counts[entity_class.class_name][method] += 1
-            self.logger.info(
-                f"{msg} (#{sum(self.counts[entity_class.class_name].values())})"
+
+        if method == "UNCHANGED":
+            self._record_unchanged(entity_class, msg)
+            return
+
+        if self.dry_run:
+            target_id = self._dry_run_target_id(entity_class, body, target_id)
+            msg = f"DRY RUN - {msg}"
+        else:
+            # send to the target service
+            with self._submit_slot():
+                target_id = self._do_target_submit(entity_class, body)
+            msg = f"{msg} --> {target_id}"
+
+        self._record_loaded(
+            entity_class, unique_key, method, body, body_hash, target_id, msg
+        )
+
+    def _load_batch(self, entity_class, records):
+        """
+        Like _load_entity, but for several records of the same entity class
+        that are sent to the target service together. Entities that the
+        target service accepts are cached and logged even if others in the
+        same batch fail.
+
+        :raises SubmitBatchError: if the target service rejects any entities
+        """
+        to_submit = []
+        for record in records:
+            with self._resolving_record():
+                unique_key = self._new_entity_key(entity_class, record)
+                if unique_key is None:
+                    continue
+
+                target_id = self._get_target_id_from_record(
+                    entity_class, record
+                )
+                method, body, body_hash, msg = self._build_request(
+                    entity_class, record, unique_key, target_id
+                )
+
+            if method == "UNCHANGED":
+                self._record_unchanged(entity_class, msg)
+            elif self.dry_run:
+                target_id = self._dry_run_target_id(
+                    entity_class, body, target_id
+                )
+                self._record_loaded(
+                    entity_class,
+                    unique_key,
+                    method,
+                    body,
+                    body_hash,
+                    target_id,
+                    f"DRY RUN - {msg}",
+                )
+            else:
+                to_submit.append((unique_key, method, body, body_hash, msg))
+
+        if not to_submit:
+            return
+
+        # send to the target service
+        with self._submit_slot():
+            results = self._do_target_submit_batch(
+                entity_class, [body for _, _, body, _, _ in to_submit]
+            )
+        if len(results) != len(to_submit):
+            raise SubmitBatchError(
+                f"{entity_class.class_name} submit_batch returned"
+                f" {len(results)} results for {len(to_submit)} entities",
+                [],
             )
 
+        failures = []
+        for (unique_key, method, body, body_hash, msg), result in zip(
+            to_submit, results
+        ):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"❌ {msg} failed: {result}\nRequest body:\n{pformat(body)}"
+                )
+                failures.append((body, result))
+            else:
+                self._record_loaded(
+                    entity_class,
+                    unique_key,
+                    method,
+                    body,
+                    body_hash,
+                    result,
+                    f"{msg} --> {result}",
+                )
+
+        if failures:
+            raise SubmitBatchError(
+                f"The target service rejected {len(failures)} of"
+                f" {len(to_submit)} {entity_class.class_name} entities",
+                failures,
+            )
+
+    async def _async_load_entity(self, entity_class, record, session):
+        """
+        Coroutine version of _load_entity that looks up and submits the
+        entity without blocking the event loop.
+
+        :param session: HTTP session for the target service requests
+        :type session: aiohttp.ClientSession
+        """
+        with self._resolving_record():
+            unique_key = self._new_entity_key(entity_class, record)
+            if unique_key is None:
+                return
+
+            target_id = await self._async_get_target_id_from_record(
+                entity_class, record, session
+            )
+            method, body, body_hash, msg = self._build_request(
+                entity_class, record, unique_key, target_id
+            )
+
+        if method == "UNCHANGED":
+            self._record_unchanged(entity_class, msg)
+            return
+
+        if self.dry_run:
+            target_id = self._dry_run_target_id(entity_class, body, target_id)
+            msg = f"DRY RUN - {msg}"
+        else:
+            async with self._async_submit_slot():
+                target_id = await self._do_target_async_submit(
+                    entity_class, body, session
+                )
+            msg = f"{msg} --> {target_id}"
+
+        self._record_loaded(
+            entity_class, unique_key, method, body, body_hash, target_id, msg
+        )
+
     def _postrun_validation(self, validation_mode=None, report_kwargs={}):
         # Override implemented base class method because we don't need to
         # do any validation on this stage's output
         pass
 
+    def _records_to_load(self, entity_class, transform_output):
+        """
+        Get the transformed records for one target entity class.
+
+        :param entity_class: one of the classes contained in the all_targets list
+        :type entity_class: class
+        :param transform_output: Output data structure from the Transform stage
+        :type transform_output: dict
+        :return: list of record dicts
+        :rtype: list
+        """
+        if entity_class.class_name in transform_output:
+            t_key = entity_class.class_name
+        else:
+            t_key = "default"
+
+        # convert df to list of dicts
+        transformed_records = transform_output[t_key].to_dict("records")
+
+        if hasattr(entity_class, "transform_records_list"):
+            transformed_records = entity_class.transform_records_list(
+                transformed_records
+            )
+
+        # guarantee existence of the project unique key column
+        for r in transformed_records:
+            r[CONCEPT.PROJECT.ID] = self.project_id
+
+        self.counts[entity_class.class_name]["CREATE"] = 0
+        self.counts[entity_class.class_name]["UPDATE"] = 0
+        self.counts[entity_class.class_name]["UNCHANGED"] = 0
+
+        self.logger.info(
+            f"Reading {len(transformed_records)} rows in '{t_key}' table."
+        )
+        return transformed_records
+
+    def _load_steps(self, entity_class, transform_output):
+        """
+        Split loading one target entity class into steps. Each step is one
+        record, or a batch of up to submit_batch_size records if the entity
+        class can submit batches.
+
+        :param entity_class: one of the classes contained in the all_targets list
+        :type entity_class: class
+        :param transform_output: Output data structure from the Transform stage
+        :type transform_output: dict
+        :return: iterator of (function, item) pairs, where calling
+            function(entity_class, item) loads the step
+        :rtype: iterator
+        """
+        records = self._records_to_load(entity_class, transform_output)
+        # Resuming switches from dry running to loading in the middle of a
+        # class, so it goes one record at a time
+        if self.resume_from or not self._supports_batch(entity_class):
+            return ((self._load_entity, r) for r in records)
+        size = self.submit_batch_size
+        return (
+            (self._load_batch, records[i : i + size])
+            for i in range(0, len(records), size)
+        )
+
+    def _load_dependencies(self, entity_classes):
+        """
+        Find which of the given entity classes each of them has to wait for.
+        Dependencies through classes that aren't being loaded count too,
+        because looking up those classes' keys needs the target IDs of the
+        classes that they depend on.
+
+        :param entity_classes: classes to load, in all_targets order
+        :type entity_classes: list
+        :return: {entity class: set of entity classes that it depends on}
+        :rtype: dict
+        """
+        # classes only depend on earlier ones, so all_targets order works
+        all_dependencies = {}
+        for c, deps in find_target_dependencies(
+            self.target_api_config.all_targets
+        ).items():
+            all_dependencies[c] = deps.union(
+                *(all_dependencies[d] for d in deps)
+            )
+        dependencies = {
+            c: all_dependencies[c].intersection(entity_classes)
+            for c in entity_classes
+        }
+        self.logger.info(
+            "Load dependencies:\n"
+            + pformat(
+                {
+                    c.class_name: sorted(d.class_name for d in deps)
+                    for c, deps in dependencies.items()
+                }
+            )
+        )
+        return dependencies
+
+    def _load_concurrently(self, entity_classes, transform_output):
+        """
+        Load several target entity classes at once. Each class starts as soon
+        as all of the classes that it depends on have finished loading, and
+        the records of every running class share one pool of load_workers
+        threads. Records (or batches of them, see _load_steps) are submitted a
+        window at a time instead of queueing a future for every record up
+        front, and the first error cancels everything that hasn't started yet.
+
+        :param entity_classes: classes to load, in all_targets order
+        :type entity_classes: list
+        :param transform_output: Output data structure from the Transform stage
+        :type transform_output: dict
+        """
+        waiting = self._load_dependencies(entity_classes)
+
+        max_in_flight = self.load_workers * LOAD_RECORDS_IN_FLIGHT_PER_WORKER
+        running = {}  # {entity class: iterator over its unsubmitted steps}
+        unfinished = defaultdict(int)  # {entity class: submitted, not done}
+        in_flight = {}  # {future: entity class}
+
+        def finish(entity_class):
+            self._flush_uid_cache()
+            self.logger.info(f"End loading {entity_class.class_name}")
+            for deps in waiting.values():
+                deps.discard(entity_class)
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.load_workers
+        ) as ex:
+            try:
+                while waiting or running or in_flight:
+                    ready = [c for c, deps in waiting.items() if not deps]
+                    for entity_class in ready:
+                        del waiting[entity_class]
+                        self.logger.info(
+                            f"Begin loading {entity_class.class_name}"
+                        )
+                        running[entity_class] = self._load_steps(
+                            entity_class, transform_output
+                        )
+
+                    # Only keep a window of steps queued, taking turns
+                    # between the running classes to fill it
+                    while running and len(in_flight) < max_in_flight:
+                        for entity_class in list(running):
+                            if len(in_flight) >= max_in_flight:
+                                break
+                            step = next(running[entity_class], None)
+                            if step is None:
+                                del running[entity_class]
+                                if not unfinished[entity_class]:
+                                    finish(entity_class)
+                            else:
+                                load, item = step
+                                f = ex.submit(load, entity_class, item)
+                                in_flight[f] = entity_class
+                                unfinished[entity_class] += 1
+
+                    if not in_flight:
+                        continue
+
+                    done, _ = concurrent.futures.wait(
+                        in_flight,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for f in done:
+                        entity_class = in_flight.pop(f)
+                        # Stop at the first failure instead of waiting for
+                        # everything else that was queued
+                        f.result()
+                        unfinished[entity_class] -= 1
+                        if (
+                            not unfinished[entity_class]
+                            and entity_class not in running
+                        ):
+                            finish(entity_class)
+            except BaseException:
+                for f in in_flight:
+                    f.cancel()
+                raise
+
+    async def _load_asyncio(self, entity_classes, transform_output):
+        """
+        Load several target entity classes at once on the event loop. Like
+        _load_concurrently, each class starts when the classes that it
+        depends on have finished, but the requests are coroutines sharing one
+        HTTP session, and a semaphore caps the number of records in flight at
+        async_concurrency across all classes.
+
+        Target ID lookups made by the plugin while building keys and bodies
+        still block, so they should be answerable from the ID cache, which
+        is the case for entities loaded earlier in the same run.
+
+        :param entity_classes: classes to load, in all_targets order
+        :type entity_classes: list
+        :param transform_output: Output data structure from the Transform stage
+        :type transform_output: dict
+        """
+        dependencies = self._load_dependencies(entity_classes)
+        finished = {c: asyncio.Event() for c in entity_classes}
+        in_flight = asyncio.Semaphore(self.async_concurrency)
+
+        async def load_class(entity_class, session):
+            for dependency in dependencies[entity_class]:
+                await finished[dependency].wait()
+            self.logger.info(f"Begin loading {entity_class.class_name}")
+            records = iter(
+                self._records_to_load(entity_class, transform_output)
+            )
+
+            async def worker():
+                # Workers share the records iterator, which is safe because
+                # they all run on the same thread
+                for record in records:
+                    async with in_flight:
+                        await self._async_load_entity(
+                            entity_class, record, session
+                        )
+
+            await asyncio.gather(
+                *(worker() for _ in range(self.async_concurrency))
+            )
+            self._flush_uid_cache()
+            self.logger.info(f"End loading {entity_class.class_name}")
+            finished[entity_class].set()
+
+        async with open_async_http_session(self.async_concurrency) as session:
+            tasks = [
+                asyncio.ensure_future(load_class(c, session))
+                for c in entity_classes
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for t in tasks:
+                    t.cancel()
+                raise
+
     def _run(self, transform_output):
         """
         Load Stage internal entry point. Called by IngestStage.run
@@ -379,66 +1314,71 @@ class LoadStageBase(IngestStage):
             self.dry_run = True
 
         # Loop through all target concepts
-        self.sent_messages = []
-        try:
-            for entity_class in self.target_api_config.all_targets:
-                if entity_class.class_name not in self.entities_to_load:
-                    self.logger.info(
-                        f"Skipping load of {entity_class.class_name}. Not "
-                        "included in ingest package config."
-                    )
-                    continue
-
-                self.logger.info(f"Begin loading {entity_class.class_name}")
-
-                if entity_class.class_name in transform_output:
-                    t_key = entity_class.class_name
-                else:
-                    t_key = "default"
-
-                # convert df to list of dicts
-                transformed_records = transform_output[t_key].to_dict("records")
-
-                if hasattr(entity_class, "transform_records_list"):
-                    transformed_records = entity_class.transform_records_list(
-                        transformed_records
-                    )
-
-                # guarantee existence of the project unique key column
-                for r in transformed_records:
-                    r[CONCEPT.PROJECT.ID] = self.project_id
-
-                self.counts[entity_class.class_name]["CREATE"] = 0
-                self.counts[entity_class.class_name]["UPDATE"] = 0
-
-                if self.use_async:
-                    ex = concurrent.futures.ThreadPoolExecutor()
-                    futures = []
-
+        entity_classes = []
+        for entity_class in self.target_api_config.all_targets:
+            if entity_class.class_name not in self.entities_to_load:
                 self.logger.info(
-                    f"Reading {len(transformed_records)} rows in '{t_key}' table."
+                    f"Skipping load of {entity_class.class_name}. Not "
+                    "included in ingest package config."
                 )
-                for record in transformed_records:
-                    if self.use_async and not self.resume_from:
-                        futures.append(
-                            ex.submit(self._load_entity, entity_class, record)
-                        )
-                    else:
-                        self._load_entity(entity_class, record)
+            else:
+                entity_classes.append(entity_class)
 
-                if self.use_async:
-                    for f in concurrent.futures.as_completed(futures):
-                        f.result()
-                    ex.shutdown()
+        self._prime_uid_cache(
+            [c.class_name for c in self.target_api_config.all_targets]
+        )
+        self._prefetch_target_ids(entity_classes)
 
+        if self.adaptive_concurrency:
+            if not self.use_async:
+                max_limit = 1
+            elif self._supports_asyncio(entity_classes):
+                max_limit = self.async_concurrency
+            else:
+                max_limit = self.load_workers
+            self.rate_limiter = AdaptiveConcurrencyLimiter(max_limit)
+            set_rate_limiter(self.rate_limiter)
+
+        self._sent_messages_file = open_json_lines(
+            self.sent_messages_filepath, "w"
+        )
+        stop_flushing = Event()
+        flusher = Thread(
+            target=self._flush_uid_cache_periodically,
+            args=(stop_flushing,),
+            name="uid cache flusher",
+            daemon=True,
+        )
+        flusher.start()
+        try:
+            # Resuming has to walk through the entities in order
+            while entity_classes and (self.resume_from or not self.use_async):
+                entity_class = entity_classes.pop(0)
+                self.logger.info(f"Begin loading {entity_class.class_name}")
+                for load, item in self._load_steps(
+                    entity_class, transform_output
+                ):
+                    load(entity_class, item)
+                self._flush_uid_cache()
                 self.logger.info(f"End loading {entity_class.class_name}")
+
+            if entity_classes and self._supports_asyncio(entity_classes):
+                asyncio.run(
+                    self._load_asyncio(entity_classes, transform_output)
+                )
+            elif entity_classes:
+                self._load_concurrently(entity_classes, transform_output)
         finally:
-            target = self._clean_name(self.target_url)
-            json_out = os.path.join(
-                self.stage_cache_dir, f"SentMessages_{target}.json"
-            )
-            with open(json_out, "w") as jo:
-                json.dump(self.sent_messages, jo, indent=2)
+            stop_flushing.set()
+            flusher.join()
+            self._flush_uid_cache()
+            self._sent_messages_file.close()
+            if self.rate_limiter:
+                set_rate_limiter(None)
+                self.logger.info(
+                    "Adaptive concurrency:\n"
+                    f"{pformat(self.rate_limiter.stats())}"
+                )
 
         if self.resume_from:
             self.logger.warning(
@@ -447,3 +1387,6 @@ class LoadStageBase(IngestStage):
             )
 
         self.logger.info(f"Load Summary:\n{pformat(dict(self.counts))}")
+        self.logger.info(
+            f"HTTP connection reuse:\n{pformat(http_session_stats())}"
+        )
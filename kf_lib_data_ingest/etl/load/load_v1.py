@@ -26,7 +26,8 @@ class LoadStage(LoadStageBase):
         # check the cache
         try:
             return self._get_target_id_from_key(
-                entity_class.class_name, entity_class.build_key(record)
+                entity_class.class_name,
+                self._do_target_get_key(entity_class, record),
             )
         except AssertionError:
             return None
@@ -39,7 +40,9 @@ class LoadStage(LoadStageBase):
 
     def _do_target_get_key(self, entity_class, record):
         """Shim for target API key building across loader versions"""
-        return entity_class.build_key(record)
+        return self._resolve_once(
+            "key", entity_class, record, lambda: entity_class.build_key(record)
+        )
 
     def _do_target_get_entity(self, entity_class, record, keystring):
         """Shim for target API entity building across loader versions"""
@@ -2,12 +2,25 @@
 For Version 2 Target Service Plugins
 """
 
+import asyncio
+import copy
+from collections import defaultdict
 from pprint import pformat
 
 from kf_lib_data_ingest.common import constants
 from kf_lib_data_ingest.etl.load.load_base import LoadStageBase
 
 
+def _key_shape(key_components):
+    """
+    The field names of key components, in order, and whether each value is a
+    string. Keys built the same way have the same shapes.
+    """
+    if not isinstance(key_components, dict):
+        return type(key_components).__name__
+    return tuple((k, isinstance(v, str)) for k, v in key_components.items())
+
+
 class LoadStage(LoadStageBase):
     def __init__(self, *args, query_url="", **kwargs):
         """
@@ -16,6 +29,159 @@ class LoadStage(LoadStageBase):
         """
         super().__init__(*args, **kwargs)
         self.query_url = query_url
+        # (class name, key) pairs that the server had no target ID for, so
+        # that other records with the same key don't ask again
+        self._not_on_server = set()
+        # {class name: (keys with several target IDs, key shapes)} for entity
+        # classes whose target IDs were all fetched before loading
+        self._prefetched = {}
+
+    def _known_target_id(self, entity_class, record):
+        """
+        Find the target service ID for the given record without asking the
+        server.
+
+        :return: the target ID if the record has it or it's cached, and the
+            key components to query the server with if it doesn't (None if
+            they couldn't be built or the server is known not to have it)
+        :rtype: tuple
+        """
+        # check if target ID is given
+        tic = record.get(entity_class.target_id_concept)
+        if tic and (tic != constants.COMMON.NOT_REPORTED):
+            return tic, None
+
+        # check the cache
+        try:
+            key_components = self._do_target_get_key(entity_class, record)
+            key = (entity_class.class_name, str(key_components))
+            tic = self._get_target_id_from_key(*key)
+        except Exception:
+            return None, None
+
+        if tic or not self._known_missing(
+            entity_class.class_name, key_components
+        ):
+            return tic, key_components
+        return None, None
+
+    def _known_missing(self, class_name, key_components):
+        """
+        Whether the server is known not to have a target ID for the key.
+
+        A key missing from the prefetched target IDs is only known to be
+        missing if it has the same shape as the prefetched keys. Otherwise the
+        plugin's prefetch_target_ids builds keys differently from its
+        get_key_components, and the class's records are queried for
+        individually instead.
+        """
+        unique_key = str(key_components)
+        if (class_name, unique_key) in self._not_on_server:
+            return True
+        prefetched = self._prefetched.get(class_name)
+        if prefetched is None:
+            return False
+        ambiguous, shapes = prefetched
+        if shapes and (_key_shape(key_components) not in shapes):
+            if self._prefetched.pop(class_name, None):
+                self.logger.warning(
+                    f"⚠️ The prefetched {class_name} keys aren't built the"
+                    f" same way as the key {unique_key}, so {class_name}"
+                    " records missing from the prefetched target IDs will"
+                    " be queried one record at a time."
+                )
+            return False
+        return unique_key not in ambiguous
+
+    def _can_query(self):
+        """
+        Whether the server may be asked for target IDs. A dry run only asks
+        a separate query_url, or the load target while walking to
+        resume_from, because the target IDs of entities before the resume
+        target may be missing from the cache if the last load was killed.
+        """
+        return not self.dry_run or bool(self.query_url or self.resume_from)
+
+    def _prefetch_target_ids(self, entity_classes):
+        """
+        Fill the identifier cache from entity classes that define
+        prefetch_target_ids, listing the project's entities a page at a time
+        instead of querying for each record. Records that then miss the cache
+        are new to the server and aren't queried for individually, as long
+        as their keys are built the same way as the prefetched ones (see
+        _known_missing).
+
+        :param entity_classes: classes about to be loaded
+        :type entity_classes: list
+        """
+        if not self._can_query():
+            return
+
+        host = self.query_url or self.target_url
+        for entity_class in entity_classes:
+            if not hasattr(entity_class, "prefetch_target_ids"):
+                continue
+            class_name = entity_class.class_name
+            found = defaultdict(set)
+            shapes = set()
+            try:
+                for key_components, tic in entity_class.prefetch_target_ids(
+                    host, self.project_id
+                ):
+                    found[str(key_components)].add(tic)
+                    shapes.add(_key_shape(key_components))
+            except Exception as e:
+                self.logger.warning(
+                    f"⚠️ Could not prefetch {class_name} target IDs, so they"
+                    f" will be queried one record at a time. Caused by: {e}"
+                )
+                continue
+
+            # Ambiguous keys are left for the record query to report
+            ambiguous = {k for k, tics in found.items() if len(tics) > 1}
+            self._store_target_ids_for_keys(
+                class_name,
+                {
+                    k: tics.pop()
+                    for k, tics in found.items()
+                    if k not in ambiguous
+                },
+                self.dry_run,
+            )
+            self._prefetched[class_name] = (ambiguous, shapes)
+            self.logger.info(
+                f"Prefetched {len(found) - len(ambiguous)} {class_name} target"
+                f" IDs from {host}"
+            )
+
+    def _use_queried_target_ids(self, entity_class, key_components, tic_list):
+        """
+        Pick the target ID out of the server's answer to a query and cache it.
+
+        :return: the target service ID
+        :rtype: str
+        """
+        if tic_list:
+            if len(tic_list) > 1:
+                raise Exception(
+                    "Ambiguous query. Multiple target identifiers found.\n"
+                    "Sent:\n"
+                    f"{pformat(key_components)}\n"
+                    "Found:\n"
+                    f"{tic_list}"
+                )
+            tic = tic_list[0]
+            if tic and (tic != constants.COMMON.NOT_REPORTED):
+                self._store_target_id_for_key(
+                    entity_class.class_name,
+                    str(key_components),
+                    tic,
+                    self.dry_run,
+                )
+                return tic
+
+        self._not_on_server.add((entity_class.class_name, str(key_components)))
+        return None
 
     def _get_target_id_from_record(self, entity_class, record):
         """
@@ -28,56 +194,105 @@ class LoadStage(LoadStageBase):
         :return: the target service ID
         :rtype: str
         """
-        # check if target ID is given
-        tic = record.get(entity_class.target_id_concept)
-        if tic and (tic != constants.COMMON.NOT_REPORTED):
+        return self._resolve_once(
+            "target_id",
+            entity_class,
+            record,
+            lambda: self._query_target_id(entity_class, record),
+        )
+
+    def _query_target_id(self, entity_class, record):
+        """
+        Find the target service ID for the given record and entity class,
+        asking the server if it isn't already known.
+        """
+        tic, key_components = self._known_target_id(entity_class, record)
+        if tic or (key_components is None):
             return tic
 
-        # check the cache
+        # check the server
+        if not self._can_query():
+            return None
+
         try:
-            key_components = self._do_target_get_key(entity_class, record)
-            tic = self._get_target_id_from_key(
-                entity_class.class_name, str(key_components)
+            # copied because the resolved key components are reused
+            tic_list = entity_class.query_target_ids(
+                self.query_url or self.target_url,
+                copy.copy(key_components),
             )
         except Exception:
             return None
 
-        if tic:
+        return self._use_queried_target_ids(
+            entity_class, key_components, tic_list
+        )
+
+    async def _async_get_target_id_from_record(
+        self, entity_class, record, session
+    ):
+        """
+        Coroutine version of _get_target_id_from_record. Uses the entity
+        class's async_query_target_ids if it has one, and otherwise runs its
+        query_target_ids in a thread.
+
+        :param session: HTTP session for the target service requests
+        :type session: aiohttp.ClientSession
+        """
+        tic = await self._async_query_target_id(entity_class, record, session)
+        # so that building the entity doesn't look it up again
+        return self._resolve_once(
+            "target_id", entity_class, record, lambda: tic
+        )
+
+    async def _async_query_target_id(self, entity_class, record, session):
+        """
+        Coroutine version of _query_target_id
+        """
+        tic, key_components = self._known_target_id(entity_class, record)
+        if tic or (key_components is None):
             return tic
 
         # check the server
-        if self.dry_run and not self.query_url:
+        if not self._can_query():
             return None
 
-        err = False
+        host = self.query_url or self.target_url
+        key_copy = copy.copy(key_components)
         try:
-            tic_list = entity_class.query_target_ids(
-                self.query_url or self.target_url, key_components
-            )
-            if tic_list:
-                if len(tic_list) > 1:
-                    err = True
-                    raise Exception(
-                        "Ambiguous query. Multiple target identifiers found.\n"
-                        "Sent:\n"
-                        f"{pformat(key_components)}\n"
-                        "Found:\n"
-                        f"{tic_list}"
-                    )
-                tic = tic_list[0]
-                if tic and (tic != constants.COMMON.NOT_REPORTED):
-                    self._store_target_id_for_key(
-                        entity_class.class_name,
-                        str(key_components),
-                        tic,
-                        self.dry_run,
-                    )
-                    return tic
+            if hasattr(entity_class, "async_query_target_ids"):
+                tic_list = await entity_class.async_query_target_ids(
+                    host, key_copy, session
+                )
+            else:
+                tic_list = await asyncio.get_event_loop().run_in_executor(
+                    None, entity_class.query_target_ids, host, key_copy
+                )
         except Exception:
-            if err:
-                raise
+            return None
 
-        return None
+        return self._use_queried_target_ids(
+            entity_class, key_components, tic_list
+        )
+
+    def _supports_batch(self, entity_class):
+        """
+        Batches are used for entity classes that define submit_batch
+        """
+        return hasattr(entity_class, "submit_batch")
+
+    def _do_target_submit_batch(self, entity_class, bodies):
+        """Shim for target API batch submission"""
+        return entity_class.submit_batch(self.target_url, bodies)
+
+    def _supports_asyncio(self, entity_classes):
+        """
+        Coroutines are used when every entity class defines async_submit
+        """
+        return all(hasattr(c, "async_submit") for c in entity_classes)
+
+    async def _do_target_async_submit(self, entity_class, body, session):
+        """Shim for asynchronous target API submission"""
+        return await entity_class.async_submit(self.target_url, body, session)
 
     def _do_target_submit(self, entity_class, body):
         """Shim for target API submission across loader versions"""
@@ -85,8 +300,13 @@ class LoadStage(LoadStageBase):
 
     def _do_target_get_key(self, entity_class, record):
         """Shim for target API key building across loader versions"""
-        return entity_class.get_key_components(
-            record, self._get_target_id_from_record
+        return self._resolve_once(
+            "key",
+            entity_class,
+            record,
+            lambda: entity_class.get_key_components(
+                record, self._get_target_id_from_record
+            ),
         )
 
     def _do_target_get_entity(self, entity_class, record, keystring):
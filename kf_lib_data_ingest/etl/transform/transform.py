@@ -9,16 +9,38 @@ from pprint import pformat
 import pandas
 
 from kf_lib_data_ingest.common.errors import InvalidIngestStageParameters
-from kf_lib_data_ingest.common.io import read_df
-from kf_lib_data_ingest.common.misc import clean_up_df
 from kf_lib_data_ingest.common.stage import IngestStage
 from kf_lib_data_ingest.common.type_safety import (
     assert_all_safe_type,
     assert_safe_type,
 )
+from kf_lib_data_ingest.config import (
+    DEFAULT_STAGE_CACHE_FORMAT,
+    STAGE_CACHE_FORMATS,
+)
 
 
 class TransformStage(IngestStage):
+    def __init__(
+        self,
+        ingest_output_dir=None,
+        stage_cache_format=DEFAULT_STAGE_CACHE_FORMAT,
+    ):
+        """
+        :param ingest_output_dir: where to write the stage output
+        :type ingest_output_dir: str, optional
+        :param stage_cache_format: file format of the transformed DataFrames
+            in the stage cache, one of config.STAGE_CACHE_FORMATS, defaults to
+            DEFAULT_STAGE_CACHE_FORMAT
+        :type stage_cache_format: str, optional
+        """
+        super().__init__(ingest_output_dir)
+        if stage_cache_format not in STAGE_CACHE_FORMATS:
+            raise ValueError(
+                f"stage_cache_format must be one of {STAGE_CACHE_FORMATS}"
+            )
+        self.stage_cache_format = stage_cache_format
+
     def _read_output(self):
         """
         Read previously written transform stage output
@@ -28,12 +50,13 @@ class TransformStage(IngestStage):
         etc)
         :rtype: dict
         """
+        extensions = tuple(f".{f}" for f in STAGE_CACHE_FORMATS)
         output = {
-            os.path.splitext(filename)[0]: clean_up_df(
-                read_df(os.path.join(self.stage_cache_dir, filename))
+            os.path.splitext(filename)[0]: self._read_cache_df(
+                os.path.join(self.stage_cache_dir, filename)
             )
             for filename in os.listdir(self.stage_cache_dir)
-            if filename.endswith(".tsv")
+            if filename.endswith(extensions)
         }
         self.logger.info(
             f"Reading {self.stage_type.__name__} output:\n"
@@ -57,9 +80,7 @@ class TransformStage(IngestStage):
         # Write transform func output to disk
         os.makedirs(self.stage_cache_dir, exist_ok=True)
         for key, df in output.items():
-            fp = os.path.join(self.stage_cache_dir, key + ".tsv")
-            paths.append(fp)
-            df.to_csv(fp, sep="\t", index=False)
+            paths.append(self._write_cache_df(df, key, self.stage_cache_format))
 
         self.logger.info(
             f"Writing {self.stage_type.__name__} output:\n" f"{pformat(paths)}"
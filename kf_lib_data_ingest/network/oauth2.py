@@ -5,8 +5,6 @@ Module for requests using OAuth 2 based authentication/authorization
 import logging
 from pprint import pformat
 
-from d3b_utils.requests_retry import Session
-
 from kf_lib_data_ingest.network import utils
 
 logger = logging.getLogger(__name__)
@@ -51,7 +49,7 @@ def get_service_token(provider_domain, audience, client_id, client_secret):
         f"{audience} resources"
     )
 
-    response = Session().post(oauth_token_url, json=body)
+    response = utils.get_http_session().post(oauth_token_url, json=body)
 
     if response.status_code != 200:
         logger.error(
@@ -126,7 +124,7 @@ def get_file(
 
     response = utils.http_get_file(url, dest_obj, **kwargs)
 
-    if response.status_code == 200:
+    if response.status_code in {200, 304}:
         logger.info("Successfully authenticated and fetched protected file")
         return response
     else:
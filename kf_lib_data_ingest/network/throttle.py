@@ -0,0 +1,342 @@
+"""
+Adaptive limits on how many requests are sent to a target service at once
+"""
+
+import asyncio
+import email.utils
+import time
+from contextlib import asynccontextmanager, contextmanager
+from threading import Lock, Semaphore
+from urllib.parse import urlparse
+
+from kf_lib_data_ingest.config import (
+    ADAPTIVE_DECREASE_FACTOR,
+    ADAPTIVE_LATENCY_TOLERANCE,
+    MAX_RETRY_AFTER_SECONDS,
+)
+
+# Weights of the newest response time in the short and long term averages
+_FAST_WEIGHT = 0.3
+_SLOW_WEIGHT = 0.01
+
+# The limiter that responses from the shared HTTP sessions are reported to
+_limiter = None
+
+
+def set_rate_limiter(limiter):
+    """
+    Report responses from the shared HTTP sessions to the given limiter.
+
+    :param limiter: the limiter, or None to stop reporting
+    :type limiter: AdaptiveConcurrencyLimiter
+    """
+    global _limiter
+    _limiter = limiter
+
+
+def get_rate_limiter():
+    """
+    :return: the limiter that responses are reported to, if any
+    :rtype: AdaptiveConcurrencyLimiter
+    """
+    return _limiter
+
+
+def parse_retry_after(value):
+    """
+    Convert a Retry-After header value, either a number of seconds or an HTTP
+    date, into seconds from now, at most MAX_RETRY_AFTER_SECONDS.
+
+    :param value: Retry-After header value
+    :type value: str
+    :return: seconds to wait, or None if the value isn't valid
+    :rtype: float
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = when.timestamp() - time.time()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+def endpoint_name(method, url):
+    """
+    Name the endpoint that a request was sent to, e.g. "PATCH /participants"
+    for PATCH http://localhost:5000/participants/PT_00000000
+
+    :param method: HTTP method
+    :type method: str
+    :param url: request URL
+    :type url: str
+    :rtype: str
+    """
+    resource = urlparse(str(url)).path.strip("/").split("/")[0]
+    return f"{method.upper()} /{resource}"
+
+
+def observe_response(method, url, seconds, status, retry_after=None):
+    """
+    Report a response to the active limiter, if there is one.
+
+    :param method: HTTP method of the request
+    :type method: str
+    :param url: request URL
+    :type url: str
+    :param seconds: how long the response took, or None if not known
+    :type seconds: float
+    :param status: HTTP status code
+    :type status: int
+    :param retry_after: Retry-After header value, defaults to None
+    :type retry_after: str, optional
+    """
+    limiter = _limiter
+    if limiter:
+        limiter.observe(
+            endpoint_name(method, url),
+            seconds,
+            status,
+            parse_retry_after(retry_after),
+        )
+
+
+class _Gate:
+    """
+    A semaphore and the number of permits that it has in total, including
+    the ones that are held
+    """
+
+    __slots__ = ("semaphore", "permits")
+
+    def __init__(self, semaphore, permits):
+        self.semaphore = semaphore
+        self.permits = permits
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps the number of requests in flight to a target service, and adjusts
+    the cap the way TCP congestion control does (additive increase,
+    multiplicative decrease). After a window of as many healthy responses as
+    the limit, it goes up by one, up to max_limit. When the service responds
+    with 429 or 5xx, or gets latency_tolerance times slower than its
+    long-term average, it's multiplied by decrease_factor, at most once per
+    window. A Retry-After header holds every sender back until it has
+    passed.
+
+    Threads take turns with slot() and coroutines with async_slot(). Responses
+    are reported with observe(), which the shared HTTP sessions in
+    network.utils do for the limiter given to set_rate_limiter.
+    """
+
+    def __init__(
+        self,
+        max_limit,
+        min_limit=1,
+        latency_tolerance=ADAPTIVE_LATENCY_TOLERANCE,
+        decrease_factor=ADAPTIVE_DECREASE_FACTOR,
+    ):
+        """
+        :param max_limit: most requests in flight at once, also the starting
+            limit
+        :type max_limit: int
+        :param min_limit: fewest requests in flight at once, defaults to 1
+        :type min_limit: int, optional
+        :param latency_tolerance: how many times slower than usual responses
+            may get before the limit is cut, defaults to
+            ADAPTIVE_LATENCY_TOLERANCE
+        :type latency_tolerance: float, optional
+        :param decrease_factor: what the limit is multiplied by when it's cut,
+            defaults to ADAPTIVE_DECREASE_FACTOR
+        :type decrease_factor: float, optional
+        """
+        if not (1 <= min_limit <= max_limit):
+            raise ValueError("Limits must satisfy 1 <= min_limit <= max_limit")
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.limit = max_limit
+
+        # guards everything below and the gates' permit counts
+        self._lock = Lock()
+        self._paused_until = 0.0
+        self._fast_seconds = None
+        self._slow_seconds = None
+        self._healthy = 0
+        self._since_decrease = max_limit
+        # {endpoint: {"requests": int, "overloaded": int, "seconds": float}}
+        self._endpoints = {}
+        self._gate = _Gate(Semaphore(max_limit), max_limit)
+        self._async_loop = None
+        self._async_gate = None
+
+    def observe(self, endpoint, seconds, status, retry_after=None):
+        """
+        Adjust the limit for a response from the target service.
+
+        :param endpoint: name of the endpoint, see endpoint_name
+        :type endpoint: str
+        :param seconds: how long the response took, or None if not known,
+            in which case it doesn't count toward the response time averages
+        :type seconds: float
+        :param status: HTTP status code
+        :type status: int
+        :param retry_after: seconds that the service asked to wait before
+            sending more requests, defaults to None
+        :type retry_after: float, optional
+        """
+        overloaded = (status == 429) or (status >= 500)
+        with self._lock:
+            stats = self._endpoints.setdefault(
+                endpoint,
+                {"requests": 0, "overloaded": 0, "timed": 0, "seconds": 0.0},
+            )
+            stats["requests"] += 1
+            stats["overloaded"] += overloaded
+
+            slow = False
+            if seconds is not None:
+                stats["timed"] += 1
+                stats["seconds"] += seconds
+                if self._fast_seconds is None:
+                    self._fast_seconds = self._slow_seconds = seconds
+                else:
+                    self._fast_seconds += _FAST_WEIGHT * (
+                        seconds - self._fast_seconds
+                    )
+                    self._slow_seconds += _SLOW_WEIGHT * (
+                        seconds - self._slow_seconds
+                    )
+                slow = self._fast_seconds > (
+                    self._slow_seconds * self.latency_tolerance
+                )
+
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+
+            self._since_decrease += 1
+            if overloaded or slow or retry_after:
+                self._healthy = 0
+                if self._since_decrease >= self.limit:
+                    self.limit = max(
+                        self.min_limit, int(self.limit * self.decrease_factor)
+                    )
+                    self._since_decrease = 0
+            else:
+                self._healthy += 1
+                if self._healthy >= self.limit:
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self._healthy = 0
+
+    def stats(self):
+        """
+        :return: the current limit and, for each endpoint, the number of
+            responses, how many of them reported overload, and their mean
+            duration in seconds among those whose duration is known
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "endpoints": {
+                    endpoint: {
+                        "requests": s["requests"],
+                        "overloaded": s["overloaded"],
+                        "mean_seconds": (
+                            round(s["seconds"] / s["timed"], 4)
+                            if s["timed"]
+                            else None
+                        ),
+                    }
+                    for endpoint, s in self._endpoints.items()
+                },
+            }
+
+    def _add_permits(self, gate):
+        """
+        Count the permits that the gate needs to grow to the limit. The
+        caller releases them.
+        """
+        with self._lock:
+            extra = max(0, self.limit - gate.permits)
+            gate.permits += extra
+        return extra
+
+    def _retire_permit(self, gate):
+        """
+        Whether a permit that was just acquired or released is over the
+        limit, in which case it's no longer counted.
+        """
+        with self._lock:
+            if gate.permits > self.limit:
+                gate.permits -= 1
+                return True
+        return False
+
+    def _pause_seconds(self):
+        return self._paused_until - time.monotonic()
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait, in a thread, for a turn to send a request.
+        """
+        gate = self._gate
+        for _ in range(self._add_permits(gate)):
+            gate.semaphore.release()
+        while True:
+            gate.semaphore.acquire()
+            if not self._retire_permit(gate):
+                break
+        try:
+            pause = self._pause_seconds()
+            while pause > 0:
+                time.sleep(pause)
+                pause = self._pause_seconds()
+            yield
+        finally:
+            if not self._retire_permit(gate):
+                gate.semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """
+        Wait, in a coroutine, for a turn to send a request.
+        """
+        gate = self._get_async_gate()
+        for _ in range(self._add_permits(gate)):
+            gate.semaphore.release()
+        while True:
+            await gate.semaphore.acquire()
+            if not self._retire_permit(gate):
+                break
+        try:
+            pause = self._pause_seconds()
+            while pause > 0:
+                await asyncio.sleep(pause)
+                pause = self._pause_seconds()
+            yield
+        finally:
+            if not self._retire_permit(gate):
+                gate.semaphore.release()
+
+    def _get_async_gate(self):
+        """
+        Get the gate for coroutines on the running event loop
+        """
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            if self._async_loop is not loop:
+                self._async_loop = loop
+                self._async_gate = _Gate(
+                    asyncio.Semaphore(self.limit), self.limit
+                )
+            return self._async_gate
@@ -5,17 +5,217 @@ Common network (HTTP, TCP, whatever) related functionality
 import cgi
 import logging
 import os
+import time
 import urllib.parse
+from threading import Lock
 
 import requests
 from d3b_utils.requests_retry import Session
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
 
 from kf_lib_data_ingest.common.io import read_json, write_json
-from kf_lib_data_ingest.config import NETWORK_USER_AGENT
+from kf_lib_data_ingest.config import (
+    DEFAULT_ASYNC_LOAD_CONCURRENCY,
+    DEFAULT_HTTP_POOL_SIZE,
+    NETWORK_USER_AGENT,
+)
+from kf_lib_data_ingest.network.throttle import observe_response
 
 requests.utils.default_user_agent = lambda: NETWORK_USER_AGENT
 module_logger = logging.getLogger(__name__)
 
+# One retrying session shared by every request in the process so that
+# connections to the same host are kept alive and reused.
+_session = None
+_session_lock = Lock()
+
+
+def _observe_response(response, *args, **kwargs):
+    """requests response hook that reports to the active rate limiter"""
+    observe_response(
+        response.request.method,
+        response.url,
+        response.elapsed.total_seconds(),
+        response.status_code,
+        response.headers.get("Retry-After"),
+    )
+
+
+class _ObservedRetry(Retry):
+    """
+    urllib3 Retry policy that also reports the responses it retries to the
+    active rate limiter. Retried responses never reach requests, so the
+    response hook alone wouldn't see overloads that retrying absorbed. How
+    long they took isn't known here, so they don't count toward latency.
+    """
+
+    @classmethod
+    def from_retry(cls, retries):
+        """
+        :param retries: urllib3 Retry policy or number of retries
+        :type retries: urllib3.util.retry.Retry or int
+        :return: an _ObservedRetry with the same settings
+        :rtype: _ObservedRetry
+        """
+        retries = Retry.from_int(retries)
+        if isinstance(retries, cls):
+            return retries
+        observed = cls()
+        observed.__dict__.update(vars(retries))
+        return observed
+
+    def increment(self, method=None, url=None, response=None, *args, **kwargs):
+        try:
+            new_retry = super().increment(
+                method, url, response, *args, **kwargs
+            )
+        except MaxRetryError:
+            # Out of retries: the last response is raised here, or else
+            # given to requests and reported by the response hook
+            if (response is not None) and self.raise_on_status:
+                self._observe(method, url, response)
+            raise
+        if response is not None:
+            self._observe(method, url, response)
+        return new_retry
+
+    @staticmethod
+    def _observe(method, url, response):
+        observe_response(
+            method,
+            url,
+            None,
+            response.status,
+            response.headers.get("Retry-After"),
+        )
+
+
+async def _on_request_start(session, trace_context, params):
+    trace_context.start = time.monotonic()
+
+
+async def _on_request_end(session, trace_context, params):
+    """aiohttp version of _observe_response"""
+    observe_response(
+        params.method,
+        params.url,
+        time.monotonic() - trace_context.start,
+        params.response.status,
+        params.response.headers.get("Retry-After"),
+    )
+
+
+def _build_http_session(pool_size, retries):
+    session = Session()
+    session.hooks["response"].append(_observe_response)
+    if retries is None:
+        retries = session.get_adapter("https://").max_retries
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=_ObservedRetry.from_retry(retries),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure_http_session(pool_size=DEFAULT_HTTP_POOL_SIZE, retries=None):
+    """
+    Replace the shared HTTP session with one whose connection pools hold up
+    to `pool_size` connections per host. Should match the number of threads
+    that make requests at the same time.
+
+    :param pool_size: maximum number of kept-alive connections per host
+    :type pool_size: int
+    :param retries: urllib3 Retry policy, defaults to the policy of
+    d3b_utils.requests_retry.Session. Responses that it retries are also
+    reported to the active rate limiter.
+    :type retries: urllib3.util.retry.Retry
+    :return: the new shared session
+    :rtype: requests.Session
+    """
+    global _session
+    session = _build_http_session(pool_size, retries)
+    with _session_lock:
+        old_session, _session = _session, session
+    if old_session:
+        old_session.close()
+    return session
+
+
+def get_http_session():
+    """
+    Get the shared HTTP session, creating it with the default configuration
+    if it doesn't exist yet.
+
+    :return: the shared session
+    :rtype: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_http_session(DEFAULT_HTTP_POOL_SIZE, None)
+        return _session
+
+
+def open_async_http_session(limit=DEFAULT_ASYNC_LOAD_CONCURRENCY):
+    """
+    Create an HTTP session for coroutines. Must be called from inside a
+    running event loop, and should be closed when done, e.g.:
+
+        async with open_async_http_session() as session:
+            ...
+
+    :param limit: maximum number of simultaneous connections
+    :type limit: int
+    :return: the new session
+    :rtype: aiohttp.ClientSession
+    """
+    # Only needed by plugins that load with coroutines
+    import aiohttp
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit),
+        headers={"User-Agent": NETWORK_USER_AGENT},
+        trace_configs=[trace_config],
+    )
+
+
+def http_session_stats():
+    """
+    Summarize connection reuse by the shared HTTP session.
+
+    :return: dict with the number of requests sent and the number of new
+    connections opened to send them, per host and in total
+    :rtype: dict
+    """
+    with _session_lock:
+        session = _session
+    stats = {"requests": 0, "connections": 0, "hosts": {}}
+    if not session:
+        return stats
+    for adapter in set(session.adapters.values()):
+        if not isinstance(adapter, HTTPAdapter):
+            continue
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            host = f"{key.key_scheme}://{key.key_host}:{key.key_port}"
+            stats["hosts"][host] = {
+                "requests": pool.num_requests,
+                "connections": pool.num_connections,
+            }
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    return stats
+
 
 def http_get_file(url, dest_obj, **kwargs):
     """
@@ -34,9 +234,15 @@ def http_get_file(url, dest_obj, **kwargs):
     kwargs["stream"] = True
     logger = kwargs.get("logger", module_logger)
 
-    response = Session().get(url, **kwargs)
+    response = get_http_session().get(url, **kwargs)
+
+    if response.status_code == 304:
+        # Conditional request and our copy is still current
+        dest_obj.not_modified = True
+        response.close()
+        logger.info(f"{url} has not been modified")
 
-    if response.status_code == 200:
+    elif response.status_code == 200:
         # Get filename from Content-Disposition header
         content_disposition = response.headers.get("Content-Disposition", "")
         _, cdisp_params = cgi.parse_header(content_disposition)
@@ -64,6 +270,13 @@ def http_get_file(url, dest_obj, **kwargs):
                 "filename."
             )
 
+        # Remember what version of the file this is
+        dest_obj.validators = {
+            h: response.headers[h]
+            for h in ["ETag", "Last-Modified"]
+            if h in response.headers
+        }
+
         for chunk in response.iter_content(chunk_size=8192):
             if chunk:
                 dest_obj.write(chunk)
@@ -151,7 +364,7 @@ def get_open_api_v2_schema(url, cached_schema_filepath=None, logger=None):
 
     # Try to get schemas and version from the target service
     try:
-        response = Session().get(schema_url)
+        response = get_http_session().get(schema_url)
     except Exception as e:
         err = f"{common_msg}\nCaused by {str(e)}"
     else:
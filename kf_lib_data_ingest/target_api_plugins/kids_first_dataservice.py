@@ -11,8 +11,8 @@ requirements for format and content.
 
 import logging
 from threading import Lock
+from types import MappingProxyType
 
-from d3b_utils.requests_retry import Session
 from kf_utils.dataservice.scrape import yield_entities, yield_kfids
 from pandas import DataFrame, merge
 from requests import RequestException
@@ -27,7 +27,10 @@ from kf_lib_data_ingest.common.misc import (
     str_to_obj,
     upper_camel_case,
 )
-from kf_lib_data_ingest.network.utils import get_open_api_v2_schema
+from kf_lib_data_ingest.network.utils import (
+    get_http_session,
+    get_open_api_v2_schema,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +64,21 @@ def external_id(cls_list, record, get_target_id_from_record):
         return DELIMITER.join(out) or None
 
 
+def study_key_components(host, entity_class, study_id, key_fields):
+    """
+    List the key components and target IDs of all of a study's entities,
+    one page of entities at a time. Only for entity classes whose key
+    components are the study ID followed by string fields of the entity.
+    """
+    for e in yield_entities(
+        host, entity_class.api_path, {"study_id": study_id}
+    ):
+        yield (
+            {"study_id": study_id, **{f: e.get(f) for f in key_fields}},
+            e["kf_id"],
+        )
+
+
 class Investigator:
     class_name = "investigator"
     api_path = "investigators"
@@ -170,6 +188,10 @@ class Family:
     def query_target_ids(cls, host, key_components):
         return list(yield_kfids(host, cls.api_path, drop_none(key_components)))
 
+    @classmethod
+    def prefetch_target_ids(cls, host, project_id):
+        return study_key_components(host, cls, project_id, ["external_id"])
+
     @classmethod
     def build_entity(cls, record, get_target_id_from_record):
         secondary_components = {
@@ -205,6 +227,10 @@ class Participant:
     def query_target_ids(cls, host, key_components):
         return list(yield_kfids(host, cls.api_path, drop_none(key_components)))
 
+    @classmethod
+    def prefetch_target_ids(cls, host, project_id):
+        return study_key_components(host, cls, project_id, ["external_id"])
+
     @classmethod
     def build_entity(cls, record, get_target_id_from_record):
         # family foreign key is optional
@@ -449,6 +475,10 @@ class Sample:
     def query_target_ids(cls, host, key_components):
         return list(yield_kfids(host, cls.api_path, drop_none(key_components)))
 
+    @classmethod
+    def prefetch_target_ids(cls, host, project_id):
+        return study_key_components(host, cls, project_id, ["external_id"])
+
     @classmethod
     def build_entity(cls, record, get_target_id_from_record):
         secondary_components = {
@@ -612,6 +642,12 @@ class Biospecimen:
     def query_target_ids(cls, host, key_components):
         return list(yield_kfids(host, cls.api_path, drop_none(key_components)))
 
+    @classmethod
+    def prefetch_target_ids(cls, host, project_id):
+        return study_key_components(
+            host, cls, project_id, ["external_aliquot_id"]
+        )
+
     @classmethod
     def build_entity(cls, record, get_target_id_from_record):
         # sample foreign key is optional
@@ -751,6 +787,10 @@ class GenomicFile:
     def query_target_ids(cls, host, key_components):
         return list(yield_kfids(host, cls.api_path, drop_none(key_components)))
 
+    @classmethod
+    def prefetch_target_ids(cls, host, project_id):
+        return study_key_components(host, cls, project_id, ["external_id"])
+
     @classmethod
     def build_entity(cls, record, get_target_id_from_record):
         def size(record):
@@ -1195,20 +1235,20 @@ class SequencingExperimentGenomicFile:
 
 
 def _PATCH(host, api_path, kf_id, body):
-    return Session().patch(
+    return get_http_session().patch(
         url="/".join([v.strip("/") for v in [host, api_path, kf_id]]),
         json=body,
     )
 
 
 def _POST(host, api_path, body):
-    return Session().post(
+    return get_http_session().post(
         url="/".join([v.strip("/") for v in [host, api_path]]), json=body
     )
 
 
 def _GET(host, api_path, body):
-    return Session().get(
+    return get_http_session().get(
         url="/".join([v.strip("/") for v in [host, api_path]]),
         params={k: v for k, v in body.items() if v is not None},
     )
@@ -1236,7 +1276,6 @@ all_targets = [
     SequencingExperimentGenomicFile,
 ]
 
-swagger_cache = {}
 json_type_casts = {
     "string": str,
     "integer": int,
@@ -1244,68 +1283,139 @@ json_type_casts = {
     "object": str_to_obj,
 }
 swag = Lock()
+# {class name: TypeCoercer}, filled all at once from the swagger schema
+type_coercers = {}
+# Returned for empty values of fields that should be left out of the body
+OMIT = object()
+# The dataservice lies to us sometimes about how big ints can be
+# so we're going to keep track ourselves. {(class name, field)}
+seen_overmax_int = set()
 
 
-# The dataservice lies to us sometimes about how big ints can be
-# so we're going to keep track ourselves
-seen_overmax_int = {}
+class TypeCoercer:
+    """
+    Converts entity bodies to the types that the dataservice swagger schema
+    gives for one entity class. The per-field rules are worked out once when
+    it's built and never change after that, so it can be shared between
+    threads without locking. The once-per-field warnings about integers over
+    the maximum are kept track of in the module's seen_overmax_int instead.
+
+    The dataservice has no endpoint for creating many entities at once, so
+    bodies are coerced one at a time as they are submitted.
+    """
 
+    __slots__ = ("class_name", "field_handlers")
+
+    def __init__(self, entity_class, properties):
+        """
+        :param entity_class: which entity class the bodies are for
+        :type entity_class: class
+        :param properties: swagger schema properties of the entity class
+        :type properties: dict
+        """
+        handlers = {}
+        for k, prop in properties.items():
+            if prop.get("readOnly"):
+                # e.g. modified_at/created_at
+                continue
 
-def coerce_types(host, entity_class, body):
-    with swag:
-        if not swagger_cache:
-            swagger = get_open_api_v2_schema(host, logger=logger)
-            defs = swagger["definitions"]
-            for c in all_targets:
-                n = c.class_name
-                uccn = upper_camel_case(n)
-                if uccn in defs:
-                    swagger_cache[n] = defs[uccn]
-
-    properties = swagger_cache[entity_class.class_name]["properties"]
-
-    ret = {}
-    for k, v in body.items():
-        if (k not in properties) or properties[k].get("readOnly"):
-            # e.g. modified_at/created_at
-            continue
-        elif (v is None) or (v == ""):
-            if properties[k]["type"] == "string":
+            json_type = prop.get("type")
+            if json_type == "string":
                 if "date" in k:  # TODO: FIX THE DATASERVICE?
-                    ret[k] = None
+                    empty = None
                 elif k not in entity_class.service_id_fields:
-                    ret[k] = constants.COMMON.NOT_REPORTED
+                    empty = constants.COMMON.NOT_REPORTED
                 else:
-                    ret[k] = None
-            elif properties[k].get("x-nullable"):
-                ret[k] = None
+                    empty = None
+            elif prop.get("x-nullable"):
+                empty = None
             else:
                 # The field is required but we have no value.
-                # Don't include it so that the server applies default behavior.
-                continue
-        else:
-            v = json_type_casts.get(properties[k]["type"], lambda x: x)(v)
-            if properties[k]["type"] == "integer":
-                if entity_class.class_name not in seen_overmax_int:
-                    seen_overmax_int[entity_class.class_name] = set()
-                if k not in seen_overmax_int[entity_class.class_name]:
-                    try:
-                        max_value = (
-                            2 ** (int(properties[k]["format"][-2:]) - 1)
-                        ) - 1
-                        if v > max_value:
-                            logger.info(
-                                f"The server indicates that {entity_class.class_name}"
-                                f" field {k} may have maximum value {max_value}, but"
-                                f" {v} was given. If the next request fails,"
-                                " this might be why."
-                            )
-                            seen_overmax_int[entity_class.class_name].add(k)
-                    except Exception:
-                        pass
-            ret[k] = v
-
-    return ret
+                # Leave it out so that the server applies default behavior.
+                empty = OMIT
+
+            max_value = None
+            if json_type == "integer":
+                try:
+                    max_value = (2 ** (int(prop["format"][-2:]) - 1)) - 1
+                except Exception:
+                    pass
+
+            handlers[k] = (k, empty, json_type_casts.get(json_type), max_value)
+
+        self.class_name = entity_class.class_name
+        # {field: (field, value if empty, cast function, maximum integer value)}
+        self.field_handlers = MappingProxyType(handlers)
+
+    def _coerce_value(self, handler, v):
+        k, empty, cast, max_value = handler
+        if (v is None) or (v == ""):
+            return empty
+        if cast:
+            v = cast(v)
+        if (
+            (max_value is not None)
+            and (v > max_value)
+            and ((self.class_name, k) not in seen_overmax_int)
+        ):
+            logger.info(
+                f"The server indicates that {self.class_name}"
+                f" field {k} may have maximum value {max_value}, but"
+                f" {v} was given. If the next request fails,"
+                " this might be why."
+            )
+            seen_overmax_int.add((self.class_name, k))
+        return v
+
+    def coerce(self, body):
+        """
+        :param body: map between entity keys and values
+        :type body: dict
+        :return: a new body with only the writable fields, in the same order,
+            cast to the types that the server expects
+        :rtype: dict
+        """
+        ret = {}
+        for k, v in body.items():
+            handler = self.field_handlers.get(k)
+            if handler:
+                v = self._coerce_value(handler, v)
+                if v is not OMIT:
+                    ret[k] = v
+        return ret
+
+
+def get_type_coercer(host, entity_class):
+    """
+    Get the TypeCoercer for an entity class, building them all from the
+    server's swagger schema the first time.
+
+    :param host: host url
+    :type host: str
+    :param entity_class: which entity class the bodies are for
+    :type entity_class: class
+    :return: the entity class's TypeCoercer
+    :rtype: TypeCoercer
+    """
+    coercer = type_coercers.get(entity_class.class_name)
+    if coercer is None:
+        with swag:
+            if not type_coercers:
+                swagger = get_open_api_v2_schema(host, logger=logger)
+                defs = swagger["definitions"]
+                compiled = {}
+                for c in all_targets:
+                    n = c.class_name
+                    uccn = upper_camel_case(n)
+                    if uccn in defs:
+                        compiled[n] = TypeCoercer(c, defs[uccn]["properties"])
+                type_coercers.update(compiled)
+        coercer = type_coercers[entity_class.class_name]
+    return coercer
+
+
+def coerce_types(host, entity_class, body):
+    return get_type_coercer(host, entity_class).coerce(body)
 
 
 def submit(host, entity_class, body):
@@ -0,0 +1,233 @@
+"""
+Compare load throughput of the threaded and coroutine use_async load paths.
+
+Runs a stand-in dataservice (a small aiohttp app that keeps entities in
+memory and takes `--latency` seconds to answer every request) on localhost,
+and then loads the same participants and samples into it both ways.
+
+This file is also the LOADER_VERSION 2 target API plugin used for the
+benchmark, so its entity classes define both submit and async_submit.
+
+Usage:
+    python scripts/benchmark_load.py --records 2000 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+from kf_lib_data_ingest.common.concept_schema import CONCEPT
+from kf_lib_data_ingest.network.utils import get_http_session
+
+LOADER_VERSION = 2
+
+
+# Stand-in dataservice ########################################################
+
+
+async def _create(request):
+    await asyncio.sleep(request.app["latency"])
+    endpoint = request.match_info["endpoint"]
+    entities = request.app["entities"].setdefault(endpoint, {})
+    body = await request.json()
+    kf_id = body.get("kf_id") or f"{endpoint[:2].upper()}_{len(entities):08d}"
+    entities[body["external_id"]] = dict(body, kf_id=kf_id)
+    return web.json_response({"results": entities[body["external_id"]]})
+
+
+async def _query(request):
+    await asyncio.sleep(request.app["latency"])
+    endpoint = request.match_info["endpoint"]
+    entity = (
+        request.app["entities"]
+        .get(endpoint, {})
+        .get(request.query.get("external_id"))
+    )
+    return web.json_response({"results": [entity] if entity else []})
+
+
+def make_app(latency):
+    """
+    :param latency: seconds to wait before answering each request
+    :type latency: float
+    :return: the stand-in dataservice app
+    :rtype: aiohttp.web.Application
+    """
+    app = web.Application()
+    app["latency"] = latency
+    app["entities"] = {}
+    app.add_routes(
+        [web.post("/{endpoint}", _create), web.get("/{endpoint}", _query)]
+    )
+    return app
+
+
+def start_app(app, port=0):
+    """
+    Serve the app from a background thread.
+
+    :return: the URL that the app is listening on
+    :rtype: str
+    """
+    started = threading.Event()
+    urls = []
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        loop.run_until_complete(site.start())
+        host, bound_port = runner.addresses[0][:2]
+        urls.append(f"http://{host}:{bound_port}")
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+    return urls[0]
+
+
+# Target API plugin ###########################################################
+
+
+def _query_results(cls, host, key_components):
+    return get_http_session().get(
+        f"{host}/{cls.endpoint}", params=key_components
+    )
+
+
+def _kf_ids(results):
+    return [e["kf_id"] for e in results]
+
+
+class Participant:
+    class_name = "participant"
+    target_id_concept = CONCEPT.PARTICIPANT.TARGET_SERVICE_ID
+    endpoint = "participants"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        return {"external_id": record[CONCEPT.PARTICIPANT.ID]}
+
+    @classmethod
+    def query_target_ids(cls, host, key_components):
+        resp = _query_results(cls, host, key_components)
+        return _kf_ids(resp.json()["results"])
+
+    @classmethod
+    async def async_query_target_ids(cls, host, key_components, session):
+        async with session.get(
+            f"{host}/{cls.endpoint}", params=key_components
+        ) as resp:
+            return _kf_ids((await resp.json())["results"])
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            **cls.get_key_components(record, get_target_id_from_record),
+            "kf_id": get_target_id_from_record(cls, record),
+        }
+
+    @classmethod
+    def submit(cls, host, body):
+        resp = get_http_session().post(f"{host}/{cls.endpoint}", json=body)
+        return resp.json()["results"]["kf_id"]
+
+    @classmethod
+    async def async_submit(cls, host, body, session):
+        async with session.post(f"{host}/{cls.endpoint}", json=body) as resp:
+            return (await resp.json())["results"]["kf_id"]
+
+
+class Sample(Participant):
+    class_name = "sample"
+    target_id_concept = CONCEPT.BIOSPECIMEN.TARGET_SERVICE_ID
+    endpoint = "samples"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        return {"external_id": record[CONCEPT.BIOSPECIMEN.ID]}
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            **cls.get_key_components(record, get_target_id_from_record),
+            "kf_id": get_target_id_from_record(cls, record),
+            "participant_id": get_target_id_from_record(Participant, record),
+        }
+
+
+all_targets = [Participant, Sample]
+
+
+# Benchmark ###################################################################
+
+
+def run_benchmark(records, latency, load_workers, async_concurrency):
+    """
+    Load the same data into a fresh stand-in dataservice with threads and
+    then with coroutines, and print how long each took.
+    """
+    from pandas import DataFrame
+
+    from kf_lib_data_ingest.etl.load.load_v2 import LoadStage
+
+    app = make_app(latency)
+    url = start_app(app)
+    df = DataFrame(
+        {
+            CONCEPT.PARTICIPANT.ID: [f"P{i // 2}" for i in range(records)],
+            CONCEPT.BIOSPECIMEN.ID: [f"S{i}" for i in range(records)],
+        }
+    )
+
+    for mode in ["threads", "coroutines"]:
+        app["entities"].clear()
+        loader = LoadStage(
+            os.path.abspath(__file__),
+            url,
+            [t.class_name for t in all_targets],
+            "SD_BENCHMARK",
+            cache_dir=tempfile.mkdtemp(),
+            use_async=True,
+            load_workers=load_workers,
+            async_concurrency=async_concurrency,
+        )
+        if mode == "threads":
+            loader._supports_asyncio = lambda entity_classes: False
+        start = time.monotonic()
+        loader._run({"default": df})
+        elapsed = time.monotonic() - start
+        sent = sum(sum(c.values()) for c in loader.counts.values())
+        print(
+            f"{mode}: {sent} entities in {elapsed:.2f}s"
+            f" ({sent / elapsed:.0f} entities/s)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--load_workers", type=int, default=None)
+    parser.add_argument("--async_concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    from kf_lib_data_ingest.config import (
+        DEFAULT_ASYNC_LOAD_CONCURRENCY,
+        DEFAULT_LOAD_WORKERS,
+    )
+
+    run_benchmark(
+        args.records,
+        args.latency,
+        args.load_workers or DEFAULT_LOAD_WORKERS,
+        args.async_concurrency or DEFAULT_ASYNC_LOAD_CONCURRENCY,
+    )
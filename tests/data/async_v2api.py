@@ -0,0 +1,53 @@
+"""
+Minimal LOADER_VERSION 2 target API plugin whose entity classes load with
+coroutines. Every submit is recorded in `submitted`.
+"""
+import asyncio
+import threading
+
+LOADER_VERSION = 2
+
+submitted = []
+
+
+class Parent:
+    class_name = "parent"
+    target_id_concept = "PARENT|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def submit(cls, host, body):
+        raise NotImplementedError()
+
+    @classmethod
+    async def async_query_target_ids(cls, host, key_components, session):
+        await asyncio.sleep(0)
+        return []
+
+    @classmethod
+    async def async_submit(cls, host, body, session):
+        await asyncio.sleep(0.01)
+        submitted.append((cls.class_name, body, threading.current_thread()))
+        return f"{cls.class_name}_{body['id']}"
+
+
+class Child(Parent):
+    class_name = "child"
+    target_id_concept = "CHILD|TARGET_SERVICE_ID"
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            "id": record["id"],
+            "parent_id": get_target_id_from_record(Parent, record),
+        }
+
+
+all_targets = [Parent, Child]
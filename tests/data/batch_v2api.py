@@ -0,0 +1,40 @@
+"""
+Minimal LOADER_VERSION 2 target API plugin that submits entities in batches.
+The size of every batch is recorded in `batch_sizes`, and entities whose id
+is in `rejected_ids` fail.
+"""
+
+LOADER_VERSION = 2
+
+batch_sizes = []
+rejected_ids = set()
+
+
+class Thing:
+    class_name = "thing"
+    target_id_concept = "THING|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def submit(cls, host, body):
+        raise NotImplementedError()
+
+    @classmethod
+    def submit_batch(cls, host, bodies):
+        batch_sizes.append(len(bodies))
+        return [
+            ValueError(f"Rejected {b['id']}")
+            if b["id"] in rejected_ids
+            else f"TH_{b['id']}"
+            for b in bodies
+        ]
+
+
+all_targets = [Thing]
@@ -0,0 +1,79 @@
+"""
+Minimal LOADER_VERSION 2 target API plugin for testing load scheduling.
+
+Parent must load before Child and Sibling, and Child must load before
+Grandchild. Every submit is recorded in `events`.
+"""
+import threading
+import time
+
+LOADER_VERSION = 2
+
+events = []
+events_lock = threading.Lock()
+child_started = threading.Event()
+sibling_started = threading.Event()
+
+
+def _submit(cls, body):
+    with events_lock:
+        events.append(("start", cls.class_name))
+    if cls.class_name == "child":
+        child_started.set()
+        # Child can only finish once Sibling has started loading too
+        assert sibling_started.wait(timeout=10)
+    elif cls.class_name == "sibling":
+        sibling_started.set()
+    time.sleep(0.01)
+    with events_lock:
+        events.append(("end", cls.class_name))
+    return f"{cls.class_name}_{body['id']}"
+
+
+class Parent:
+    class_name = "parent"
+    target_id_concept = "PARENT|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def submit(cls, host, body):
+        return _submit(cls, body)
+
+
+class Child(Parent):
+    class_name = "child"
+    target_id_concept = "CHILD|TARGET_SERVICE_ID"
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            "id": record["id"],
+            "parent_id": get_target_id_from_record(Parent, record),
+        }
+
+
+class Sibling(Child):
+    class_name = "sibling"
+    target_id_concept = "SIBLING|TARGET_SERVICE_ID"
+
+
+class Grandchild(Parent):
+    class_name = "grandchild"
+    target_id_concept = "GRANDCHILD|TARGET_SERVICE_ID"
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            "id": record["id"],
+            "child_id": get_target_id_from_record(Child, record),
+        }
+
+
+all_targets = [Parent, Child, Sibling, Grandchild]
@@ -0,0 +1,42 @@
+"""
+Minimal LOADER_VERSION 2 target API plugin whose target IDs can be
+prefetched. The server has things 0-4 and two things with id 20. Every
+query_target_ids call is recorded in `queries`.
+"""
+
+LOADER_VERSION = 2
+
+server = [(i, f"TH_{i}") for i in range(5)] + [(20, "TH_20a"), (20, "TH_20b")]
+queries = []
+
+
+class Thing:
+    class_name = "thing"
+    target_id_concept = "THING|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        return {"id": record["id"]}
+
+    @classmethod
+    def query_target_ids(cls, host, key_components):
+        queries.append(key_components)
+        return [tic for i, tic in server if i == key_components["id"]]
+
+    @classmethod
+    def prefetch_target_ids(cls, host, project_id):
+        return (({"id": i}, tic) for i, tic in server)
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            "id": record["id"],
+            "kf_id": get_target_id_from_record(cls, record),
+        }
+
+    @classmethod
+    def submit(cls, host, body):
+        return body["kf_id"] or f"TH_{body['id']}"
+
+
+all_targets = [Thing]
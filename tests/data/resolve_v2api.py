@@ -0,0 +1,73 @@
+"""
+Minimal LOADER_VERSION 2 target API plugin where the child key includes the
+parent's target ID, and the pair key the target IDs of two parents. The class name of every key built is recorded in
+`key_builds`, and every submitted body in `submitted`.
+"""
+
+LOADER_VERSION = 2
+
+key_builds = []
+submitted = []
+
+
+def _submit(cls, body):
+    submitted.append(body)
+    return f"{cls.class_name}_{body['id']}"
+
+
+class Parent:
+    class_name = "parent"
+    target_id_concept = "PARENT|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        key_builds.append(cls.class_name)
+        return {"id": record["id"]}
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {"id": record["id"], "name": record.get("name")}
+
+    @classmethod
+    def submit(cls, host, body):
+        return _submit(cls, body)
+
+    @classmethod
+    async def async_submit(cls, host, body, session):
+        return _submit(cls, body)
+
+
+class Child(Parent):
+    class_name = "child"
+    target_id_concept = "CHILD|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        key_builds.append(cls.class_name)
+        return {
+            "parent_id": get_target_id_from_record(Parent, record),
+            "id": record["id"],
+        }
+
+    @classmethod
+    def build_entity(cls, record, get_target_id_from_record):
+        return {
+            **cls.get_key_components(record, get_target_id_from_record),
+            "parent": get_target_id_from_record(Parent, record),
+        }
+
+
+class Pair(Parent):
+    class_name = "pair"
+    target_id_concept = "PAIR|TARGET_SERVICE_ID"
+
+    @classmethod
+    def get_key_components(cls, record, get_target_id_from_record):
+        # parent records built on the fly, like relationship plugins do
+        return {
+            "first": get_target_id_from_record(Parent, {"id": record["a"]}),
+            "second": get_target_id_from_record(Parent, {"id": record["b"]}),
+        }
+
+
+all_targets = [Parent, Child, Pair]
@@ -115,6 +115,31 @@ def test_value_map():
         pandas.DataFrame({"OUT_COL": ["a", "a", "a"]})
     )
 
+    # mapper functions are called once per distinct value unless memoize=False
+    calls = []
+
+    def counting_mapper(x):
+        calls.append(x)
+        return x + "!"
+
+    repeated_df = pandas.DataFrame({"COL_A": ["1", "2", "1", "2", "1"]})
+    expected = pandas.DataFrame({"OUT_COL": ["1!", "2!", "1!", "2!", "1!"]})
+    func = operations.value_map(counting_mapper, "COL_A", "OUT_COL")
+    assert func(repeated_df).equals(expected)
+    assert calls == ["1", "2"]
+
+    calls.clear()
+    func = operations.value_map(
+        counting_mapper, "COL_A", "OUT_COL", memoize=False
+    )
+    assert func(repeated_df).equals(expected)
+    assert len(calls) == 5
+
+    # blank columns come out blank
+    func = operations.value_map({"a": "b"}, "COL_A", "OUT_COL")
+    out_df = func(pandas.DataFrame({"COL_A": [None, None]}))
+    assert out_df["OUT_COL"].tolist() == [None, None]
+
 
 def test_row_map():
     # tests passing allowed and disallowed types
@@ -210,6 +235,24 @@ def test_melt_map():
 
     assert out_df.equals(expected_output)
 
+    # columns by position, value mapping dicts, and the source index order
+    func = operations.melt_map(
+        "VAR_COL",
+        {4: "NEW_D", "COL_C": "NEW_C"},
+        "VAL_COL",
+        {"[12]": "low", "3": "high", "z": lambda x: x.upper()},
+    )
+    out_df = func(bigger_df.iloc[[2, 0, 1]])
+    assert out_df.index.tolist() == [2, 0, 1, 2, 0, 1]
+    assert out_df["VAR_COL"].tolist() == ["NEW_D"] * 3 + ["NEW_C"] * 3
+    assert out_df["VAL_COL"].tolist() == ["low", "high", "low", "x", "Z", "y"]
+
+    # blank columns come out blank
+    func = operations.melt_map("VAR_COL", {"COL_A": "a"}, "VAL_COL", {"1": "x"})
+    out_df = func(pandas.DataFrame({"COL_A": [None]}))
+    assert out_df["VAR_COL"].tolist() == ["a"]
+    assert out_df["VAL_COL"].tolist() == [None]
+
 
 def test_optional():
     # make sure that optional operations raise differently
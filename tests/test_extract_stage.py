@@ -1,4 +1,6 @@
 import os
+import shutil
+from unittest import mock
 
 import pandas
 import pytest
@@ -10,7 +12,11 @@ from kf_lib_data_ingest.etl.configuration.base_config import (
 )
 from kf_lib_data_ingest.etl.configuration.extract_config import ExtractConfig
 from kf_lib_data_ingest.etl.extract.extract import ExtractStage
-from kf_lib_data_ingest.etl.extract.operations import column_map
+from kf_lib_data_ingest.etl.extract.operations import (
+    column_map,
+    df_map,
+    melt_map,
+)
 from kf_lib_data_ingest.etl.extract.utils import Extractor
 from numpy import NaN
 
@@ -232,3 +238,115 @@ def test_operation_skipping():
         column_map(in_col="B", out_col="NAME", m=lambda x: x),
     ]
     es.extractor._chain_operations(df, op)
+
+
+def test_operation_length_equalization():
+    es = ExtractStage("", "")
+    df = pandas.DataFrame({"A": [1, 2], "B": [3, 4], "C": [5, 6]})
+
+    # shorter columns get repeated to fill the melted columns
+    op = [
+        column_map(in_col="A", out_col="A", m=lambda x: x),
+        [melt_map("DESCRIPTION", {"B": "B", "C": "C"}, "VALUE", lambda x: x)],
+    ]
+    df_out, _ = es.extractor._chain_operations(df, op)
+    assert df_out.index.tolist() == [0, 1, 0, 1]
+    assert df_out.values.tolist() == [
+        [1, "B", 3],
+        [2, "B", 4],
+        [1, "C", 5],
+        [2, "C", 6],
+    ]
+
+    # repeated columns must line up with the output index
+    op = [
+        column_map(in_col="A", out_col="A", m=lambda x: x),
+        df_map(lambda x: pandas.DataFrame({"Z": [7, 8]}, index=[1, 0])),
+    ]
+    with pytest.raises(Exception) as e:
+        es.extractor._chain_operations(df, op)
+    assert "Inconsistent column indices" in str(e.value)
+
+
+def test_parallel_extract():
+    """
+    Extracting with worker processes gives the same output, in the same order,
+    as extracting sequentially
+    """
+    config_dir = os.path.join(study_1, study_subdirs[study_1]["config"])
+    serial_out = ExtractStage("", config_dir).run()
+    parallel_es = ExtractStage("", config_dir, extract_workers=2)
+    parallel_out = parallel_es.run()
+
+    assert list(parallel_out.keys()) == list(serial_out.keys())
+    for config, df in serial_out.items():
+        pandas.testing.assert_frame_equal(df, parallel_out[config])
+
+    with pytest.raises(ValueError):
+        ExtractStage("", config_dir, extract_workers=0)
+
+
+def test_incremental_extract(tmp_path):
+    """
+    Incremental extraction only runs the extract configs whose config file or
+    source data changed since the last run
+    """
+    study = os.path.join(TEST_DATA_DIR, "simple_study")
+    config_dir = str(tmp_path / "extract_configs")
+    shutil.copytree(os.path.join(study, "data"), str(tmp_path / "data"))
+    os.makedirs(config_dir)
+    for name in ["a.py", "b.py"]:
+        shutil.copy(
+            os.path.join(study, "extract_configs", "extract_config.py"),
+            os.path.join(config_dir, name),
+        )
+
+    def run():
+        es = ExtractStage(
+            str(tmp_path / "output"), config_dir, incremental=True
+        )
+        with mock.patch.object(
+            ExtractStage,
+            "_extract_config",
+            autospec=True,
+            side_effect=ExtractStage._extract_config,
+        ) as extract:
+            output = es.run()
+        extracted = sorted(
+            os.path.basename(c.args[1].config_filepath)
+            for c in extract.call_args_list
+        )
+        return output, extracted
+
+    first, extracted = run()
+    assert extracted == ["a.py", "b.py"]
+
+    second, extracted = run()
+    assert extracted == []
+    assert list(second.keys()) == list(first.keys())
+    for config, df in first.items():
+        pandas.testing.assert_frame_equal(df, second[config])
+
+    with open(os.path.join(config_dir, "b.py"), "a") as f:
+        f.write("\n# edited\n")
+    _, extracted = run()
+    assert extracted == ["b.py"]
+
+    with open(str(tmp_path / "data" / "clinical.tsv"), "a") as f:
+        f.write("\n")
+    _, extracted = run()
+    assert extracted == ["a.py", "b.py"]
+
+
+def test_extract_skips_fingerprint_unless_incremental(tmp_path):
+    """
+    Source data is only hashed when extracting incrementally
+    """
+    es = ExtractStage(
+        str(tmp_path / "output"),
+        os.path.join(TEST_DATA_DIR, "simple_study", "extract_configs"),
+    )
+    with mock.patch.object(ExtractStage, "_fingerprint") as fingerprint:
+        es.run()
+    fingerprint.assert_not_called()
+    assert [f for f, _ in es.fingerprints.values()] == [None]
@@ -3,6 +3,8 @@ import gc
 import importlib
 import logging
 import os
+import threading
+from unittest import mock
 from urllib.parse import quote, urlencode, urljoin
 
 import boto3
@@ -17,7 +19,12 @@ from conftest import (
     TEST_CLIENT_SECRET,
     TEST_DATA_DIR,
 )
-from kf_lib_data_ingest.common.file_retriever import FileRetriever
+from kf_lib_data_ingest.common import file_retriever
+from kf_lib_data_ingest.common.download_cache import DownloadCache
+from kf_lib_data_ingest.common.file_retriever import (
+    FileRetriever,
+    _file_save,
+)
 from mocks import OAuth2Mocker
 
 TEST_S3_BUCKET = "s3_bucket"
@@ -141,6 +148,26 @@ def test_s3_file(
     )
 
 
+def test_s3_client_reuse(s3_file):
+    """
+    Test that S3 clients are shared across downloads and that the profile
+    that worked for a bucket is remembered
+    """
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "foobar_key")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "foobar_secret")
+    FileRetriever().get(s3_file)
+    profile = file_retriever._s3_bucket_profiles[TEST_S3_BUCKET]
+    client = file_retriever._s3_clients[profile]
+
+    with mock.patch.object(file_retriever.boto3.session, "Session") as session:
+        FileRetriever().get(s3_file)
+        session.assert_not_called()
+    assert file_retriever._s3_clients[profile] is client
+    assert file_retriever._s3_profiles_to_try(TEST_S3_BUCKET, None)[0] == (
+        profile
+    )
+
+
 @pytest.mark.parametrize(
     "use_storage_dir,cleanup_at_exit,should_file_exist", TEST_PARAMS
 )
@@ -433,3 +460,87 @@ def test_data_available_after_file_cleanup():
     assert not os.path.exists(fo.name)
     fo.seek(0)
     assert fo.read() == data
+
+
+def test_prefetch():
+    """
+    Test that prefetched files are fetched once and then served by get
+    """
+    url = "file://" + TEST_FILE_PATH
+    calls = []
+
+    def counting_file_save(*args, **kwargs):
+        calls.append(args[1])
+        return _file_save(*args, **kwargs)
+
+    with mock.patch.dict(FileRetriever._getters, {"file": counting_file_save}):
+        fr = FileRetriever(prefetch_workers=2)
+        fr.prefetch([url, url, "badprotocol://test"])
+        with open(TEST_FILE_PATH, "rb") as tf:
+            assert fr.get(url).read() == tf.read()
+        assert fr.get(url).original_name == TEST_FILENAME
+
+        # unhandled protocols are still reported by get
+        with pytest.raises(LookupError):
+            fr.get("badprotocol://test")
+
+    assert calls == [TEST_FILE_PATH]
+
+
+def test_prefetch_stopped_on_error():
+    """
+    Test that a failed get waits for running prefetches and cancels queued
+    ones before removing the temp directory that they write into
+    """
+    url = "file://" + TEST_FILE_PATH
+    started = threading.Event()
+    release = threading.Event()
+    finished = []
+
+    def slow_file_save(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        _file_save(*args, **kwargs)
+        finished.append(args[1])
+
+    with mock.patch.dict(FileRetriever._getters, {"file": slow_file_save}):
+        fr = FileRetriever(prefetch_workers=1)
+        fr.prefetch([url, "file://" + TEST_FILE_PATH + ".queued"])
+        started.wait(5)
+        threading.Timer(0.2, release.set).start()
+        with pytest.raises(LookupError):
+            fr.get("badprotocol://test")
+
+    assert finished == [TEST_FILE_PATH]
+    assert not fr._pending
+    assert not os.path.exists(fr.storage_dir)
+
+
+@requests_mock.Mocker(kw="mock")
+def test_download_cache(tmpdir, **kwargs):
+    """
+    Test that unchanged web files are served from the download cache
+    """
+    mock = kwargs["mock"]
+    url = f"http://localhost:1234/{TEST_FILENAME}"
+    with open(TEST_FILE_PATH, "rb") as tf:
+        data = tf.read()
+    cache = DownloadCache(str(tmpdir), max_size=len(data))
+
+    # First fetch downloads and caches the file
+    mock.get(url, content=data, headers={"ETag": '"v1"'})
+    assert FileRetriever(download_cache=cache).get(url).read() == data
+    assert cache.lookup(url)["validators"] == {"ETag": '"v1"'}
+
+    # Second fetch is conditional and uses the cached copy
+    mock.get(url, status_code=304, request_headers={"If-None-Match": '"v1"'})
+    local_copy = FileRetriever(download_cache=cache).get(url)
+    assert local_copy.read() == data
+    assert local_copy.original_name == TEST_FILENAME
+
+    # Caching a second file evicts the least recently used one
+    other_url = f"http://localhost:1234/other_{TEST_FILENAME}"
+    mock.get(other_url, content=data[::-1], headers={"ETag": '"v2"'})
+    FileRetriever(download_cache=cache).get(other_url)
+    assert cache.lookup(url) is None
+    assert cache.lookup(other_url)
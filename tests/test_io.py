@@ -4,9 +4,12 @@ import os
 import pandas
 import pytest
 from kf_lib_data_ingest.common.io import (
+    open_json_lines,
     read_delimited_text_df,
     read_df,
     read_excel_df,
+    read_json_lines,
+    write_df,
 )
 
 from conftest import TEST_DATA_DIR
@@ -75,3 +78,24 @@ def test_read_byte_order_mark(tmp_path, content):
     _file_reader_test(
         d, read_df, pandas.DataFrame({"A": [1], "B": [2]}, dtype=str)
     )
+
+
+@pytest.mark.parametrize("name", ["foo.jsonl", "foo.jsonl.gz"])
+def test_read_json_lines(tmp_path, name):
+    path = str(tmp_path / name)
+    with open_json_lines(path, "w") as jl:
+        jl.write('{"a": 1}\n[2]\n{"interrupted": ')
+    assert list(read_json_lines(path)) == [{"a": 1}, [2]]
+
+
+@pytest.mark.parametrize("ext", [".parquet", ".feather"])
+def test_write_columnar_df(tmp_path, ext):
+    path = str(tmp_path / ("foo" + ext))
+    df = pandas.DataFrame(
+        {"A": ["1", None, "3"], "B": [None, None, None]}, index=[5, 5, 7]
+    )
+    write_df(df, path, index=True)
+    assert read_df(path).equals(df)
+
+    write_df(df, path)
+    assert read_df(path).equals(df.reset_index(drop=True))
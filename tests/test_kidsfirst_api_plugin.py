@@ -1,10 +1,17 @@
 import json
 from os.path import join
+from unittest import mock
 
+import requests_mock
 from click.testing import CliRunner
 from kf_lib_data_ingest.app import cli
+from kf_lib_data_ingest.common.io import read_json_lines
+from kf_lib_data_ingest.common.constants import COMMON
+from kf_lib_data_ingest.target_api_plugins import kids_first_dataservice
 from kf_lib_data_ingest.target_api_plugins.kids_first_dataservice import (
     DELIMITER,
+    Participant,
+    TypeCoercer,
 )
 
 from conftest import TEST_DATA_DIR, delete_dir
@@ -19,10 +26,11 @@ def test_external_id_whole_ingest():
     output_dir = join(study_dir, "output")
     delete_dir(output_dir)
     runner.invoke(cli.test, study_dir)
-    with open(
-        join(output_dir, "LoadStage", "SentMessages_localhost_5000.json")
-    ) as sm:
-        data = json.load(sm)
+    data = list(
+        read_json_lines(
+            join(output_dir, "LoadStage", "SentMessages_localhost_5000.jsonl")
+        )
+    )
     gfs = [e for e in data if e["type"] == "genomic_file"]
     bsgfs = [e for e in data if e["type"] == "biospecimen_genomic_file"]
     assert gfs[0]["body"]["external_id"] == "blah1"
@@ -30,3 +38,72 @@ def test_external_id_whole_ingest():
     assert bsgfs[0]["body"]["external_id"] is None
     assert bsgfs[1]["body"]["external_id"] == f"BS1{DELIMITER}blah2"
     delete_dir(output_dir)
+
+
+def test_type_coercer():
+    # Bodies are cast to the swagger schema types, and empty values are
+    # replaced or left out depending on the field
+    coercer = TypeCoercer(
+        Participant,
+        {
+            "kf_id": {"type": "string"},
+            "external_id": {"type": "string"},
+            "affected_status": {"type": "boolean", "x-nullable": True},
+            "is_proband": {"type": "boolean"},
+            "age": {"type": "integer", "format": "int32"},
+            "created_at": {"type": "string", "readOnly": True},
+        },
+    )
+    bodies = [
+        {
+            "kf_id": None,
+            "external_id": 5,
+            "affected_status": "",
+            "is_proband": None,
+            "age": "12",
+            "created_at": "yesterday",
+            "unknown": 1,
+        },
+        {"external_id": "", "is_proband": True, "age": 2**40},
+    ]
+    expected = [
+        {"kf_id": None, "external_id": "5", "affected_status": None, "age": 12},
+        {
+            "external_id": COMMON.NOT_REPORTED,
+            "is_proband": True,
+            "age": 2**40,
+        },
+    ]
+    assert [coercer.coerce(b) for b in bodies] == expected
+
+
+def test_submit_keeps_body_field_order():
+    # Bodies are sent with their fields in the order that the plugin built
+    # them, not the order of the swagger schema
+    coercer = TypeCoercer(
+        Participant,
+        {
+            "kf_id": {"type": "string"},
+            "external_id": {"type": "string"},
+            "is_proband": {"type": "boolean"},
+            "age": {"type": "integer", "format": "int32"},
+        },
+    )
+    body = {"age": "3", "is_proband": True, "kf_id": None, "external_id": "a"}
+    assert list(coercer.coerce(body)) == list(body)
+
+    with mock.patch.dict(
+        kids_first_dataservice.type_coercers, {"participant": coercer}
+    ), requests_mock.Mocker() as m:
+        m.post(
+            "http://dataservice/participants",
+            json={"results": {"kf_id": "PT_00000001"}},
+            status_code=201,
+        )
+        kf_id = kids_first_dataservice.submit(
+            "http://dataservice", Participant, body
+        )
+    assert kf_id == "PT_00000001"
+    sent = json.loads(m.last_request.body)
+    assert list(sent) == ["age", "is_proband", "external_id"]
+    assert sent == {"age": 3, "is_proband": True, "external_id": "a"}
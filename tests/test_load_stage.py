@@ -1,16 +1,30 @@
 import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
 import pytest
 from click.testing import CliRunner
 from pandas import DataFrame
 
-from conftest import KIDS_FIRST_CONFIG, TEST_INGEST_CONFIG
+from conftest import KIDS_FIRST_CONFIG, TEST_DATA_DIR, TEST_INGEST_CONFIG
 from kf_lib_data_ingest.app import cli
-from kf_lib_data_ingest.common.errors import InvalidIngestStageParameters
+from kf_lib_data_ingest.common.errors import (
+    InvalidIngestStageParameters,
+    SubmitBatchError,
+)
+from kf_lib_data_ingest.common.io import read_json_lines
 from kf_lib_data_ingest.etl.configuration.base_config import (
     ConfigValidationError,
 )
+from kf_lib_data_ingest.etl.load import load_base
+from kf_lib_data_ingest.etl.load.load_base import find_target_dependencies
 from kf_lib_data_ingest.etl.load.load_shim import LoadStage
+from kf_lib_data_ingest.network.throttle import get_rate_limiter
+
+DEPENDENT_CONFIG = os.path.join(TEST_DATA_DIR, "dependent_v2api.py")
 
 
 @pytest.fixture(scope="function")
@@ -171,3 +185,524 @@ def test_bad_ret_vals_transform_funct(ret_val, error, load_stage):
             load_stage._validate_run_parameters(ret_val)
     else:
         load_stage._validate_run_parameters(ret_val)
+
+
+def test_find_target_dependencies(load_stage):
+    targets = {c.__name__: c for c in load_stage.target_api_config.all_targets}
+    deps = find_target_dependencies(load_stage.target_api_config.all_targets)
+    names = {
+        c.__name__: sorted(d.__name__ for d in ds) for c, ds in deps.items()
+    }
+    assert names["Investigator"] == []
+    assert names["Study"] == ["Investigator"]
+    assert names["Participant"] == ["Family", "Study"]
+    assert names["Diagnosis"] == ["Participant"]
+    assert names["Phenotype"] == ["Participant"]
+    assert names["BiospecimenDiagnosis"] == ["Biospecimen", "Diagnosis"]
+    for c, ds in deps.items():
+        assert c not in ds
+        assert all(targets[d.__name__] is d for d in ds)
+
+
+def test_load_dependency_scheduling(tmpdir):
+    """
+    With use_async, entity classes that don't depend on each other load at
+    the same time, and each class waits for the ones it depends on
+    """
+    entities = ["parent", "child", "sibling", "grandchild"]
+    loader = LoadStage(
+        DEPENDENT_CONFIG,
+        "http://URL_A",
+        entities,
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=True,
+    )
+    loader._run({"default": DataFrame({"id": [1, 2, 3]})})
+
+    events = loader.target_api_config.events
+    assert len(events) == 2 * 3 * len(entities)
+    assert loader.counts["grandchild"]["CREATE"] == 3
+
+    def first(kind, name):
+        return events.index((kind, name))
+
+    def last(kind, name):
+        return len(events) - 1 - events[::-1].index((kind, name))
+
+    # Child and Sibling wait for Parent, Grandchild waits for Child
+    assert last("end", "parent") < first("start", "child")
+    assert last("end", "parent") < first("start", "sibling")
+    assert last("end", "child") < first("start", "grandchild")
+    # Child and Sibling overlap (Child blocks until Sibling has started)
+    assert first("start", "sibling") < last("end", "child")
+
+
+def test_load_transitive_dependencies(tmpdir):
+    """
+    A class waits for the classes that it depends on through classes that
+    aren't being loaded
+    """
+    loader = LoadStage(
+        DEPENDENT_CONFIG,
+        "http://URL_A",
+        ["parent", "grandchild"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=True,
+    )
+    classes = {c.class_name: c for c in loader.target_api_config.all_targets}
+    dependencies = loader._load_dependencies(
+        [classes["parent"], classes["grandchild"]]
+    )
+    assert dependencies[classes["grandchild"]] == {classes["parent"]}
+    assert dependencies[classes["parent"]] == set()
+
+
+def test_load_workers_fail_fast(tmpdir):
+    """
+    With use_async, only a window of records is queued for the load_workers
+    threads, and the first error stops the load
+    """
+    with pytest.raises(ValueError):
+        LoadStage(
+            DEPENDENT_CONFIG,
+            "http://URL_A",
+            ["parent"],
+            "FAKE_STUDY_A",
+            cache_dir=tmpdir,
+            load_workers=0,
+        )
+
+    loader = LoadStage(
+        DEPENDENT_CONFIG,
+        "http://URL_A",
+        ["parent"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=True,
+        load_workers=1,
+    )
+    calls = []
+
+    def fail(entity_class, record):
+        calls.append(record)
+        raise RuntimeError("boom")
+
+    loader._load_entity = fail
+    with pytest.raises(RuntimeError):
+        loader._run({"default": DataFrame({"id": range(100)})})
+    assert 1 <= len(calls) <= loader.load_workers * 4
+
+
+@pytest.mark.parametrize("plugin", ["async_v2api.py", "batch_v2api.py"])
+def test_load_adaptive_concurrency(tmpdir, plugin):
+    """
+    Submissions take turns with the rate limiter, which is only active
+    while loading
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, plugin),
+        "http://URL_A",
+        ["thing"] if plugin == "batch_v2api.py" else ["parent", "child"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=True,
+        async_concurrency=4,
+        adaptive_concurrency=True,
+    )
+    if plugin == "batch_v2api.py":
+        loader.target_api_config.rejected_ids.clear()
+    loader._run({"default": DataFrame({"id": range(20)})})
+    assert sum(sum(c.values()) for c in loader.counts.values()) in {20, 40}
+    assert loader.rate_limiter.limit == loader.rate_limiter.max_limit
+    assert get_rate_limiter() is None
+
+
+def test_load_asyncio(tmpdir):
+    """
+    With use_async, plugins whose entity classes define async_submit load
+    with coroutines on the calling thread, still respecting dependencies
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "async_v2api.py"),
+        "http://URL_A",
+        ["parent", "child"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=True,
+        async_concurrency=4,
+    )
+    loader._run({"default": DataFrame({"id": range(20)})})
+
+    submitted = loader.target_api_config.submitted
+    assert loader.counts["parent"]["CREATE"] == 20
+    assert loader.counts["child"]["CREATE"] == 20
+    assert {t for _, _, t in submitted} == {threading.current_thread()}
+    # Every parent is loaded before the first child
+    names = [name for name, _, _ in submitted]
+    assert names == ["parent"] * 20 + ["child"] * 20
+    assert {b["parent_id"] for _, b, _ in submitted[20:]} == {
+        f"parent_{i}" for i in range(20)
+    }
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_load_batches(tmpdir, use_async):
+    """
+    Plugins with submit_batch get records in batches, and entities that the
+    target service accepts are cached even if others in the batch fail
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "batch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=use_async,
+        submit_batch_size=10,
+    )
+    plugin = loader.target_api_config
+    plugin.batch_sizes.clear()
+    plugin.rejected_ids.clear()
+    loader._run({"default": DataFrame({"id": range(25)})})
+    assert sorted(plugin.batch_sizes) == [5, 10, 10]
+    assert loader.counts["thing"]["CREATE"] == 25
+    assert loader._get_target_id_from_key("thing", str({"id": 7})) == "TH_7"
+
+    plugin.rejected_ids.add(33)
+    with pytest.raises(SubmitBatchError) as e:
+        loader._run({"default": DataFrame({"id": range(30, 35)})})
+    assert [body for body, _ in e.value.failures] == [{"id": 33}]
+    assert loader.counts["thing"]["CREATE"] == 4
+    assert loader._get_target_id_from_key("thing", str({"id": 34})) == "TH_34"
+
+
+def test_prefetch_target_ids(tmpdir):
+    """
+    Target IDs listed by prefetch_target_ids are cached before loading, and
+    only records with ambiguous keys are queried for individually
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "prefetch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+    )
+    plugin = loader.target_api_config
+    plugin.queries.clear()
+    loader._run({"default": DataFrame({"id": range(10)})})
+    assert plugin.queries == []
+    assert loader.counts["thing"] == {"CREATE": 5, "UPDATE": 5, "UNCHANGED": 0}
+    assert loader._get_target_id_from_key("thing", str({"id": 3})) == "TH_3"
+
+    with pytest.raises(Exception) as e:
+        loader._run({"default": DataFrame({"id": [20]})})
+    assert "Ambiguous query" in str(e.value)
+    assert plugin.queries == [{"id": 20}]
+
+
+def test_prefetch_target_ids_key_mismatch(tmpdir, caplog):
+    """
+    Records are queried for individually instead of being created when
+    prefetch_target_ids builds keys differently from get_key_components
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "prefetch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+    )
+    plugin = loader.target_api_config
+    plugin.queries.clear()
+    with mock.patch.object(
+        plugin.Thing,
+        "prefetch_target_ids",
+        lambda host, project_id: (
+            ({"id": str(i)}, tic) for i, tic in plugin.server
+        ),
+    ):
+        loader._run({"default": DataFrame({"id": range(10)})})
+    assert loader.counts["thing"] == {"CREATE": 5, "UPDATE": 5, "UNCHANGED": 0}
+    assert plugin.queries == [{"id": i} for i in range(10)]
+    assert "aren't built the same way" in caplog.text
+
+
+def test_resume_with_lost_uid_cache(tmpdir):
+    """
+    Resuming after the identifier cache lost its buffered entries asks the
+    server for the target IDs that are missing while walking to the resume
+    target
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "prefetch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        resume_from="TH_3",
+    )
+    loader._run({"default": DataFrame({"id": range(5)})})
+    assert loader.resume_from is None
+    assert not loader.dry_run
+    assert loader.counts["thing"]["UPDATE"] == 5
+    sent = [
+        m["body"]["id"] for m in read_json_lines(loader.sent_messages_filepath)
+    ]
+    assert sent == list(range(5))
+
+
+def test_uid_cache_periodic_flush(tmpdir):
+    """
+    Buffered identifier cache entries are written once they are old enough
+    even if nothing else is stored
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "prefetch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+    )
+    loader._store_target_id_for_key("thing", "a", "TH_a", False)
+    assert loader._unsaved_uid_count == 1
+
+    stop = threading.Event()
+    with mock.patch.object(load_base, "UID_CACHE_FLUSH_SECONDS", 0.01):
+        flusher = threading.Thread(
+            target=loader._flush_uid_cache_periodically, args=(stop,)
+        )
+        flusher.start()
+        for _ in range(500):
+            if not loader._unsaved_uid_count:
+                break
+            time.sleep(0.01)
+        stop.set()
+        flusher.join()
+    assert loader._unsaved_uid_count == 0
+    with sqlite3.connect(loader.uid_cache_filepath) as db:
+        assert db.execute('SELECT target_id FROM "thing";').fetchall() == [
+            ("TH_a",)
+        ]
+
+
+def test_uid_cache_write_buffer(tmpdir):
+    """
+    Identifier cache writes are buffered until flushed, and _run flushes
+    even when loading fails
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "batch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        uid_cache_synchronous="OFF",
+    )
+
+    def saved():
+        with sqlite3.connect(loader.uid_cache_filepath) as db:
+            return dict(
+                db.execute(
+                    'SELECT unique_id, target_id FROM "thing";'
+                ).fetchall()
+            )
+
+    loader._store_target_id_for_key("thing", "a", "TH_a", False)
+    assert loader._get_target_id_from_key("thing", "a") == "TH_a"
+    assert saved() == {}
+    loader._flush_uid_cache()
+    assert saved() == {"a": "TH_a"}
+
+    loader.target_api_config.rejected_ids.add(2)
+    with pytest.raises(SubmitBatchError):
+        loader._run({"default": DataFrame({"id": range(4)})})
+    assert saved() == {
+        "a": "TH_a",
+        **{str({"id": i}): f"TH_{i}" for i in [0, 1, 3]},
+    }
+
+    with pytest.raises(ValueError):
+        LoadStage(
+            KIDS_FIRST_CONFIG,
+            "http://URL_A",
+            [],
+            "FAKE_STUDY_A",
+            cache_dir=tmpdir,
+            uid_cache_synchronous="SOMETIMES",
+        )
+
+
+def test_uid_cache_threads(tmpdir):
+    """
+    Identifier cache tables can be read and written from many threads at once
+    """
+    loader = LoadStage(
+        KIDS_FIRST_CONFIG,
+        "http://URL_A",
+        [],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+    )
+    types = ["type_a", "type_b", "type_c"]
+
+    def store_and_get(n):
+        entity_type = types[n % len(types)]
+        for i in range(200):
+            key = f"{n}_{i}"
+            loader._store_target_id_for_key(entity_type, key, key, False)
+            assert loader._get_target_id_from_key(entity_type, key) == key
+
+    with ThreadPoolExecutor(max_workers=12) as ex:
+        # result() re-raises failed assertions from the threads
+        for f in [ex.submit(store_and_get, n) for n in range(12)]:
+            f.result()
+    loader._flush_uid_cache()
+
+    with sqlite3.connect(loader.uid_cache_filepath) as db:
+        for entity_type in types:
+            rows = db.execute(f'SELECT COUNT(*) FROM "{entity_type}";')
+            assert rows.fetchone()[0] == 200 * 4
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_record_resolution_memo(tmpdir, use_async):
+    """
+    Keys and target IDs are only resolved once per record, except for the
+    key components that the plugin builds directly in build_entity
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "resolve_v2api.py"),
+        "http://URL_A",
+        ["parent", "child"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        use_async=use_async,
+    )
+    plugin = loader.target_api_config
+    plugin.key_builds.clear()
+    plugin.submitted.clear()
+    loader._run({"default": DataFrame({"id": range(5)})})
+
+    assert loader.counts["child"]["CREATE"] == 5
+    assert plugin.key_builds.count("parent") == 10
+    assert plugin.key_builds.count("child") == 10
+    assert {"parent_id": "parent_3", "id": 3, "parent": "parent_3"} in (
+        plugin.submitted
+    )
+
+
+def test_record_resolution_temporary_records(tmpdir):
+    """
+    Parent records that a plugin builds on the fly aren't mistaken for each
+    other when one is freed and the next gets its id
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "resolve_v2api.py"),
+        "http://URL_A",
+        ["parent"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+    )
+    loader._run({"default": DataFrame({"id": [1, 2]})})
+    pair = next(
+        c for c in loader.target_api_config.all_targets if c.__name__ == "Pair"
+    )
+    with loader._resolving_record():
+        key = loader._do_target_get_key(pair, {"a": 1, "b": 2})
+    assert key == {"first": "parent_1", "second": "parent_2"}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_sent_messages_stream(tmpdir, compress):
+    """
+    Sent messages are written to a JSON Lines file as they're sent, so the
+    ones sent before a failure are kept
+    """
+    loader = LoadStage(
+        os.path.join(TEST_DATA_DIR, "batch_v2api.py"),
+        "http://URL_A",
+        ["thing"],
+        "FAKE_STUDY_A",
+        cache_dir=tmpdir,
+        submit_batch_size=2,
+        compress_sent_messages=compress,
+    )
+    assert loader.sent_messages_filepath.endswith(
+        ".jsonl.gz" if compress else ".jsonl"
+    )
+    plugin = loader.target_api_config
+    plugin.rejected_ids.clear()
+    plugin.rejected_ids.add(3)
+    with pytest.raises(SubmitBatchError):
+        loader._run({"default": DataFrame({"id": range(6)})})
+    assert list(read_json_lines(loader.sent_messages_filepath)) == [
+        {"type": "thing", "method": "CREATE", "body": {"id": i}}
+        for i in range(3)
+    ]
+
+
+def test_skip_unchanged(tmpdir):
+    """
+    Entities whose bodies haven't changed since they were last sent are
+    counted as UNCHANGED instead of being sent again, unless force_update
+    """
+    plugin_path = os.path.join(TEST_DATA_DIR, "resolve_v2api.py")
+    df = DataFrame({"id": range(4), "name": ["a", "b", "c", "d"]})
+
+    def load(**kwargs):
+        loader = LoadStage(
+            plugin_path,
+            "http://URL_A",
+            ["parent"],
+            "FAKE_STUDY_A",
+            cache_dir=tmpdir,
+            **kwargs,
+        )
+        plugin = loader.target_api_config
+        plugin.submitted.clear()
+        return loader, plugin
+
+    # An identifier cache from before body hashes were stored
+    loader, plugin = load()
+    loader.uid_cache_db.execute(
+        'CREATE TABLE "parent" (unique_id TEXT PRIMARY KEY, target_id TEXT);'
+    )
+    loader.uid_cache_db.execute(
+        'INSERT INTO "parent" VALUES (?, ?);', (str({"id": 0}), "parent_0")
+    )
+    loader._run({"default": df})
+    assert loader.counts["parent"] == {"CREATE": 3, "UPDATE": 1, "UNCHANGED": 0}
+
+    df.loc[1, "name"] = "B"
+    loader, plugin = load()
+    loader._run({"default": df})
+    assert loader.counts["parent"] == {"CREATE": 0, "UPDATE": 1, "UNCHANGED": 3}
+    assert plugin.submitted == [{"id": 1, "name": "B"}]
+
+    loader, plugin = load(force_update=True)
+    loader._run({"default": df})
+    assert loader.counts["parent"] == {"CREATE": 0, "UPDATE": 4, "UNCHANGED": 0}
+
+
+def test_skip_unchanged_with_target_id_in_body(tmpdir):
+    """
+    Entities whose bodies include their own target ID are UNCHANGED on the
+    run after they were created, even though the body sent to create them
+    had no target ID yet
+    """
+    for counts in [
+        {"CREATE": 4, "UPDATE": 0, "UNCHANGED": 0},
+        {"CREATE": 0, "UPDATE": 0, "UNCHANGED": 4},
+    ]:
+        loader = LoadStage(
+            os.path.join(TEST_DATA_DIR, "prefetch_v2api.py"),
+            "http://URL_A",
+            ["thing"],
+            "FAKE_STUDY_A",
+            cache_dir=tmpdir,
+        )
+        loader._run({"default": DataFrame({"id": range(10, 14)})})
+        assert loader.counts["thing"] == counts
@@ -3,6 +3,7 @@ import pandas
 
 from kf_lib_data_ingest.common.misc import (
     clean_up_df,
+    convert_to_downcasted_str,
     recover_containers_from_df_strings,
     map_hpo,
     map_icd10,
@@ -63,6 +64,44 @@ def test_convert_to_str():
                 assert df5[col][i] == df3[col][i]
 
 
+def test_clean_up_df_matches_applymap():
+    """
+    clean_up_df converts each distinct value once instead of every cell, but
+    the result must match converting every cell
+    """
+    df = pandas.DataFrame(
+        {
+            "str": ["1", " 01", "1.0", "", None, "1.0", "a"],
+            "float": [1.0, 2.5, numpy.nan, 1.0, 0.0, -0.0, 3.0],
+            "int": [1, 2, 3, 1, 0, 2, 3],
+            "bool": [True, False, True, True, False, False, True],
+            # True, 1, and 1.0 are equal but clean up differently
+            "mixed": [True, 1, 1.0, "1", [2, 1], {"a": 1.0}, numpy.nan],
+        },
+        index=[6, 5, 4, 3, 2, 1, 0],
+    )
+    df["dupe"] = df["str"]
+    df.columns = ["str", "float", "int", "bool", "mixed", "str"]
+
+    expected = df.applymap(
+        lambda x: convert_to_downcasted_str(x, replace_na=True, na=None)
+    ).drop_duplicates()
+    cleaned = clean_up_df(df)
+
+    assert cleaned.index.equals(expected.index)
+    assert cleaned.columns.equals(expected.columns)
+    assert cleaned.values.tolist() == expected.values.tolist()
+    assert cleaned["mixed"].tolist() == [
+        "True",
+        "1",
+        "1",
+        "1",
+        "['1', '2']",
+        "{'a': '1'}",
+        None,
+    ]
+
+
 def test_ontology_code_extraction():
     """
     Test the ontology code extraction functions in
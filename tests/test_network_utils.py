@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import pytest
+
+from urllib3.util.retry import Retry
+
+from kf_lib_data_ingest.network import throttle, utils
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"hello"
+        if self.path.startswith("/busy") and not self.server.was_busy:
+            # Overloaded the first time only
+            self.server.was_busy = True
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="function")
+def local_server():
+    server = HTTPServer(("localhost", 0), KeepAliveHandler)
+    server.was_busy = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_shared_session_reuses_connections(local_server):
+    """
+    Test that every caller gets the same session and that sequential requests
+    to one host reuse a single kept-alive connection
+    """
+    session = utils.configure_http_session(pool_size=2)
+    assert utils.get_http_session() is session
+    assert session.get_adapter(local_server)._pool_maxsize == 2
+
+    for _ in range(3):
+        assert session.get(local_server).text == "hello"
+
+    stats = utils.http_session_stats()
+    assert stats["requests"] == 3
+    assert stats["connections"] == 1
+
+    # Reconfiguring replaces the shared session
+    assert utils.configure_http_session() is not session
+
+
+def test_adaptive_limit():
+    """
+    The limit is cut when the server reports overload, at most once per
+    window, and grows by one after a window of healthy responses
+    """
+    limiter = throttle.AdaptiveConcurrencyLimiter(8)
+    limiter.observe("POST /things", 0.1, 503)
+    assert limiter.limit == 4
+    limiter.observe("POST /things", 0.1, 429)
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.observe("POST /things", 0.1, 201)
+    assert limiter.limit == 5
+    # Much slower responses count as overload too
+    limiter.observe("GET /things", 1.0, 200)
+    assert limiter.limit == 2
+    assert limiter.stats()["endpoints"]["POST /things"] == {
+        "requests": 6,
+        "overloaded": 2,
+        "mean_seconds": 0.1,
+    }
+
+
+def test_adaptive_slots():
+    """
+    Threads and coroutines wait for the limit and for Retry-After
+    """
+    limiter = throttle.AdaptiveConcurrencyLimiter(4)
+    limiter.observe("POST /things", 0.1, 503)
+    in_flight = []
+    most = []
+
+    def send():
+        with limiter.slot():
+            in_flight.append(1)
+            most.append(len(in_flight))
+            time.sleep(0.01)
+            in_flight.pop()
+
+    with ThreadPoolExecutor(8) as pool:
+        for f in [pool.submit(send) for _ in range(16)]:
+            f.result()
+    assert max(most) == 2
+
+    limiter.observe("POST /things", 0.1, 429, retry_after=0.2)
+    start = time.monotonic()
+
+    async def send_async():
+        async with limiter.async_slot():
+            pass
+
+    async def main():
+        await asyncio.gather(*(send_async() for _ in range(4)))
+
+    asyncio.run(main())
+    assert time.monotonic() - start >= 0.2
+
+
+def test_adaptive_slots_pause_ends_while_checking():
+    """
+    A pause that runs out between checking it and sleeping for it doesn't
+    make slots sleep for a negative time
+    """
+    limiter = throttle.AdaptiveConcurrencyLimiter(4)
+
+    async def send_async():
+        async with limiter.async_slot():
+            pass
+
+    with mock.patch.object(
+        limiter, "_pause_seconds", side_effect=[0.01, -0.01]
+    ):
+        with limiter.slot():
+            pass
+    with mock.patch.object(
+        limiter, "_pause_seconds", side_effect=[0.01, -0.01]
+    ):
+        asyncio.run(send_async())
+
+
+def test_parse_retry_after():
+    assert throttle.parse_retry_after("2") == 2
+    assert throttle.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert throttle.parse_retry_after("soon") is None
+    assert throttle.parse_retry_after(None) is None
+    assert throttle.parse_retry_after("1e9") == throttle.MAX_RETRY_AFTER_SECONDS
+
+
+def test_shared_session_reports_responses(local_server):
+    """
+    The shared HTTP session reports responses to the active limiter
+    """
+    limiter = throttle.AdaptiveConcurrencyLimiter(4)
+    throttle.set_rate_limiter(limiter)
+    try:
+        utils.configure_http_session().get(f"{local_server}/things/1")
+    finally:
+        throttle.set_rate_limiter(None)
+        # Close the kept-alive connection so that the server can shut down
+        utils.configure_http_session()
+    assert limiter.stats()["endpoints"]["GET /things"]["requests"] == 1
+
+
+def test_shared_session_reports_retried_responses(local_server):
+    """
+    Responses that the shared HTTP session retries are reported to the
+    active limiter too
+    """
+    limiter = throttle.AdaptiveConcurrencyLimiter(4)
+    throttle.set_rate_limiter(limiter)
+    try:
+        session = utils.configure_http_session(
+            retries=Retry(total=2, status_forcelist=[503], backoff_factor=0)
+        )
+        assert session.get(f"{local_server}/busy/1").status_code == 200
+    finally:
+        throttle.set_rate_limiter(None)
+        utils.configure_http_session()
+    assert limiter.stats()["endpoints"]["GET /busy"]["requests"] == 2
+    assert limiter.stats()["endpoints"]["GET /busy"]["overloaded"] == 1
+    assert limiter.limit == 2
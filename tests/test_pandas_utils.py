@@ -60,6 +60,62 @@ def test_safe_pandas_replace_no_cascade():
     ).equals(pandas.Series(["2", "3", "4"]))
 
 
+def test_safe_pandas_replace_regex_and_functions():
+    data = pandas.Series(
+        ["male", "female", "MONDO_123", "HP:5", "?", None, numpy.nan, 7]
+    )
+    out = pandas_utils.safe_pandas_replace(
+        data,
+        {
+            "male": "Male",  # must not match inside "female"
+            r"(fe)male": r"\1Male",
+            "MONDO_(.*)": lambda x: f"MONDO:{x.zfill(7)}",
+            r"HP:\d+": lambda x: x.lower(),
+            r"\?": None,
+        },
+        regex=True,
+    )
+    assert out.tolist()[:5] == [
+        "Male",
+        "feMale",
+        "MONDO:0000123",
+        "hp:5",
+        None,
+    ]
+    # unmatched cells keep their original values
+    assert out[5] is None
+    assert pandas.isnull(out[6])
+    assert out[7] == 7
+
+    # mappings that don't change a value leave it open for later mappings
+    assert pandas_utils.safe_pandas_replace(
+        pandas.Series(["A", "A", "B"]), {"A": "A", "^A$": "X"}, regex=True
+    ).tolist() == ["X", "X", "B"]
+
+
+def test_safe_pandas_replace_all_missing():
+    # blank columns have no distinct values to match
+    for data in [pandas.Series([numpy.nan]), pandas.Series([None, None])]:
+        out = pandas_utils.safe_pandas_replace(data, {"a": "b"})
+        assert out.isnull().all() and (len(out) == len(data))
+    out = pandas_utils.safe_pandas_replace(
+        pandas.DataFrame({"A": [None], "B": ["a"]}), {"a": "b"}
+    )
+    assert out["A"][0] is None
+    assert out["B"][0] == "b"
+
+
+def test_safe_pandas_replace_literal_replacements():
+    # without regex, replacement strings aren't templates
+    mapping = {"(a) (b)": r"\2 \1"}
+    assert pandas_utils.safe_pandas_replace(
+        pandas.Series(["x", "(a) (b)"]), mapping
+    ).tolist() == ["x", r"\2 \1"]
+    assert pandas_utils.safe_pandas_replace(
+        pandas.Series(["x", "a b"]), mapping, regex=True
+    ).tolist() == ["x", "b a"]
+
+
 def test_merge_wo_duplicates(info_caplog, dfs):
     df1 = dfs[0]
     df2 = dfs[0].copy()
@@ -206,3 +262,35 @@ def test_split_df_rows():
         )
         # now compare indices
         assert out.index.equals(expected.index)
+
+
+def test_split_df_rows_mixed_groups():
+    """
+    Rows without Splits pass through, and an ungrouped Split before a grouped
+    one still makes each combination only once
+    """
+    Split = pandas_utils.Split
+    df = pandas.DataFrame(
+        {
+            "a": ["x", Split(["1", "2"]), "y"],
+            "b": ["x", Split(["3", "4"], group=1), Split([])],
+            "c": ["x", Split(["5"], group=1), "y"],
+        },
+        index=[5, 7, 9],
+    )
+    out = pandas_utils.split_df_rows_on_splits(df)
+    assert out.index.tolist() == [5, 7, 7, 7, 7, 9]
+    assert out.values.tolist()[:5] == [
+        ["x", "x", "x"],
+        ["1", "3", "5"],
+        ["1", "4", None],
+        ["2", "3", "5"],
+        ["2", "4", None],
+    ]
+    # Nothing to expand in an empty Split, so it stays put
+    assert isinstance(out["b"].iloc[5], Split)
+
+    no_splits = pandas.DataFrame({"a": ["1", "2"], "b": ["3", None]})
+    out = pandas_utils.split_df_rows_on_splits(no_splits)
+    assert out.index.equals(no_splits.index)
+    assert out.values.tolist() == no_splits.values.tolist()
@@ -6,6 +6,9 @@ import pytest
 from kf_lib_data_ingest.common.concept_schema import CONCEPT
 from kf_lib_data_ingest.common.constants import RACE
 from kf_lib_data_ingest.common.errors import InvalidIngestStageParameters
+from kf_lib_data_ingest.etl.transform.guided import GuidedTransformStage
+
+from conftest import TEST_DATA_DIR
 
 
 @pytest.fixture(scope="function")
@@ -74,3 +77,36 @@ def test_read_write(guided_transform_stage, df):
             os.path.join(guided_transform_stage.stage_cache_dir, target_entity)
             + ".tsv"
         )
+
+
+def test_read_write_columnar(tmp_path, guided_transform_stage, df):
+    """
+    Test that a columnar stage cache round-trips None values and replaces a
+    cache written in another format
+    """
+    extract_output = {"extract_config_url": df.assign(extra=None)}
+    guided_transform_stage.run(extract_output)
+
+    stage = GuidedTransformStage(
+        os.path.join(
+            TEST_DATA_DIR, "simple_study", "transform_module_simple.py"
+        ),
+        ingest_output_dir=guided_transform_stage.ingest_output_dir,
+        stage_cache_format="parquet",
+    )
+    output = stage.run(extract_output)
+    recycled_output = stage.read_output()
+
+    assert recycled_output.keys() == output.keys()
+    for target_entity, data in output.items():
+        assert recycled_output[target_entity].equals(data)
+        path = os.path.join(stage.stage_cache_dir, target_entity)
+        assert os.path.isfile(path + ".parquet")
+        assert not os.path.exists(path + ".tsv")
+
+    with pytest.raises(ValueError):
+        GuidedTransformStage(
+            stage.transform_module.config_filepath,
+            ingest_output_dir=stage.ingest_output_dir,
+            stage_cache_format="xlsx",
+        )